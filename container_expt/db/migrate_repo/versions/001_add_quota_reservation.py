@@ -0,0 +1,35 @@
+from sqlalchemy import Boolean, Column, DateTime, Index, Integer, MetaData, \
+    String, Table, Text
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    reservation = Table(
+        'container_quota_reservation', meta,
+        Column('created_at', DateTime),
+        Column('updated_at', DateTime),
+        Column('deleted_at', DateTime),
+        Column('deleted', Boolean),
+        Column('id', Integer, primary_key=True, nullable=False),
+        Column('uuid', String(36), nullable=False, unique=True),
+        Column('expt_id', Integer),
+        Column('owner_id', String(64), nullable=False),
+        Column('resources', Text, nullable=False),
+        Column('state', String(16), nullable=False),
+        Column('expires_at', DateTime),
+        Column('claim', String(36)),
+        Index('container_quota_reservation_expt_id_idx', 'expt_id'),
+        Index('container_quota_reservation_state_idx', 'state'),
+        Index('container_quota_reservation_claim_idx', 'claim'),
+        mysql_engine='InnoDB',
+        mysql_charset='utf8'
+    )
+    reservation.create(checkfirst=True)
+
+
+def downgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+    Table('container_quota_reservation', meta, autoload=True).drop()
@@ -0,0 +1,31 @@
+from sqlalchemy import Boolean, Column, DateTime, Integer, MetaData, String, \
+    Table, Text
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    operation = Table(
+        'container_operation', meta,
+        Column('created_at', DateTime),
+        Column('updated_at', DateTime),
+        Column('deleted_at', DateTime),
+        Column('deleted', Boolean),
+        Column('id', String(36), primary_key=True, nullable=False),
+        Column('action', String(16), nullable=False),
+        Column('expt_id', Integer),
+        Column('phase', String(16), nullable=False),
+        Column('progress', Integer, nullable=False),
+        Column('result', Text),
+        Column('failure_info', String(256)),
+        mysql_engine='InnoDB',
+        mysql_charset='utf8'
+    )
+    operation.create(checkfirst=True)
+
+
+def downgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+    Table('container_operation', meta, autoload=True).drop()
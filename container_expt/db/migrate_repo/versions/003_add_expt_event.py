@@ -0,0 +1,31 @@
+from sqlalchemy import Boolean, Column, DateTime, Index, Integer, MetaData, \
+    String, Table
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    event = Table(
+        'container_expt_event', meta,
+        Column('created_at', DateTime),
+        Column('updated_at', DateTime),
+        Column('deleted_at', DateTime),
+        Column('deleted', Boolean),
+        Column('id', Integer, primary_key=True, nullable=False),
+        Column('expt_id', Integer, nullable=False),
+        Column('resource', String(16), nullable=False),
+        Column('resource_id', String(36)),
+        Column('event', String(16), nullable=False),
+        Column('message', String(256)),
+        Index('container_expt_event_expt_id_id_idx', 'expt_id', 'id'),
+        mysql_engine='InnoDB',
+        mysql_charset='utf8'
+    )
+    event.create(checkfirst=True)
+
+
+def downgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+    Table('container_expt_event', meta, autoload=True).drop()
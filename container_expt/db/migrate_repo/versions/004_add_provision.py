@@ -0,0 +1,53 @@
+from sqlalchemy import Boolean, Column, DateTime, Index, Integer, MetaData, \
+    String, Table, Text, UniqueConstraint
+from sqlalchemy.dialects.mysql import MEDIUMTEXT
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    provision = Table(
+        'container_provision', meta,
+        Column('created_at', DateTime),
+        Column('updated_at', DateTime),
+        Column('deleted_at', DateTime),
+        Column('deleted', Boolean),
+        Column('topo_id', Integer, primary_key=True, autoincrement=False,
+               nullable=False),
+        Column('expt_id', Integer, nullable=False),
+        Column('expt_name', String(255), nullable=False),
+        Column('plan', Text().with_variant(MEDIUMTEXT(), 'mysql'),
+               nullable=False),
+        Column('state', String(16), nullable=False),
+        Column('claim', String(36)),
+        Index('container_provision_state_idx', 'state'),
+        mysql_engine='InnoDB',
+        mysql_charset='utf8'
+    )
+
+    step = Table(
+        'container_provision_step', meta,
+        Column('created_at', DateTime),
+        Column('updated_at', DateTime),
+        Column('deleted_at', DateTime),
+        Column('deleted', Boolean),
+        Column('id', Integer, primary_key=True, nullable=False),
+        Column('topo_id', Integer, nullable=False),
+        Column('kind', String(16), nullable=False),
+        Column('obj_id', Integer, nullable=False),
+        UniqueConstraint('topo_id', 'kind', 'obj_id',
+                         name='uniq_container_provision_step'),
+        mysql_engine='InnoDB',
+        mysql_charset='utf8'
+    )
+
+    for table in (provision, step):
+        table.create(checkfirst=True)
+
+
+def downgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+    for name in ('container_provision_step', 'container_provision'):
+        Table(name, meta, autoload=True).drop()
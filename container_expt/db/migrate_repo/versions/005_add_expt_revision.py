@@ -0,0 +1,27 @@
+from sqlalchemy import BigInteger, Boolean, Column, DateTime, Integer, \
+    MetaData, Table
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    revision = Table(
+        'container_expt_revision', meta,
+        Column('created_at', DateTime),
+        Column('updated_at', DateTime),
+        Column('deleted_at', DateTime),
+        Column('deleted', Boolean),
+        Column('expt_id', Integer, primary_key=True, autoincrement=False,
+               nullable=False),
+        Column('revision', BigInteger, nullable=False),
+        mysql_engine='InnoDB',
+        mysql_charset='utf8'
+    )
+    revision.create(checkfirst=True)
+
+
+def downgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+    Table('container_expt_revision', meta, autoload=True).drop()
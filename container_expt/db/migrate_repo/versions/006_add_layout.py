@@ -0,0 +1,88 @@
+import json
+
+from sqlalchemy import Boolean, Column, DateTime, Float, Integer, MetaData, \
+    String, Table, select
+from terra.topology.backends.sql.models import CloudRouter, CloudSubnet
+from terra.vm.backends.sql.models import CloudVM
+
+BATCH_SIZE = 1000
+
+
+def _layout(kind, obj_id, other):
+    try:
+        other = json.loads(other or '{}')
+    except ValueError:
+        other = {}
+    coordinate = other.get('coordinate') or {}
+
+    def _float(value):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+
+    try:
+        vtype = int(other.get('vtype') or 0)
+    except (TypeError, ValueError):
+        vtype = 0
+    try:
+        device_type = int(other['type']) if 'type' in other else None
+    except (TypeError, ValueError):
+        device_type = None
+    return {'kind': kind,
+            'obj_id': obj_id,
+            'x': _float(coordinate.get('x')),
+            'y': _float(coordinate.get('y')),
+            'vtype': vtype,
+            'device_type': device_type,
+            'deleted': False}
+
+
+def _backfill(migrate_engine, layout, kind, table, id_column):
+    rows = migrate_engine.execute(
+        select([table.c[id_column], table.c.other]).
+        where(table.c.deleted == False))  # noqa
+    batch = []
+    for obj_id, other in rows:
+        batch.append(_layout(kind, obj_id, other))
+        if len(batch) >= BATCH_SIZE:
+            migrate_engine.execute(layout.insert(), batch)
+            batch = []
+    if batch:
+        migrate_engine.execute(layout.insert(), batch)
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    layout = Table(
+        'container_layout', meta,
+        Column('created_at', DateTime),
+        Column('updated_at', DateTime),
+        Column('deleted_at', DateTime),
+        Column('deleted', Boolean),
+        Column('kind', String(16), primary_key=True, nullable=False),
+        Column('obj_id', Integer, primary_key=True, autoincrement=False,
+               nullable=False),
+        Column('x', Float),
+        Column('y', Float),
+        Column('vtype', Integer, nullable=False),
+        Column('device_type', Integer),
+        mysql_engine='InnoDB',
+        mysql_charset='utf8'
+    )
+    layout.create(checkfirst=True)
+
+    # subnets are keyed by subnet id, vms and routers by device id
+    for kind, model, id_column in (('subnet', CloudSubnet, 'id'),
+                                   ('device', CloudVM, 'device_id'),
+                                   ('device', CloudRouter, 'device_id')):
+        table = Table(model.__tablename__, meta, autoload=True)
+        _backfill(migrate_engine, layout, kind, table, id_column)
+
+
+def downgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+    Table('container_layout', meta, autoload=True).drop()
@@ -0,0 +1,26 @@
+from sqlalchemy import Index, MetaData, Table
+from terra.experiment.backends.sql.models import BaseExpt
+
+# (created_at, id) last, so a listing seeks on them within the prefix
+INDEXES = (
+    ('container_expt_owner_created_idx',
+     ('owner_id', 'deleted', 'created_at', 'id')),
+    ('container_expt_created_idx',
+     ('deleted', 'created_at', 'id')),
+)
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+    expt = Table(BaseExpt.__tablename__, meta, autoload=True)
+    for name, columns in INDEXES:
+        Index(name, *[expt.c[column] for column in columns]).create()
+
+
+def downgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+    expt = Table(BaseExpt.__tablename__, meta, autoload=True)
+    for name, columns in INDEXES:
+        Index(name, *[expt.c[column] for column in columns]).drop()
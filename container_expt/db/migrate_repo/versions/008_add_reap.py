@@ -0,0 +1,34 @@
+from sqlalchemy import Boolean, Column, DateTime, Index, Integer, MetaData, \
+    String, Table
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    reap = Table(
+        'container_reap', meta,
+        Column('created_at', DateTime),
+        Column('updated_at', DateTime),
+        Column('deleted_at', DateTime),
+        Column('deleted', Boolean),
+        Column('expt_id', Integer, primary_key=True, autoincrement=False,
+               nullable=False),
+        Column('op_id', String(36)),
+        Column('state', String(16), nullable=False),
+        Column('attempts', Integer, nullable=False),
+        Column('next_attempt_at', DateTime, nullable=False),
+        Column('progress', Integer, nullable=False),
+        Column('claim', String(36)),
+        Column('last_error', String(255)),
+        Index('container_reap_state_idx', 'state', 'next_attempt_at'),
+        mysql_engine='InnoDB',
+        mysql_charset='utf8'
+    )
+    reap.create(checkfirst=True)
+
+
+def downgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+    Table('container_reap', meta, autoload=True).drop()
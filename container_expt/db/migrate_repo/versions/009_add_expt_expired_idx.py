@@ -0,0 +1,23 @@
+from sqlalchemy import Index, MetaData, Table
+from terra.experiment.backends.sql.models import BaseExpt
+
+# lets the expiry task range scan the experiments past their expired_at
+INDEXES = (
+    ('container_expt_expired_idx', ('deleted', 'expired_at')),
+)
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+    expt = Table(BaseExpt.__tablename__, meta, autoload=True)
+    for name, columns in INDEXES:
+        Index(name, *[expt.c[column] for column in columns]).create()
+
+
+def downgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+    expt = Table(BaseExpt.__tablename__, meta, autoload=True)
+    for name, columns in INDEXES:
+        Index(name, *[expt.c[column] for column in columns]).drop()
@@ -0,0 +1,19 @@
+from sqlalchemy import Column, MetaData, String, Table
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+    operation = Table('container_operation', meta, autoload=True)
+    operation.create_column(Column('owner_id', String(64)))
+    provision = Table('container_provision', meta, autoload=True)
+    provision.create_column(Column('op_id', String(36)))
+
+
+def downgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+    operation = Table('container_operation', meta, autoload=True)
+    operation.drop_column('owner_id')
+    provision = Table('container_provision', meta, autoload=True)
+    provision.drop_column('op_id')
@@ -0,0 +1,16 @@
+from sqlalchemy import Column, Integer, MetaData, Table
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+    provision = Table('container_provision', meta, autoload=True)
+    provision.create_column(Column('attempts', Integer, nullable=False,
+                                   server_default='0'))
+
+
+def downgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+    provision = Table('container_provision', meta, autoload=True)
+    provision.drop_column('attempts')
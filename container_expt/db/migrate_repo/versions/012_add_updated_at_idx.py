@@ -0,0 +1,25 @@
+from sqlalchemy import Index, MetaData, Table
+from terra.experiment.backends.sql.models import BaseExpt
+from terra.vm.backends.sql.models import CloudVM
+
+# lets the revision sweep range scan the rows changed since its last run
+INDEXES = (
+    (BaseExpt.__tablename__, 'container_expt_updated_idx', ('updated_at',)),
+    (CloudVM.__tablename__, 'container_vm_updated_idx', ('updated_at',)),
+)
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+    for table_name, name, columns in INDEXES:
+        table = Table(table_name, meta, autoload=True)
+        Index(name, *[table.c[column] for column in columns]).create()
+
+
+def downgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+    for table_name, name, columns in INDEXES:
+        table = Table(table_name, meta, autoload=True)
+        Index(name, *[table.c[column] for column in columns]).drop()
@@ -0,0 +1,26 @@
+from sqlalchemy import BigInteger, Boolean, Column, DateTime, MetaData, \
+    String, Table
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    stat = Table(
+        'container_expire_stat', meta,
+        Column('created_at', DateTime),
+        Column('updated_at', DateTime),
+        Column('deleted_at', DateTime),
+        Column('deleted', Boolean),
+        Column('name', String(32), primary_key=True, nullable=False),
+        Column('value', BigInteger, nullable=False),
+        mysql_engine='InnoDB',
+        mysql_charset='utf8'
+    )
+    stat.create(checkfirst=True)
+
+
+def downgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+    Table('container_expire_stat', meta, autoload=True).drop()
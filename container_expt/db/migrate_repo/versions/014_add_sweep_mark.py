@@ -0,0 +1,57 @@
+from sqlalchemy import Boolean, Column, DateTime, Index, MetaData, String, \
+    Table
+from terra.experiment.backends.sql.models import BaseExpt
+from terra.topology.backends.sql.models import CloudDevice, CloudNetwork, \
+    CloudPort, CloudRouter, CloudSubnet, CloudSubnetPort, CloudTopo
+from terra.vm.backends.sql.models import CloudVM
+
+# lets the revision sweep range scan every table the experiment detail
+# reads; 012 indexed updated_at of the experiment and vm tables
+INDEXES = (
+    (BaseExpt.__tablename__, 'container_expt_created_idx', ('created_at',)),
+    (CloudVM.__tablename__, 'container_vm_created_idx', ('created_at',)),
+)
+for _model, _name in ((CloudTopo, 'topo'),
+                      (CloudNetwork, 'network'),
+                      (CloudSubnet, 'subnet'),
+                      (CloudDevice, 'device'),
+                      (CloudRouter, 'router'),
+                      (CloudPort, 'port'),
+                      (CloudSubnetPort, 'subnet_port')):
+    INDEXES += (
+        (_model.__tablename__, 'container_%s_updated_idx' % _name,
+         ('updated_at',)),
+        (_model.__tablename__, 'container_%s_created_idx' % _name,
+         ('created_at',)),
+    )
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    mark = Table(
+        'container_sweep_mark', meta,
+        Column('created_at', DateTime),
+        Column('updated_at', DateTime),
+        Column('deleted_at', DateTime),
+        Column('deleted', Boolean),
+        Column('name', String(32), primary_key=True, nullable=False),
+        Column('swept_at', DateTime, nullable=False),
+        mysql_engine='InnoDB',
+        mysql_charset='utf8'
+    )
+    mark.create(checkfirst=True)
+
+    for table_name, name, columns in INDEXES:
+        table = Table(table_name, meta, autoload=True)
+        Index(name, *[table.c[column] for column in columns]).create()
+
+
+def downgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+    for table_name, name, columns in INDEXES:
+        table = Table(table_name, meta, autoload=True)
+        Index(name, *[table.c[column] for column in columns]).drop()
+    Table('container_sweep_mark', meta, autoload=True).drop()
@@ -8,4 +8,206 @@ _BACKEND_MAPPING = {'sqlalchemy': 'container_expt.service.backends.sql.api_sqlal
 
 IMPL = concurrency.TpoolDbapiWrapper(CONF, backend_mapping=_BACKEND_MAPPING)
 
-LOG = logging.getLogger(__name__)
\ No newline at end of file
+LOG = logging.getLogger(__name__)
+
+
+########################### experiment #########################
+def expt_list_page(filters, limit, after=None):
+    return IMPL.expt_list_page(filters, limit, after)
+
+
+def expt_get(expt_id):
+    return IMPL.expt_get(expt_id)
+
+
+def expt_get_many(expt_ids):
+    return IMPL.expt_get_many(expt_ids)
+
+
+def expt_device_states(expt_ids):
+    return IMPL.expt_device_states(expt_ids)
+
+
+def expt_states_get(expt_id):
+    return IMPL.expt_states_get(expt_id)
+
+
+########################### topology #########################
+def topo_bulk_create(expt_id, topo_values, build_rows):
+    return IMPL.topo_bulk_create(expt_id, topo_values, build_rows)
+
+
+def topos_mark_deleting(topo_ids, states):
+    return IMPL.topos_mark_deleting(topo_ids, states)
+
+
+def layouts_create(kind, layouts):
+    return IMPL.layouts_create(kind, layouts)
+
+
+def expt_topology_load(expt_id, layout=False):
+    return IMPL.expt_topology_load(expt_id, layout)
+
+
+def expt_topology_iter(expt_id, layout=False):
+    return IMPL.expt_topology_iter(expt_id, layout)
+
+
+########################### port #########################
+def ports_get_os_specs(port_ids):
+    return IMPL.ports_get_os_specs(port_ids)
+
+
+def os_ports_bulk_create(values):
+    return IMPL.os_ports_bulk_create(values)
+
+
+def os_ports_get(port_ids):
+    return IMPL.os_ports_get(port_ids)
+
+
+########################### quota #########################
+def quota_reservation_create(values):
+    return IMPL.quota_reservation_create(values)
+
+
+def quota_reservations_create(values):
+    return IMPL.quota_reservations_create(values)
+
+
+def quota_reservation_commit(uuid, expt_id):
+    return IMPL.quota_reservation_commit(uuid, expt_id)
+
+
+def quota_reservation_claim(uuid, token):
+    return IMPL.quota_reservation_claim(uuid, token)
+
+
+def quota_reservation_claim_expt(expt_id, token):
+    return IMPL.quota_reservation_claim_expt(expt_id, token)
+
+
+def quota_reservation_claim_stale(token, retry_before):
+    return IMPL.quota_reservation_claim_stale(token, retry_before)
+
+
+def quota_reservation_released(reservation_ids, token):
+    return IMPL.quota_reservation_released(reservation_ids, token)
+
+
+def quota_reservations_get_expt(expt_id):
+    return IMPL.quota_reservations_get_expt(expt_id)
+
+
+########################### operation #########################
+def operation_create(values):
+    return IMPL.operation_create(values)
+
+
+def operation_get(op_id):
+    return IMPL.operation_get(op_id)
+
+
+def operation_update(op_id, values):
+    return IMPL.operation_update(op_id, values)
+
+
+########################### event #########################
+def expt_events_create(expt_id, values, keep):
+    return IMPL.expt_events_create(expt_id, values, keep)
+
+
+def expt_events_get(expt_id, since, limit):
+    return IMPL.expt_events_get(expt_id, since, limit)
+
+
+########################### provision #########################
+def provision_create(values):
+    return IMPL.provision_create(values)
+
+
+def provision_update(topo_id, values):
+    return IMPL.provision_update(topo_id, values)
+
+
+def provision_touch(topo_id):
+    return IMPL.provision_touch(topo_id)
+
+
+def provision_finish(topo_id, state):
+    return IMPL.provision_finish(topo_id, state)
+
+
+def operation_finish_provisioned(op_id):
+    return IMPL.operation_finish_provisioned(op_id)
+
+
+def provision_steps_create(topo_id, steps):
+    return IMPL.provision_steps_create(topo_id, steps)
+
+
+def provision_steps_get(topo_id):
+    return IMPL.provision_steps_get(topo_id)
+
+
+def provision_claim_stale(token, stale_before):
+    return IMPL.provision_claim_stale(token, stale_before)
+
+
+########################### revision #########################
+def expt_revision_get(expt_id):
+    return IMPL.expt_revision_get(expt_id)
+
+
+def expt_revisions_bump(expt_ids):
+    return IMPL.expt_revisions_bump(expt_ids)
+
+
+def expt_revision_info(expt_id):
+    return IMPL.expt_revision_info(expt_id)
+
+
+def expt_revisions_info(expt_ids):
+    return IMPL.expt_revisions_info(expt_ids)
+
+
+def expt_ids_changed_since(since, expt_ids=None):
+    return IMPL.expt_ids_changed_since(since, expt_ids)
+
+
+def sweep_mark_get(name):
+    return IMPL.sweep_mark_get(name)
+
+
+def sweep_mark_set(name, swept_at):
+    return IMPL.sweep_mark_set(name, swept_at)
+
+
+########################### reap #########################
+def expt_ids_expired(now, limit):
+    return IMPL.expt_ids_expired(now, limit)
+
+
+def reap_enqueue(expt_id, op_id=None):
+    return IMPL.reap_enqueue(expt_id, op_id)
+
+
+def reap_record_failure(expt_id, error):
+    return IMPL.reap_record_failure(expt_id, error)
+
+
+def reap_claim(token, limit, stale_before):
+    return IMPL.reap_claim(token, limit, stale_before)
+
+
+def reap_update(expt_id, token, values):
+    return IMPL.reap_update(expt_id, token, values)
+
+
+########################### expiry #########################
+def expire_stats_add(counts):
+    return IMPL.expire_stats_add(counts)
+
+
+def expire_stats_get():
+    return IMPL.expire_stats_get()
@@ -1,6 +1,8 @@
 """ Sqlalchemy API for Experiment. """
 from terra.topology.business.cloudnetwork import CloudNetwork
 
+import collections
+import functools
 import json
 import sqlalchemy
 import sys
@@ -17,6 +19,8 @@ import sqlalchemy.sql as sa_sql
 from sqlalchemy import and_
 from sqlalchemy import or_
 from . import models
+from container_expt.service import readmode
+from container_expt.service.constants import OPERATION_PHASE_DIC
 from oslo_log import log as logging
 from terra import i18n
 
@@ -25,8 +29,9 @@ from terra.common.constants import EXPT_OPERATE_DIC, VM_TYPE_DIC
 from terra.experiment.backends.sql.models import BaseExpt, CloudExptTopo
 from terra.topology.backends.sql.models import CloudSubnet, CloudPort, \
     CloudSubnetPort, CloudDevice, CloudTopo, CloudRouter, CloudOSRouter, \
-    CloudNetwork, CloudOSNetwork, CloudOSSubnet
+    CloudNetwork, CloudOSNetwork, CloudOSSubnet, CloudOSPort
 from terra.vm.backends.sql.models import CloudVM, CloudOSVM
+from terra.vne_experiment.backends.sql.models import VneSubnet
 
 _ = i18n._
 _LI = i18n._LI
@@ -318,8 +323,165 @@ def _make_conditions_from_filters(filters, is_public=None):
 #     except:
 #         raise exception.ExperimentNotFound(expt_id=expt_id)
 #     return expt
-#
-#
+
+
+EXPT_LIST_COLUMNS = ('id', 'name', 'description', 'type', 'state', 'operate',
+                     'owner_id', 'owner_name', 'created_at', 'expired_at',
+                     'is_public', 'notes')
+
+
+def expt_list_page(filters, limit, after=None):
+    """Returns a page of experiments, newest first.
+
+    The page is a seek on the row value (created_at, id) rather than an
+    offset or _paginate_query's OR of CASEs, so a range scan of the
+    (owner_id, deleted, created_at, id) or (deleted, created_at, id)
+    index starts right at ``after`` however deep the page is.
+
+    :param filters: equality filters on owner_id, type and state;
+                    experiments being deleted are left out unless
+                    'deleting' is true.
+    :param after: (created_at, id) of the last row of the previous page.
+    """
+    columns = [getattr(BaseExpt, key) for key in EXPT_LIST_COLUMNS]
+    query = sa_api.model_query(BaseExpt, columns, read_deleted="no",
+                               use_slave=readmode.use_slave())
+    for key in ('owner_id', 'type', 'state'):
+        if filters.get(key) is not None:
+            query = query.filter(getattr(BaseExpt, key) == filters[key])
+    if not filters.get('deleting'):
+        query = query.filter(
+            or_(BaseExpt.operate == None,
+                BaseExpt.operate != EXPT_OPERATE_DIC['deleting']))
+    if after is not None:
+        query = query.filter(
+            sqlalchemy.tuple_(BaseExpt.created_at, BaseExpt.id) <
+            sqlalchemy.tuple_(*after))
+    query = query.order_by(desc(BaseExpt.created_at), desc(BaseExpt.id)).\
+        limit(limit)
+    return [dict(zip(EXPT_LIST_COLUMNS, row)) for row in query]
+
+
+def expt_ids_expired(now, limit):
+    """Returns the ids of up to ``limit`` experiments past their
+    expired_at, oldest first; ones being deleted or with a reap row,
+    which includes those whose delete failed, are left out.
+    """
+    reap = models.ContainerReap
+    queued = sqlalchemy.exists().where(and_(reap.expt_id == BaseExpt.id,
+                                            reap.deleted == False))
+    query = sa_api.model_query(BaseExpt, (BaseExpt.id,), read_deleted="no").\
+        filter(BaseExpt.expired_at <= now,
+               or_(BaseExpt.operate == None,
+                   BaseExpt.operate != EXPT_OPERATE_DIC['deleting']),
+               ~queued).\
+        order_by(asc(BaseExpt.expired_at)).\
+        limit(limit)
+    return [q[0] for q in query]
+
+
+def expt_get(expt_id):
+    """Reads an experiment row, from the replica inside a
+    readmode.replica() block.
+    """
+    columns = [getattr(BaseExpt, key) for key in EXPT_LIST_COLUMNS]
+    row = sa_api.model_query(BaseExpt, columns, read_deleted="no",
+                             use_slave=readmode.use_slave()).\
+        filter(BaseExpt.id == expt_id).\
+        first()
+    return dict(zip(EXPT_LIST_COLUMNS, row)) if row else None
+
+
+def expt_get_many(expt_ids):
+    """Reads many experiment rows in one query, in no particular order."""
+    if not expt_ids:
+        return []
+    columns = [getattr(BaseExpt, key) for key in EXPT_LIST_COLUMNS]
+    query = sa_api.model_query(BaseExpt, columns, read_deleted="no",
+                               use_slave=readmode.use_slave()).\
+        filter(BaseExpt.id.in_(expt_ids))
+    return [dict(zip(EXPT_LIST_COLUMNS, row)) for row in query]
+
+
+def expt_device_states(expt_ids):
+    """Returns (expt_id, device_id, name, state, operate) of the vms of
+    many experiments, in one query.
+    """
+    if not expt_ids:
+        return []
+    _vm_and = and_(CloudVM.device_id == CloudDevice.id,
+                   CloudVM.deleted == False)
+    query = sa_api.model_query(CloudExptTopo,
+                               (CloudExptTopo.expt_id,
+                                CloudDevice.id,
+                                CloudDevice.name,
+                                CloudVM.state,
+                                CloudVM.operate),
+                               read_deleted="no",
+                               use_slave=readmode.use_slave()).\
+        join((CloudDevice, CloudDevice.topo_id == CloudExptTopo.topo_id)).\
+        join((CloudVM, _vm_and)).\
+        filter(CloudExptTopo.expt_id.in_(expt_ids),
+               CloudDevice.deleted == False).\
+        order_by(asc(CloudDevice.id))
+    return query.all()
+
+
+def expt_states_get(expt_id):
+    """Returns the state, operate and revision of an experiment with the
+    (device_id, name, state, operate) of its vms, in one query.
+
+    The experiment row is repeated on each vm row; the outer joins keep
+    it for an experiment without vms. Always read from the primary, so
+    the revision and the states are of the same snapshot.
+
+    :returns: {'id', 'state', 'operate', 'revision', 'changed_at',
+               'devices'}, or None if the experiment does not exist.
+    """
+    revision = models.ContainerExptRevision
+    _revision_and = and_(revision.expt_id == BaseExpt.id,
+                         revision.deleted == False)
+    _topo_and = and_(CloudExptTopo.expt_id == BaseExpt.id,
+                     CloudExptTopo.deleted == False)
+    _device_and = and_(CloudDevice.topo_id == CloudExptTopo.topo_id,
+                       CloudDevice.deleted == False)
+    _vm_and = and_(CloudVM.device_id == CloudDevice.id,
+                   CloudVM.deleted == False)
+    query = sa_api.model_query(BaseExpt,
+                               (BaseExpt.id,
+                                BaseExpt.state,
+                                BaseExpt.operate,
+                                revision.revision,
+                                revision.created_at,
+                                revision.updated_at,
+                                CloudDevice.id,
+                                CloudDevice.name,
+                                CloudVM.id,
+                                CloudVM.state,
+                                CloudVM.operate),
+                               read_deleted="no").\
+        outerjoin((revision, _revision_and)).\
+        outerjoin((CloudExptTopo, _topo_and)).\
+        outerjoin((CloudDevice, _device_and)).\
+        outerjoin((CloudVM, _vm_and)).\
+        filter(BaseExpt.id == expt_id).\
+        order_by(asc(CloudDevice.id))
+    ref = None
+    for (ref_id, state, operate, rev, created_at, updated_at,
+         device_id, name, vm_id, vm_state, vm_operate) in query:
+        if ref is None:
+            ref = {'id': ref_id,
+                   'state': state,
+                   'operate': operate,
+                   'revision': rev or 0,
+                   'changed_at': updated_at or created_at,
+                   'devices': []}
+        # a device without a vm is not listed, as in expt_device_states
+        if vm_id is not None:
+            ref['devices'].append((device_id, name, vm_state, vm_operate))
+    return ref
+
+
 # ########################### device #########################
 # def vhost_data_create(values):
 #     vhost_ref = models.VneVHost.from_dict(values)
@@ -1167,4 +1329,1008 @@ def _make_conditions_from_filters(filters, is_public=None):
 #     #     all()
 #
 #     print "vlinks:*********************************************", vlinks
-#     return vlinks
\ No newline at end of file
+#     return vlinks
+
+########################### topology #########################
+def _model_values(model, values, **extra):
+    """Keep only the keys of ``values`` that are columns of ``model``."""
+    columns = model.__table__.columns
+    row = dict((k, v) for k, v in values.items()
+               if k in columns and k != 'id')
+    row.update(extra)
+    return row
+
+
+def _bulk_insert(session, model, rows):
+    """Inserts ``rows`` with one executemany, in their order.
+
+    The INSERT is compiled from the keys of the first row only, so every
+    row is given the keys of all the others; a missing value becomes the
+    scalar default of its column, or NULL.
+    """
+    if not rows:
+        return
+    keys = set()
+    for row in rows:
+        keys.update(row)
+    columns = model.__table__.c
+    missing = {}
+    for key in keys:
+        default = columns[key].default if key in columns else None
+        missing[key] = default.arg if default is not None and \
+            default.is_scalar else None
+    rows = [dict(missing, **row) if len(row) < len(keys) else row
+            for row in rows]
+    session.execute(model.__table__.insert(), rows)
+
+
+def _insert_ids(session, model, rows):
+    """Inserts ``rows`` and returns their new ids, in their order.
+
+    Each id is the primary key reported by its own INSERT, so nothing
+    assumes that an auto increment hands out consecutive or ordered ids
+    to the rows of one executemany, which InnoDB does not promise. The
+    rows still share the caller's transaction and Core statement, with
+    no ORM unit of work.
+    """
+    insert = model.__table__.insert()
+    return [session.execute(insert, row).inserted_primary_key[0]
+            for row in rows]
+
+
+def topo_bulk_create(expt_id, topo_values, build_rows):
+    """Materializes a whole topology in one transaction.
+
+    The topo row is inserted first and ``build_rows(topo_id)`` is called
+    to build the network, router and device rows in memory, since their
+    names embed the topo id. Rows whose ids are needed are inserted with
+    _insert_ids, which takes each id from its INSERT; the link and
+    layout rows, which nothing refers to, with a single executemany.
+
+    ``build_rows`` returns ``(networks, routers, devices)``::
+
+        networks: [{'values': {}, 'subnets': [{'key': 1, 'values': {}}]}]
+        routers:  [{'device': {}, 'values': {}, 'ports': [...]}]
+        devices:  [{'device': {}, 'values': {}, 'ports': [...]}]
+        ports:    [{'subnet_key': 1, 'values': {}, 'ipaddrs': None}]
+
+    Subnets, routers and devices may carry a ``layout`` dict, written to
+    container_layout.
+
+    Every item is updated in place with its new ``id``; routers and
+    devices also get ``device_id`` and ports ``subnet_id`` and
+    ``network_id``.
+    """
+    session = sa_api.get_session()
+    with session.begin():
+        topo_ref = CloudTopo(**_model_values(CloudTopo, topo_values))
+        session.add(topo_ref)
+        session.flush()
+        topo_id = topo_ref.id
+        session.add(CloudExptTopo(expt_id=expt_id, topo_id=topo_id))
+
+        networks, routers, devices = build_rows(topo_id)
+
+        # networks and subnets
+        net_ids = _insert_ids(session, CloudNetwork,
+                              [_model_values(CloudNetwork, net['values'],
+                                             topo_id=topo_id)
+                               for net in networks])
+        for net, net_id in zip(networks, net_ids):
+            net['id'] = net_id
+
+        subnets = []
+        for net in networks:
+            for sub in net['subnets']:
+                sub['network_id'] = net['id']
+                subnets.append(sub)
+        sub_ids = _insert_ids(session, CloudSubnet,
+                              [_model_values(CloudSubnet, sub['values'],
+                                             network_id=sub['network_id'])
+                               for sub in subnets])
+        subnet_map = {}
+        for sub, sub_id in zip(subnets, sub_ids):
+            sub['id'] = sub_id
+            subnet_map[sub['key']] = sub
+        _bulk_insert(session, VneSubnet,
+                     [{'topo_id': topo_id, 'cloud_subnet_id': sub['id']}
+                      for sub in subnets])
+
+        # routers and vms share the device table
+        items = routers + devices
+        device_ids = _insert_ids(session, CloudDevice,
+                                 [_model_values(CloudDevice, item['device'],
+                                                topo_id=topo_id)
+                                  for item in items])
+        for item, device_id in zip(items, device_ids):
+            item['device_id'] = device_id
+
+        for model, group in ((CloudRouter, routers), (CloudVM, devices)):
+            obj_ids = _insert_ids(session, model,
+                                  [_model_values(model, item['values'],
+                                                 device_id=item['device_id'])
+                                   for item in group])
+            for item, obj_id in zip(group, obj_ids):
+                item['id'] = obj_id
+
+        # ports and their subnet links
+        ports = []
+        for item in items:
+            for port in item['ports']:
+                sub = subnet_map[port['subnet_key']]
+                port['device_id'] = item['device_id']
+                port['subnet_id'] = sub['id']
+                port['network_id'] = sub['network_id']
+                ports.append(port)
+        port_ids = _insert_ids(session, CloudPort,
+                               [_model_values(CloudPort, port['values'],
+                                              device_id=port['device_id'],
+                                              ipaddrs=port.get('ipaddrs'))
+                                for port in ports])
+        for port, port_id in zip(ports, port_ids):
+            port['id'] = port_id
+        _bulk_insert(session, CloudSubnetPort,
+                     [{'subnet_id': port['subnet_id'], 'port_id': port['id']}
+                      for port in ports])
+
+        # canvas layout of subnets and devices
+        layouts = [_layout_values('subnet', sub['id'], sub['layout'])
+                   for sub in subnets if sub.get('layout')]
+        layouts.extend(_layout_values('device', item['device_id'],
+                                      item['layout'])
+                       for item in items if item.get('layout'))
+        _bulk_insert(session, models.ContainerLayout, layouts)
+
+    return {'topo_id': topo_id,
+            'networks': networks,
+            'routers': routers,
+            'devices': devices}
+
+
+def _layout_values(kind, obj_id, layout):
+    # every row has all four columns, subnets included, since the rows
+    # of a topology are written with one executemany
+    return {'kind': kind,
+            'obj_id': obj_id,
+            'x': layout.get('x'),
+            'y': layout.get('y'),
+            'vtype': layout.get('vtype') or 0,
+            'device_type': layout.get('device_type'),
+            'created_at': timeutils.utcnow(),
+            'deleted': False}
+
+
+def _layout_dict(layout):
+    if layout is None:
+        return None
+    return {'x': layout.x if layout.x is not None else 0,
+            'y': layout.y if layout.y is not None else 0,
+            'vtype': layout.vtype or 0,
+            'device_type': layout.device_type}
+
+
+def layouts_create(kind, layouts):
+    """Records the canvas layout of subnets or devices.
+
+    ``layouts`` maps subnet or device ids to dicts of x, y, vtype and
+    device_type.
+    """
+    session = sa_api.get_session()
+    with session.begin():
+        _bulk_insert(session, models.ContainerLayout,
+                     [_layout_values(kind, obj_id, layout)
+                      for obj_id, layout in layouts.items()])
+
+
+def topos_mark_deleting(topo_ids, states):
+    """Moves the routers, networks, subnets and ports of topologies to
+    their deleting state, in one transaction.
+
+    :param states: the state to set, keyed by 'router', 'network',
+                   'subnet' and 'port'.
+    :returns: the routers, networks and subnets marked, by kind, as
+              dicts with their ids.
+    """
+    if not topo_ids:
+        return {'routers': [], 'networks': [], 'subnets': []}
+    now = timeutils.utcnow()
+    session = sa_api.get_session()
+    with session.begin():
+        device_ids = session.query(CloudDevice.id).\
+            filter(CloudDevice.topo_id.in_(topo_ids),
+                   CloudDevice.deleted == False).\
+            subquery()
+        routers = session.query(CloudRouter.id, CloudRouter.device_id).\
+            filter(CloudRouter.device_id.in_(device_ids),
+                   CloudRouter.deleted == False).\
+            all()
+        network_ids = [q[0] for q in session.query(CloudNetwork.id).
+                       filter(CloudNetwork.topo_id.in_(topo_ids),
+                              CloudNetwork.deleted == False)]
+        subnet_ids = []
+        if network_ids:
+            subnet_ids = [q[0] for q in session.query(CloudSubnet.id).
+                          filter(CloudSubnet.network_id.in_(network_ids),
+                                 CloudSubnet.deleted == False)]
+        for model, kind, ids in ((CloudRouter, 'router',
+                                  [q[0] for q in routers]),
+                                 (CloudNetwork, 'network', network_ids),
+                                 (CloudSubnet, 'subnet', subnet_ids)):
+            if ids:
+                session.query(model).\
+                    filter(model.id.in_(ids)).\
+                    update({'state': states[kind], 'updated_at': now},
+                           synchronize_session=False)
+        session.query(CloudPort).\
+            filter(CloudPort.device_id.in_(device_ids),
+                   CloudPort.deleted == False).\
+            update({'state': states['port'], 'updated_at': now},
+                   synchronize_session=False)
+    return {'routers': [{'id': q[0], 'device_id': q[1]} for q in routers],
+            'networks': [{'id': network_id} for network_id in network_ids],
+            'subnets': [{'id': subnet_id} for subnet_id in subnet_ids]}
+
+
+def expt_topology_load(expt_id, layout=False):
+    """Loads every topology of an experiment in four queries.
+
+    Topos, networks with their subnets, devices with their vm or router
+    and ports with their subnet links are each read with one joined
+    query and assembled through dicts indexed by id, so the number of
+    queries does not grow with the size of the topology. The result has
+    the shape of ``topology_api.get_topo_detail`` for each topo.
+
+    With ``layout``, subnets and devices also get a ``layout`` dict of
+    x, y, vtype and device_type, joined from container_layout; it is
+    None for rows that have no layout.
+    """
+    use_slave = readmode.use_slave()
+    return _topos_load(_expt_topos(expt_id, use_slave), layout, use_slave)
+
+
+def expt_topology_iter(expt_id, layout=False):
+    """Like expt_topology_load, but loads and yields one topo at a time,
+    so only one of them is held in memory.
+    """
+    # decided now: the generator runs after the caller's replica() block
+    use_slave = readmode.use_slave()
+
+    def _iter():
+        for topo in _expt_topos(expt_id, use_slave):
+            for topo_ref in _topos_load([topo], layout, use_slave):
+                yield topo_ref
+    return _iter()
+
+
+def _expt_topos(expt_id, use_slave=False):
+    return sa_api.model_query(CloudTopo, read_deleted="no",
+                              use_slave=use_slave).\
+        join((CloudExptTopo, CloudExptTopo.topo_id == CloudTopo.id)).\
+        filter(CloudExptTopo.expt_id == expt_id).\
+        order_by(asc(CloudTopo.id)).\
+        all()
+
+
+def _topos_load(topos, layout, use_slave=False):
+    model_query = functools.partial(sa_api.model_query, use_slave=use_slave)
+    topo_map = collections.OrderedDict()
+    for topo in topos:
+        topo_ref = topo.to_dict()
+        topo_ref['networks'] = []
+        topo_ref['devices'] = []
+        topo_map[topo.id] = topo_ref
+    if not topo_map:
+        return []
+    topo_ids = topo_map.keys()
+
+    # networks and subnets
+    _sub_and = and_(CloudSubnet.network_id == CloudNetwork.id,
+                    CloudSubnet.deleted == False)
+    Layout = models.ContainerLayout
+    _sub_layout_and = and_(Layout.kind == 'subnet',
+                           Layout.obj_id == CloudSubnet.id)
+    query = model_query(CloudNetwork, (CloudNetwork, CloudSubnet),
+                        read_deleted="no").\
+        outerjoin((CloudSubnet, _sub_and))
+    if layout:
+        query = query.add_entity(Layout).\
+            outerjoin((Layout, _sub_layout_and))
+    query = query.filter(CloudNetwork.topo_id.in_(topo_ids)).\
+        order_by(asc(CloudNetwork.id), asc(CloudSubnet.id))
+    network_map = {}
+    subnet_map = {}
+    for row in query:
+        network, subnet = row[0], row[1]
+        if network.id not in network_map:
+            network_ref = network.to_dict()
+            network_ref['subnets'] = []
+            network_map[network.id] = network_ref
+            topo_map[network.topo_id]['networks'].append(network_ref)
+        if subnet is not None:
+            subnet_ref = subnet.to_dict()
+            if layout:
+                subnet_ref['layout'] = _layout_dict(row[2])
+            subnet_map[subnet.id] = subnet_ref
+            network_map[network.id]['subnets'].append(subnet_ref)
+
+    # devices with the vm or router behind them
+    _vm_and = and_(CloudVM.device_id == CloudDevice.id,
+                   CloudVM.deleted == False)
+    _router_and = and_(CloudRouter.device_id == CloudDevice.id,
+                       CloudRouter.deleted == False)
+    _dev_layout_and = and_(Layout.kind == 'device',
+                           Layout.obj_id == CloudDevice.id)
+    query = model_query(CloudDevice, (CloudDevice, CloudVM, CloudRouter),
+                        read_deleted="no").\
+        outerjoin((CloudVM, _vm_and)).\
+        outerjoin((CloudRouter, _router_and))
+    if layout:
+        query = query.add_entity(Layout).\
+            outerjoin((Layout, _dev_layout_and))
+    query = query.filter(CloudDevice.topo_id.in_(topo_ids)).\
+        order_by(asc(CloudDevice.id))
+    device_map = {}
+    for row in query:
+        device, vm, router = row[:3]
+        obj = vm if vm is not None else router
+        device_ref = obj.to_dict() if obj is not None else {}
+        device_ref.update(device.to_dict())
+        device_ref['obj_id'] = obj.id if obj is not None else None
+        device_ref['ports'] = []
+        if layout:
+            device_ref['layout'] = _layout_dict(row[3])
+        device_map[device.id] = device_ref
+        topo_map[device.topo_id]['devices'].append(device_ref)
+
+    # ports and the subnets they attach to
+    _link_and = and_(CloudSubnetPort.port_id == CloudPort.id,
+                     CloudSubnetPort.deleted == False)
+    query = model_query(CloudPort, (CloudPort, CloudSubnetPort.subnet_id),
+                        read_deleted="no").\
+        join((CloudDevice, CloudDevice.id == CloudPort.device_id)).\
+        outerjoin((CloudSubnetPort, _link_and)).\
+        filter(CloudDevice.topo_id.in_(topo_ids),
+               CloudDevice.deleted == False).\
+        order_by(asc(CloudPort.id))
+    port_map = {}
+    for port, subnet_id in query:
+        if port.id not in port_map:
+            port_ref = port.to_dict()
+            port_ref['subnets'] = []
+            port_map[port.id] = port_ref
+            device_map[port.device_id]['ports'].append(port_ref)
+        if subnet_id in subnet_map:
+            port_map[port.id]['subnets'].append(dict(subnet_map[subnet_id]))
+
+    return topo_map.values()
+
+
+########################### port #########################
+def ports_get_os_specs(port_ids):
+    """Returns what neutron needs to create each port, keyed by port id."""
+    if not port_ids:
+        return {}
+    _sub_and = and_(CloudSubnet.id == CloudSubnetPort.subnet_id,
+                    CloudSubnet.deleted == False)
+    query = sa_api.model_query(CloudPort,
+                               (CloudPort.id,
+                                CloudPort.name,
+                                CloudPort.ipaddrs,
+                                CloudOSSubnet.os_subnet_uuid,
+                                CloudOSNetwork.os_network_uuid,
+                                CloudPort.device_owner),
+                               read_deleted="no").\
+        join((CloudSubnetPort, CloudSubnetPort.port_id == CloudPort.id)).\
+        join((CloudSubnet, _sub_and)).\
+        outerjoin((CloudOSSubnet,
+                   CloudOSSubnet.subnet_id == CloudSubnet.id)).\
+        outerjoin((CloudOSNetwork,
+                   CloudOSNetwork.network_id == CloudSubnet.network_id)).\
+        filter(CloudPort.id.in_(port_ids)).\
+        all()
+    return dict((q[0], {'port_id': q[0],
+                        'name': q[1],
+                        'ipaddrs': q[2],
+                        'os_subnet_uuid': q[3],
+                        'os_network_uuid': q[4],
+                        'device_owner': q[5]})
+                for q in query)
+
+
+def os_ports_bulk_create(values):
+    """Records the neutron uuids of many ports in one transaction.
+
+    The fixed ip and mac neutron gave each port, ``ipaddrs`` and
+    ``mac_address`` of ``values``, are written to the columns of that
+    name of the os port and port rows, with one executemany.
+    """
+    session = sa_api.get_session()
+    with session.begin():
+        _bulk_insert(session, CloudOSPort,
+                     [_model_values(CloudOSPort, v) for v in values])
+        rows = [_model_values(CloudPort,
+                              {'ipaddrs': v.get('ipaddrs'),
+                               'mac_address': v.get('mac_address')})
+                for v in values]
+        columns = rows[0].keys() if rows else []
+        if not columns:
+            return
+        table = CloudPort.__table__
+        # bound names must differ from the column names they set
+        update = table.update().\
+            where(table.c.id == sa_sql.bindparam('b_id')).\
+            values(dict((column, sa_sql.bindparam('b_' + column))
+                        for column in columns))
+        session.execute(update,
+                        [dict([('b_id', v['port_id'])] +
+                              [('b_' + k, row[k]) for k in columns])
+                         for v, row in zip(values, rows)])
+
+
+def os_ports_get(port_ids):
+    """Returns the existing os ports of ``port_ids``, keyed by port id."""
+    if not port_ids:
+        return {}
+    query = sa_api.model_query(CloudOSPort,
+                               (CloudOSPort.port_id,
+                                CloudOSPort.os_port_uuid),
+                               read_deleted="no").\
+        filter(CloudOSPort.port_id.in_(port_ids)).\
+        all()
+    return dict((q[0], {'port_id': q[0], 'os_port_uuid': q[1]})
+                for q in query)
+
+
+########################### quota #########################
+def quota_reservation_create(values):
+    reservation_ref = models.ContainerQuotaReservation()
+    reservation_ref.update(values)
+    reservation_ref.save()
+    return reservation_ref
+
+
+def quota_reservations_create(values):
+    model = models.ContainerQuotaReservation
+    now = timeutils.utcnow()
+    session = sa_api.get_session()
+    with session.begin():
+        _bulk_insert(session, model,
+                     [_model_values(model, v, created_at=now, deleted=False)
+                      for v in values])
+
+
+def quota_reservation_commit(uuid, expt_id):
+    """Binds a live reservation to its experiment in one UPDATE.
+
+    :returns: False if the reservation is gone, i.e. it expired and was
+              claimed back before the experiment was created.
+    """
+    model = models.ContainerQuotaReservation
+    session = sa_api.get_session()
+    with session.begin():
+        count = session.query(model).\
+            filter(model.uuid == uuid,
+                   model.state == 'reserved',
+                   model.expires_at > timeutils.utcnow(),
+                   model.deleted == False).\
+            update({'state': 'committed',
+                    'expt_id': expt_id,
+                    'expires_at': None},
+                   synchronize_session=False)
+    return count == 1
+
+
+def _quota_reservation_claim(token, *criterion):
+    """Moves the matching rows to ``releasing`` in a single UPDATE.
+
+    Only one caller can move a row, so only that caller gets it back and
+    gives its quota back to terra.
+    """
+    model = models.ContainerQuotaReservation
+    session = sa_api.get_session()
+    with session.begin():
+        session.query(model).\
+            filter(model.deleted == False, *criterion).\
+            update({'state': 'releasing',
+                    'claim': token,
+                    'updated_at': timeutils.utcnow()},
+                   synchronize_session=False)
+    query = sa_api.model_query(model, read_deleted="no").\
+        filter(model.claim == token, model.state == 'releasing')
+    return query.all()
+
+
+def quota_reservation_claim(uuid, token):
+    model = models.ContainerQuotaReservation
+    return _quota_reservation_claim(
+        token, model.uuid == uuid,
+        model.state.in_(['reserved', 'committed']))
+
+
+def quota_reservation_claim_expt(expt_id, token):
+    model = models.ContainerQuotaReservation
+    return _quota_reservation_claim(
+        token, model.expt_id == expt_id,
+        model.state.in_(['reserved', 'committed']))
+
+
+def quota_reservation_claim_stale(token, retry_before):
+    """Claims expired reservations and releases that did not finish."""
+    model = models.ContainerQuotaReservation
+    return _quota_reservation_claim(
+        token, or_(and_(model.state == 'reserved',
+                        model.expires_at < timeutils.utcnow()),
+                   and_(model.state == 'releasing',
+                        model.updated_at < retry_before)))
+
+
+def quota_reservation_released(reservation_ids, token):
+    model = models.ContainerQuotaReservation
+    if not reservation_ids:
+        return
+    session = sa_api.get_session()
+    with session.begin():
+        session.query(model).\
+            filter(model.id.in_(reservation_ids),
+                   model.claim == token,
+                   model.state == 'releasing').\
+            update({'state': 'released'}, synchronize_session=False)
+
+
+def quota_reservations_get_expt(expt_id):
+    model = models.ContainerQuotaReservation
+    return sa_api.model_query(model, read_deleted="no").\
+        filter(model.expt_id == expt_id).\
+        all()
+
+
+########################### operation #########################
+def operation_create(values):
+    operation_ref = models.ContainerOperation()
+    operation_ref.update(values)
+    operation_ref.save()
+    return operation_ref
+
+
+def operation_get(op_id):
+    return sa_api.model_query(models.ContainerOperation, read_deleted="no").\
+        filter_by(id=op_id).\
+        first()
+
+
+def operation_update(op_id, values):
+    session = sa_api.get_session()
+    with session.begin():
+        session.query(models.ContainerOperation).\
+            filter_by(id=op_id).\
+            update(values, synchronize_session=False)
+
+
+########################### event #########################
+def expt_events_create(expt_id, values, keep):
+    """Appends events of an experiment and drops all but the newest
+    ``keep`` of them, in one transaction.
+    """
+    model = models.ContainerExptEvent
+    now = timeutils.utcnow()
+    session = sa_api.get_session()
+    with session.begin():
+        _bulk_insert(session, model,
+                     [_model_values(model, v, expt_id=expt_id,
+                                    created_at=now, deleted=False)
+                      for v in values])
+        oldest_kept = session.query(model.id).\
+            filter(model.expt_id == expt_id).\
+            order_by(desc(model.id)).\
+            offset(keep - 1).\
+            limit(1).\
+            scalar()
+        if oldest_kept is not None:
+            session.query(model).\
+                filter(model.expt_id == expt_id, model.id < oldest_kept).\
+                delete(synchronize_session=False)
+
+
+def expt_events_get(expt_id, since, limit):
+    model = models.ContainerExptEvent
+    return sa_api.model_query(model, read_deleted="no").\
+        filter(model.expt_id == expt_id, model.id > since).\
+        order_by(asc(model.id)).\
+        limit(limit).\
+        all()
+
+
+########################### provision #########################
+def provision_create(values):
+    provision_ref = models.ContainerProvision()
+    provision_ref.update(values)
+    provision_ref.save()
+    return provision_ref
+
+
+def provision_update(topo_id, values):
+    session = sa_api.get_session()
+    with session.begin():
+        session.query(models.ContainerProvision).\
+            filter_by(topo_id=topo_id).\
+            update(values, synchronize_session=False)
+
+
+def provision_finish(topo_id, state):
+    """Sets the final state of a provision, then completes its create
+    operation if that was the last provision of it still running.
+    """
+    model = models.ContainerProvision
+    provision_update(topo_id, {'state': state})
+    op_id = sa_api.model_query(model, (model.op_id,), read_deleted="no").\
+        filter(model.topo_id == topo_id).\
+        scalar()
+    if op_id:
+        operation_finish_provisioned(op_id)
+
+
+def operation_finish_provisioned(op_id):
+    """Completes a create operation in the provisioning phase once none
+    of its provisions is running; it fails if any did not finish done.
+
+    The check and the update are one statement, and every provision
+    runs it after its own state is committed, so the last one to finish
+    always sees the others finished.
+    """
+    model = models.ContainerProvision
+    operation = models.ContainerOperation
+
+    def provisions(*criteria):
+        return sqlalchemy.exists().where(and_(model.op_id == op_id,
+                                              model.deleted == False,
+                                              *criteria))
+
+    now = timeutils.utcnow()
+    session = sa_api.get_session()
+    with session.begin():
+        query = session.query(operation).\
+            filter(operation.id == op_id,
+                   operation.phase == OPERATION_PHASE_DIC['provisioning'],
+                   ~provisions(model.state == 'running'))
+        query.filter(provisions(model.state != 'done')).\
+            update({'phase': OPERATION_PHASE_DIC['error'],
+                    'failure_info': 'provisioning did not finish',
+                    'updated_at': now},
+                   synchronize_session=False)
+        query.filter(~provisions(model.state != 'done')).\
+            update({'phase': OPERATION_PHASE_DIC['done'],
+                    'progress': 100,
+                    'updated_at': now},
+                   synchronize_session=False)
+
+
+def provision_steps_create(topo_id, steps):
+    """Checkpoints ``(kind, obj_id)`` steps and touches the provision."""
+    model = models.ContainerProvisionStep
+    now = timeutils.utcnow()
+    session = sa_api.get_session()
+    with session.begin():
+        _bulk_insert(session, model,
+                     [{'topo_id': topo_id, 'kind': kind, 'obj_id': obj_id,
+                       'created_at': now, 'deleted': False}
+                      for kind, obj_id in steps])
+        session.query(models.ContainerProvision).\
+            filter_by(topo_id=topo_id).\
+            update({'updated_at': now}, synchronize_session=False)
+
+
+def provision_steps_get(topo_id):
+    model = models.ContainerProvisionStep
+    return sa_api.model_query(model, (model.kind, model.obj_id),
+                              read_deleted="no").\
+        filter(model.topo_id == topo_id).\
+        all()
+
+
+def provision_touch(topo_id):
+    """Shows that the worker of a running provision is still alive."""
+    model = models.ContainerProvision
+    session = sa_api.get_session()
+    with session.begin():
+        session.query(model).\
+            filter(model.topo_id == topo_id, model.state == 'running').\
+            update({'updated_at': timeutils.utcnow()},
+                   synchronize_session=False)
+
+
+def provision_claim_stale(token, stale_before):
+    """Takes over running provisions that stopped moving, in one UPDATE,
+    counting the attempt.
+    """
+    model = models.ContainerProvision
+    session = sa_api.get_session()
+    with session.begin():
+        session.query(model).\
+            filter(model.state == 'running',
+                   model.updated_at < stale_before,
+                   model.deleted == False).\
+            update({'claim': token,
+                    'attempts': model.attempts + 1,
+                    'updated_at': timeutils.utcnow()},
+                   synchronize_session=False)
+    return sa_api.model_query(model, read_deleted="no").\
+        filter(model.claim == token, model.state == 'running').\
+        all()
+
+
+########################### revision #########################
+def expt_revision_get(expt_id):
+    model = models.ContainerExptRevision
+    revision = sa_api.model_query(model, (model.revision,),
+                                  read_deleted="no",
+                                  use_slave=readmode.use_slave()).\
+        filter(model.expt_id == expt_id).\
+        scalar()
+    return revision or 0
+
+
+def expt_revision_info(expt_id):
+    """Returns the revision of an experiment and when it was bumped."""
+    return expt_revisions_info([expt_id])[int(expt_id)]
+
+
+def expt_revisions_info(expt_ids):
+    """Like expt_revision_info for many experiments, keyed by int id.
+
+    Ids from a route are strings; the rows have ints, so both are
+    normalized to int.
+    """
+    model = models.ContainerExptRevision
+    infos = dict((int(expt_id), {'revision': 0, 'changed_at': None})
+                 for expt_id in expt_ids)
+    if not infos:
+        return infos
+    query = sa_api.model_query(model, (model.expt_id, model.revision,
+                                       model.created_at, model.updated_at),
+                               read_deleted="no").\
+        filter(model.expt_id.in_(infos.keys()))
+    for expt_id, revision, created_at, updated_at in query:
+        infos[expt_id] = {'revision': revision,
+                          'changed_at': updated_at or created_at}
+    return infos
+
+
+def expt_revisions_bump(expt_ids):
+    """Increments the revision of each experiment, in one transaction."""
+    model = models.ContainerExptRevision
+    expt_ids = set(int(expt_id) for expt_id in expt_ids)
+    if not expt_ids:
+        return
+    now = timeutils.utcnow()
+    session = sa_api.get_session()
+    try:
+        with session.begin():
+            session.query(model).\
+                filter(model.expt_id.in_(expt_ids)).\
+                update({'revision': model.revision + 1, 'updated_at': now},
+                       synchronize_session=False)
+            known = set(q[0] for q in session.query(model.expt_id).
+                        filter(model.expt_id.in_(expt_ids)))
+            _bulk_insert(session, model,
+                         [{'expt_id': expt_id, 'revision': 1,
+                           'created_at': now, 'deleted': False}
+                          for expt_id in expt_ids - known])
+    except db_exc.DBDuplicateEntry:
+        # another writer created the row first; bumping it is enough
+        with session.begin():
+            session.query(model).\
+                filter(model.expt_id.in_(expt_ids)).\
+                update({'revision': model.revision + 1, 'updated_at': now},
+                       synchronize_session=False)
+
+
+def _changed_since(model, since):
+    # terra creates rows, e.g. router gateway ports, without updated_at
+    return or_(model.updated_at > since, model.created_at > since)
+
+
+def expt_ids_changed_since(since, expt_ids=None):
+    """Ids of experiments with a row read by their detail or topology
+    created, updated or soft deleted after ``since``.
+
+    That is the experiment row and the topo, network, subnet, device,
+    vm, router, port and subnet port rows of its topologies. Each side
+    of the union is a range scan of the created_at or updated_at index
+    of its table (migrations 012 and 014), so a sweep reads only what
+    changed. ``expt_ids`` limits the check to those experiments.
+    """
+    topo = (CloudTopo, CloudTopo.id == CloudExptTopo.topo_id)
+    network = (CloudNetwork, CloudNetwork.topo_id == CloudExptTopo.topo_id)
+    subnet = (CloudSubnet, CloudSubnet.network_id == CloudNetwork.id)
+    device = (CloudDevice, CloudDevice.topo_id == CloudExptTopo.topo_id)
+    vm = (CloudVM, CloudVM.device_id == CloudDevice.id)
+    router = (CloudRouter, CloudRouter.device_id == CloudDevice.id)
+    port = (CloudPort, CloudPort.device_id == CloudDevice.id)
+    subnet_port = (CloudSubnetPort, CloudSubnetPort.port_id == CloudPort.id)
+    # each changed table, with the joins from the topos of experiments
+    changes = ((CloudTopo, [topo]),
+               (CloudNetwork, [network]),
+               (CloudSubnet, [network, subnet]),
+               (CloudDevice, [device]),
+               (CloudVM, [device, vm]),
+               (CloudRouter, [device, router]),
+               (CloudPort, [device, port]),
+               (CloudSubnetPort, [device, port, subnet_port]))
+
+    expt_query = sa_api.model_query(BaseExpt, (BaseExpt.id,),
+                                    read_deleted="no").\
+        filter(_changed_since(BaseExpt, since))
+    if expt_ids is not None:
+        expt_query = expt_query.filter(BaseExpt.id.in_(expt_ids))
+    queries = []
+    for model, joins in changes:
+        query = sa_api.model_query(CloudExptTopo, (CloudExptTopo.expt_id,),
+                                   read_deleted="no")
+        for join in joins:
+            query = query.join(join)
+        query = query.filter(_changed_since(model, since))
+        if expt_ids is not None:
+            query = query.filter(CloudExptTopo.expt_id.in_(expt_ids))
+        queries.append(query)
+    return set(q[0] for q in expt_query.union(*queries))
+
+
+def sweep_mark_get(name):
+    """Returns the time up to which sweep ``name`` ran, or None."""
+    model = models.ContainerSweepMark
+    return sa_api.model_query(model, (model.swept_at,), read_deleted="no").\
+        filter(model.name == name).\
+        scalar()
+
+
+def sweep_mark_set(name, swept_at):
+    """Moves the mark of sweep ``name`` forward to ``swept_at``; a mark
+    already past it, set by another worker, is left alone.
+    """
+    model = models.ContainerSweepMark
+    session = sa_api.get_session()
+    with session.begin():
+        if session.query(model).\
+                filter(model.name == name, model.swept_at < swept_at).\
+                update({'swept_at': swept_at, 'updated_at': swept_at},
+                       synchronize_session=False):
+            return
+        if session.query(model.name).filter(model.name == name).count():
+            return
+    try:
+        with session.begin():
+            session.add(model(name=name, swept_at=swept_at,
+                              created_at=swept_at, deleted=False))
+    except db_exc.DBDuplicateEntry:
+        # another worker recorded its first sweep at the same time
+        pass
+
+
+########################### reap #########################
+def reap_enqueue(expt_id, op_id=None):
+    """Queues an experiment for the reaper, or queues it again once its
+    last teardown is done or failed.
+
+    A pending or running row is left alone, so a teardown in progress
+    keeps its claim and no second one starts beside it.
+
+    :returns: True if the experiment was queued, False if it already was.
+    """
+    model = models.ContainerReap
+    now = timeutils.utcnow()
+    values = {'op_id': op_id,
+              'state': 'pending',
+              'attempts': 0,
+              'next_attempt_at': now,
+              'progress': 0,
+              'claim': None,
+              'last_error': None}
+    session = sa_api.get_session()
+    try:
+        with session.begin():
+            session.add(model(expt_id=expt_id, created_at=now,
+                              deleted=False, **values))
+    except db_exc.DBDuplicateEntry:
+        values['updated_at'] = now
+        with session.begin():
+            return bool(session.query(model).
+                        filter(model.expt_id == expt_id,
+                               model.state.in_(['done', 'failed'])).
+                        update(values, synchronize_session=False))
+    return True
+
+
+def reap_record_failure(expt_id, error):
+    """Records a delete that failed before its teardown was queued, as
+    a failed reap row; a later delete queues it again.
+    """
+    model = models.ContainerReap
+    now = timeutils.utcnow()
+    session = sa_api.get_session()
+    try:
+        with session.begin():
+            session.add(model(expt_id=expt_id, state='failed', attempts=1,
+                              next_attempt_at=now, progress=0,
+                              last_error=error[:255], created_at=now,
+                              deleted=False))
+    except db_exc.DBDuplicateEntry:
+        with session.begin():
+            session.query(model).\
+                filter(model.expt_id == expt_id,
+                       model.state.in_(['done', 'failed'])).\
+                update({'state': 'failed',
+                        'attempts': model.attempts + 1,
+                        'last_error': error[:255],
+                        'updated_at': now},
+                       synchronize_session=False)
+
+
+def reap_claim(token, limit, stale_before):
+    """Claims up to ``limit`` due experiments, and ones whose reaper
+    stopped moving, in one conditional UPDATE.
+    """
+    model = models.ContainerReap
+    now = timeutils.utcnow()
+    due = or_(and_(model.state == 'pending', model.next_attempt_at <= now),
+              and_(model.state == 'running', model.updated_at < stale_before))
+    expt_ids = [q[0] for q in sa_api.model_query(model, (model.expt_id,),
+                                                 read_deleted="no").
+                filter(due).
+                order_by(asc(model.next_attempt_at)).
+                limit(limit)]
+    if not expt_ids:
+        return []
+    session = sa_api.get_session()
+    with session.begin():
+        session.query(model).\
+            filter(model.expt_id.in_(expt_ids), model.deleted == False, due).\
+            update({'state': 'running', 'claim': token, 'updated_at': now},
+                   synchronize_session=False)
+    return sa_api.model_query(model, read_deleted="no").\
+        filter(model.claim == token, model.state == 'running').\
+        all()
+
+
+def reap_update(expt_id, token, values):
+    """Updates a claimed row; does nothing once another reaper took it."""
+    model = models.ContainerReap
+    values = dict(values, updated_at=timeutils.utcnow())
+    session = sa_api.get_session()
+    with session.begin():
+        return session.query(model).\
+            filter(model.expt_id == expt_id, model.claim == token).\
+            update(values, synchronize_session=False)
+
+
+########################### expiry #########################
+def expire_stats_add(counts):
+    """Adds ``counts`` to the running totals of the expiry task, each
+    with a single UPDATE so that workers never overwrite each other.
+    """
+    model = models.ContainerExpireStat
+    now = timeutils.utcnow()
+    session = sa_api.get_session()
+
+    def add(name, value):
+        with session.begin():
+            return session.query(model).\
+                filter(model.name == name).\
+                update({'value': model.value + value, 'updated_at': now},
+                       synchronize_session=False)
+
+    for name, value in counts.items():
+        if not value or add(name, value):
+            continue
+        try:
+            with session.begin():
+                session.add(model(name=name, value=value, created_at=now,
+                                  deleted=False))
+        except db_exc.DBDuplicateEntry:
+            # another worker created the row first; add to it instead
+            add(name, value)
+
+
+def expire_stats_get():
+    model = models.ContainerExpireStat
+    return dict(sa_api.model_query(model, (model.name, model.value),
+                                   read_deleted="no"))
@@ -7,8 +7,8 @@ from terra import exception
 from terra.i18n import _LI, _
 from terra import experiment
 from terra.common import utils
-from tenant_expt.service import core as core_driver
-from tenant_expt.service.backends.sql import api as sql_api
+from container_expt.service import core as core_driver
+from container_expt.service.backends.sql import api as sql_api
 
 CONF = cfg.CONF
 LOG = log.getLogger(__name__)
@@ -52,6 +52,30 @@ class Experiment(core_driver.ExperimentDriver):
             expts.append(experiment.filter_experiment(ref))
         return expts
 
+    def expt_list_page(self, filters, limit, after=None):
+        """Lists experiments newest first, starting after the
+        (created_at, id) of the last row of the previous page.
+
+        :returns: list of experiment dicts, at most ``limit`` of them.
+
+        """
+        return sql_api.expt_list_page(filters, limit, after)
+
+    def expt_get(self, expt_id):
+        return sql_api.expt_get(expt_id)
+
+    def expt_get_many(self, expt_ids):
+        return sql_api.expt_get_many(expt_ids)
+
+    def expt_device_states(self, expt_ids):
+        """Returns tuples of (expt_id, device_id, name, state, operate)
+        for the vms of the experiments.
+        """
+        return [tuple(row) for row in sql_api.expt_device_states(expt_ids)]
+
+    def expt_states_get(self, expt_id):
+        return sql_api.expt_states_get(expt_id)
+
     ######################### device #########################
     def vhost_data_create(self, values):
         vhost_ref = sql_api.vhost_data_create(values)
@@ -105,6 +129,15 @@ class Experiment(core_driver.ExperimentDriver):
         port_mapping = sql_api.port_mapping_get_by_real_port_id(real_port_id)
         return vne_experiment.filter_port_mapping(port_mapping.to_dict())
 
+    def ports_get_os_specs(self, port_ids):
+        return sql_api.ports_get_os_specs(port_ids)
+
+    def os_ports_bulk_create(self, values):
+        sql_api.os_ports_bulk_create(values)
+
+    def os_ports_get(self, port_ids):
+        return sql_api.os_ports_get(port_ids)
+
     ######################### vlink #########################
     def create_vlink_data(self, values):
         vlink_ref = sql_api.create_vlink_data(values)
@@ -162,3 +195,179 @@ class Experiment(core_driver.ExperimentDriver):
     ######################### topology #########################
     def topo_get_subnets(self, topo_id):
         return sql_api.topo_get_subnets(topo_id)
+
+    def topo_bulk_create(self, expt_id, topo_values, build_rows):
+        """Creates a topology and all of its rows in one transaction.
+
+        :returns: dict with the new topo id and the built rows, updated
+                  with their database ids.
+
+        """
+        return sql_api.topo_bulk_create(expt_id, topo_values, build_rows)
+
+    def topos_mark_deleting(self, topo_ids, states):
+        """Moves all routers, networks, subnets and ports of topologies
+        to their deleting state in one transaction.
+
+        :returns: the marked routers, networks and subnets, by kind.
+
+        """
+        return sql_api.topos_mark_deleting(topo_ids, states)
+
+    def layouts_create(self, kind, layouts):
+        sql_api.layouts_create(kind, layouts)
+
+    def expt_topology_load(self, expt_id, layout=False):
+        """Loads all topologies of an experiment in a fixed number of
+        queries.
+
+        :returns: list of topo details, as topology_api.get_topo_detail
+                  returns them; with ``layout``, subnets and devices also
+                  carry their container_layout row.
+
+        """
+        return sql_api.expt_topology_load(expt_id, layout)
+
+    def expt_topology_iter(self, expt_id, layout=False):
+        """Yields the topologies of an experiment one at a time, in the
+        shape expt_topology_load returns them.
+        """
+        return sql_api.expt_topology_iter(expt_id, layout)
+
+    ######################### quota #########################
+    def quota_reservation_create(self, values):
+        return sql_api.quota_reservation_create(values).to_dict()
+
+    def quota_reservations_create(self, values):
+        sql_api.quota_reservations_create(values)
+
+    def quota_reservation_commit(self, uuid, expt_id):
+        """Moves a reservation from reserved to committed.
+
+        :returns: False if the reservation expired before the commit.
+
+        """
+        return sql_api.quota_reservation_commit(uuid, expt_id)
+
+    def quota_reservation_claim(self, uuid, token):
+        return [ref.to_dict()
+                for ref in sql_api.quota_reservation_claim(uuid, token)]
+
+    def quota_reservation_claim_expt(self, expt_id, token):
+        return [ref.to_dict()
+                for ref in sql_api.quota_reservation_claim_expt(expt_id,
+                                                                token)]
+
+    def quota_reservation_claim_stale(self, token, retry_before):
+        return [ref.to_dict()
+                for ref in sql_api.quota_reservation_claim_stale(
+                    token, retry_before)]
+
+    def quota_reservation_released(self, reservation_ids, token):
+        sql_api.quota_reservation_released(reservation_ids, token)
+
+    def quota_reservations_get_expt(self, expt_id):
+        return [ref.to_dict()
+                for ref in sql_api.quota_reservations_get_expt(expt_id)]
+
+    ######################### operation #########################
+    def operation_create(self, values):
+        return sql_api.operation_create(values).to_dict()
+
+    def operation_get(self, op_id):
+        """Get an operation by ID.
+
+        :returns: the operation, or None if it doesn't exist.
+
+        """
+        operation_ref = sql_api.operation_get(op_id)
+        return operation_ref.to_dict() if operation_ref else None
+
+    def operation_update(self, op_id, values):
+        sql_api.operation_update(op_id, values)
+
+    ######################### event #########################
+    def expt_events_create(self, expt_id, values, keep):
+        sql_api.expt_events_create(expt_id, values, keep)
+
+    def expt_events_get(self, expt_id, since, limit):
+        return [ref.to_dict()
+                for ref in sql_api.expt_events_get(expt_id, since, limit)]
+
+    ######################### provision #########################
+    def provision_create(self, values):
+        return sql_api.provision_create(values).to_dict()
+
+    def provision_update(self, topo_id, values):
+        sql_api.provision_update(topo_id, values)
+
+    def provision_touch(self, topo_id):
+        sql_api.provision_touch(topo_id)
+
+    def provision_finish(self, topo_id, state):
+        sql_api.provision_finish(topo_id, state)
+
+    def operation_finish_provisioned(self, op_id):
+        sql_api.operation_finish_provisioned(op_id)
+
+    def provision_steps_create(self, topo_id, steps):
+        sql_api.provision_steps_create(topo_id, steps)
+
+    def provision_steps_get(self, topo_id):
+        """Returns the checkpointed steps of a topology.
+
+        :returns: set of ``(kind, obj_id)`` task keys.
+
+        """
+        return set((q[0], q[1])
+                   for q in sql_api.provision_steps_get(topo_id))
+
+    def provision_claim_stale(self, token, stale_before):
+        return [ref.to_dict()
+                for ref in sql_api.provision_claim_stale(token, stale_before)]
+
+    ######################### revision #########################
+    def expt_revision_get(self, expt_id):
+        return sql_api.expt_revision_get(expt_id)
+
+    def expt_revisions_bump(self, expt_ids):
+        sql_api.expt_revisions_bump(expt_ids)
+
+    def expt_revision_info(self, expt_id):
+        return sql_api.expt_revision_info(expt_id)
+
+    def expt_revisions_info(self, expt_ids):
+        return sql_api.expt_revisions_info(expt_ids)
+
+    def expt_ids_changed_since(self, since, expt_ids=None):
+        return sql_api.expt_ids_changed_since(since, expt_ids)
+
+    def sweep_mark_get(self, name):
+        return sql_api.sweep_mark_get(name)
+
+    def sweep_mark_set(self, name, swept_at):
+        sql_api.sweep_mark_set(name, swept_at)
+
+    ######################### reap #########################
+    def expt_ids_expired(self, now, limit):
+        return sql_api.expt_ids_expired(now, limit)
+
+    def reap_enqueue(self, expt_id, op_id=None):
+        return sql_api.reap_enqueue(expt_id, op_id)
+
+    def reap_record_failure(self, expt_id, error):
+        sql_api.reap_record_failure(expt_id, error)
+
+    def reap_claim(self, token, limit, stale_before):
+        return [ref.to_dict()
+                for ref in sql_api.reap_claim(token, limit, stale_before)]
+
+    def reap_update(self, expt_id, token, values):
+        return sql_api.reap_update(expt_id, token, values)
+
+    ######################### expiry #########################
+    def expire_stats_add(self, counts):
+        sql_api.expire_stats_add(counts)
+
+    def expire_stats_get(self):
+        return sql_api.expire_stats_get()
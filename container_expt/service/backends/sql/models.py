@@ -196,4 +196,172 @@ from terra.vm.backends.sql import models as vm_models
 #                             foreign_keys=mapping_port_id,
 #                             primaryjoin=mapping_port_id == topo_models.CloudPort.id)
 #     real_port_id = Column(Integer, ForeignKey('cloud_port.id'), nullable=False)
-#     cloud_subnet_id = Column(Integer, ForeignKey('cloud_subnet.id'), nullable=False)
\ No newline at end of file
+#     cloud_subnet_id = Column(Integer, ForeignKey('cloud_subnet.id'), nullable=False)
+
+class ContainerQuotaReservation(BASE, TerraBase):
+    """Quota taken from terra for an experiment, one row per reservation.
+
+    A row starts ``reserved`` with an expiry, becomes ``committed`` once
+    its experiment exists and ``releasing`` when it is claimed to be given
+    back; it is ``released`` after terra recycled the quota. ``claim`` is
+    the token of the last claim, so the claimer can read back exactly the
+    rows its UPDATE moved.
+    """
+    __tablename__ = 'container_quota_reservation'
+    __table_args__ = (
+        Index('container_quota_reservation_expt_id_idx', 'expt_id'),
+        Index('container_quota_reservation_state_idx', 'state'),
+        Index('container_quota_reservation_claim_idx', 'claim'),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    uuid = Column(String(36), nullable=False, unique=True)
+    expt_id = Column(Integer, nullable=True)
+    owner_id = Column(String(64), nullable=False)
+    resources = Column(Text, nullable=False)
+    state = Column(String(16), nullable=False, default='reserved')
+    expires_at = Column(DateTime, nullable=True)
+    claim = Column(String(36), nullable=True)
+
+
+class ContainerOperation(BASE, TerraBase):
+    """An experiment create or delete running behind an rpc cast.
+
+    ``phase`` and ``progress`` (0-100) are updated by the worker as it
+    goes; ``result`` holds the json of the experiment once done and
+    ``failure_info`` the error if it failed. ``owner_id`` is the user
+    who started it, the only one besides admins who may read it.
+    """
+    __tablename__ = 'container_operation'
+    __table_args__ = ()
+
+    id = Column(String(36), primary_key=True)
+    action = Column(String(16), nullable=False)
+    expt_id = Column(Integer, nullable=True)
+    phase = Column(String(16), nullable=False, default='pending')
+    progress = Column(Integer, nullable=False, default=0)
+    result = Column(Text, nullable=True)
+    failure_info = Column(String(256), nullable=True)
+    owner_id = Column(String(64), nullable=True)
+
+
+class ContainerExptEvent(BASE, TerraBase):
+    """A provisioning or teardown event of one resource of an experiment.
+
+    ``id`` is the sequence number clients resume from; only the newest
+    events of each experiment are kept.
+    """
+    __tablename__ = 'container_expt_event'
+    __table_args__ = (
+        Index('container_expt_event_expt_id_id_idx', 'expt_id', 'id'),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    expt_id = Column(Integer, nullable=False)
+    resource = Column(String(16), nullable=False)
+    resource_id = Column(String(36), nullable=True)
+    event = Column(String(16), nullable=False)
+    message = Column(String(256), nullable=True)
+
+
+class ContainerProvision(BASE, TerraBase):
+    """The os_create plan of a topology, kept until it is provisioned.
+
+    ``updated_at`` is touched on every checkpoint and by a heartbeat
+    while the worker lives, so a running row that has not moved for a
+    while belongs to a worker that went away. ``attempts`` counts the
+    times it was taken over. ``op_id`` is the create operation completed
+    once all the provisions of its experiments are finished.
+    """
+    __tablename__ = 'container_provision'
+    __table_args__ = (
+        Index('container_provision_state_idx', 'state'),
+    )
+
+    topo_id = Column(Integer, primary_key=True, autoincrement=False)
+    expt_id = Column(Integer, nullable=False)
+    expt_name = Column(String(255), nullable=False)
+    plan = Column(Text().with_variant(MEDIUMTEXT(), 'mysql'), nullable=False)
+    state = Column(String(16), nullable=False, default='running')
+    claim = Column(String(36), nullable=True)
+    op_id = Column(String(36), nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+
+
+class ContainerProvisionStep(BASE, TerraBase):
+    """An os_* step of a topology that completed, e.g. ('network', 3)."""
+    __tablename__ = 'container_provision_step'
+    __table_args__ = (
+        schema.UniqueConstraint('topo_id', 'kind', 'obj_id',
+                                name='uniq_container_provision_step'),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    topo_id = Column(Integer, nullable=False)
+    kind = Column(String(16), nullable=False)
+    obj_id = Column(Integer, nullable=False)
+
+
+class ContainerExptRevision(BASE, TerraBase):
+    """Bumped by every change to an experiment, to key cached payloads."""
+    __tablename__ = 'container_expt_revision'
+    __table_args__ = ()
+
+    expt_id = Column(Integer, primary_key=True, autoincrement=False)
+    revision = Column(BigInteger, nullable=False, default=0)
+
+
+class ContainerLayout(BASE, TerraBase):
+    """Canvas position and type of a subnet or device of a topology.
+
+    Kept out of the json ``other`` column of the subnet, vm and router
+    rows so that reading a topology needs no decoding.
+    """
+    __tablename__ = 'container_layout'
+    __table_args__ = ()
+
+    kind = Column(String(16), primary_key=True)
+    obj_id = Column(Integer, primary_key=True, autoincrement=False)
+    x = Column(Float)
+    y = Column(Float)
+    vtype = Column(Integer, nullable=False, default=0)
+    device_type = Column(Integer)
+
+
+class ContainerReap(BASE, TerraBase):
+    """An experiment deleted by its user whose openstack resources are
+    still to be torn down by the reaper.
+    """
+    __tablename__ = 'container_reap'
+    __table_args__ = (
+        Index('container_reap_state_idx', 'state', 'next_attempt_at'),
+    )
+
+    expt_id = Column(Integer, primary_key=True, autoincrement=False)
+    op_id = Column(String(36))
+    state = Column(String(16), nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False)
+    progress = Column(Integer, nullable=False, default=0)
+    claim = Column(String(36))
+    last_error = Column(String(255))
+
+
+class ContainerExpireStat(BASE, TerraBase):
+    """A running total of the expiry task, shared by all workers."""
+    __tablename__ = 'container_expire_stat'
+    __table_args__ = ()
+
+    name = Column(String(32), primary_key=True)
+    value = Column(BigInteger, nullable=False, default=0)
+
+
+class ContainerSweepMark(BASE, TerraBase):
+    """The time up to which a periodic sweep ran, shared by all workers
+    so that a restart resumes the sweep where it stopped.
+    """
+    __tablename__ = 'container_sweep_mark'
+    __table_args__ = ()
+
+    name = Column(String(32), primary_key=True)
+    swept_at = Column(DateTime, nullable=False)
@@ -12,31 +12,36 @@ from terra.common import port_states, vm_states, vm_operates
 from terra.common.constants import VM_TYPE_DIC, RESOURCE_VM, \
     RESOURCE_CPU, RESOURCE_MEMORY, RESOURCE_DISK, XLAB_OWNER_TYPE, \
     DEVICE_OPERATE_TIMEOUT, PORT_TYPE_DIC, DEVICE_LOCK_NAME, PORT_FIP_LOCK_NAME
-from terra.common.api import has_quotas, consume_quotas, recycle_quotas, \
-    build_driver_hints, get_external_lock_path
+from terra.common.api import build_driver_hints, get_external_lock_path
 from terra.vne_experiment.business.device.vhost import VHost
 from terra.vne_experiment.business.device.vcontroller import VController
 from terra.vne_experiment.business.device.device import Device as VneDevice
+from container_expt.service.business.quota import quota
+from container_expt.service.business.revision import revision
 
 LOG = logging.getLogger(__name__)
 
 
 @dependency.requires('vne_experiment_api',
+                     'experiment_api',
                      'topology_api',
                      'vm_api')
 
 
 class Device(object):
 
-    def __init__(self, context=None, id=None):
+    def __init__(self, context=None, id=None, driver=None):
         self.context = context
         self._device_id = id
+        self.driver = driver
+        self.quota = quota.Quota(driver=driver)
+        self.revision = revision.Revision(driver=driver)
         self.__sync_power_pool = eventlet.GreenPool()
 
     def create(self, values):
+        device_id = None
+        reservation_id = None
         try:
-            device_id = None
-
             # check quota
             resource = dict()
             resource[RESOURCE_VM] = 1
@@ -44,7 +49,7 @@ class Device(object):
             resource[RESOURCE_MEMORY] = int(values['ram'])
             resource[RESOURCE_DISK] = int(values['disk'])
             owner_id = values['owner_id']
-            has_quotas(owner_id, resource)
+            reservation_id = self.quota.reserve(owner_id, resource)
             subnet_id = values.get('connected_subnet_id')
             expt_name = values['expt_name']
             topo_id = values['topo_id']
@@ -61,7 +66,6 @@ class Device(object):
             # else:
             #     port['type'] = PORT_TYPE_DIC['data']
             #     values['data_ports'] = {port_no: port}
-            consume_quotas(owner_id, resource)
             # try:
             #     device_id = self.vne_experiment_api.create_device_data(
             #         self.context, values['expt_name'], values['topo_id'], values)
@@ -108,7 +112,15 @@ class Device(object):
             vm_ref = self.vm_api.create_db_vm(device_values)
 
             device_id = vm_ref['device_id']
+            self.driver.layouts_create('device', {device_id: {
+                'x': extra['coordinate']['x'],
+                'y': extra['coordinate']['y'],
+                'vtype': extra.get('vtype', 0),
+                'device_type': extra['type']}})
             device_values['no'] = vm_ref['id']
+            expt = self.experiment_api.get_by_device(device_id)
+            self.quota.commit(reservation_id, expt['id'])
+            reservation_id = None
 
             port_value = dict()
             port_value['name'] = "%s_port_0" % (values['name'])
@@ -128,9 +140,15 @@ class Device(object):
 
             # create device in backend async
             self.__sync_power_pool.spawn_n(self.create_backend, self.context, values, port)
+            self.revision.bump(expt['id'])
             return {'id': device_id}
 
         except Exception as ex:
+            if reservation_id:
+                try:
+                    self.quota.release(reservation_id)
+                except Exception as release_ex:
+                    LOG.exception(release_ex)
             if device_id:
                 device = self.topology_api.get_device_detail(device_id)
                 if device:
@@ -169,6 +187,16 @@ class Device(object):
                 self.vne_experiment_api. \
                     device_operate_failed_and_change_expt_state(
                         device_ref['obj_id'], vm_states.ERROR, None, str(ex))
+        self._bump_revision(device_id)
+
+    def _bump_revision(self, device_id):
+        try:
+            expt = self.experiment_api.get_by_device(device_id)
+        except Exception as ex:
+            LOG.exception(ex)
+            return
+        if expt:
+            self.revision.bump(expt['id'])
 
     def delete(self, need_update_operate=True):
         device = self.topology_api.get_device_detail(self._device_id)
@@ -219,6 +247,7 @@ class Device(object):
                     self.vm_api.update_os_vm(cloud_os_vm['id'], _updates)
 
             _delete_os_vm()
+            self._bump_revision(self._device_id)
         except Exception as ex:
             LOG.exception(ex)
             self.vne_experiment_api.\
@@ -0,0 +1,82 @@
+""" Progress events of the resources of an experiment. """
+
+import time
+
+import eventlet
+from oslo_config import cfg
+from oslo_log import log as logging
+
+event_opts = [
+    cfg.IntOpt('container_expt_event_limit',
+               default=500,
+               help='Number of the newest progress events kept for each '
+                    'experiment.'),
+    cfg.IntOpt('container_expt_event_max_wait',
+               default=30,
+               help='Maximum number of seconds an events request waits for '
+                    'new events.'),
+    cfg.FloatOpt('container_expt_event_poll_interval',
+                 default=1.0,
+                 help='Seconds between checks for new events while an '
+                      'events request waits.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(event_opts)
+LOG = logging.getLogger(__name__)
+
+CREATED = 'created'
+SCHEDULED = 'scheduled'
+DELETED = 'deleted'
+EXPIRED = 'expired'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+
+class Event(object):
+
+    def __init__(self, driver=None):
+        self.driver = driver
+
+    def emit(self, expt_id, resource, resource_id, event, message=None):
+        self.emit_many(expt_id, [(resource, resource_id, event, message)])
+
+    def emit_many(self, expt_id, events):
+        """Records ``(resource, resource_id, event, message)`` tuples.
+
+        Events are best effort; failing to record one never fails the
+        operation that emits it.
+        """
+        if not events:
+            return
+        values = [{'resource': resource,
+                   'resource_id': None if resource_id is None
+                   else str(resource_id),
+                   'event': event,
+                   'message': message and str(message)[:256]}
+                  for resource, resource_id, event, message in events]
+        try:
+            self.driver.expt_events_create(
+                expt_id, values, max(CONF.container_expt_event_limit, 1))
+        except Exception as ex:
+            LOG.exception(ex)
+
+    def since(self, expt_id, since=0, wait=0, limit=100):
+        """Returns the events after sequence number ``since``.
+
+        If there are none yet, waits up to ``wait`` seconds for some.
+        """
+        wait = min(max(wait, 0), CONF.container_expt_event_max_wait)
+        deadline = time.time() + wait
+        while True:
+            events = self.driver.expt_events_get(expt_id, since, limit)
+            if events or time.time() >= deadline:
+                break
+            eventlet.sleep(CONF.container_expt_event_poll_interval)
+        return [{'seq': e['id'],
+                 'resource': e['resource'],
+                 'resource_id': e['resource_id'],
+                 'event': e['event'],
+                 'message': e['message'],
+                 'created_at': e['created_at']}
+                for e in events]
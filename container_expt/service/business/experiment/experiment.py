@@ -1,12 +1,21 @@
+import copy
 import time
 import datetime
 import eventlet
 import json
+from oslo_config import cfg
 from oslo_log import log as logging
 from oslo_utils import timeutils
 from terra import utils
 from terra.common import dependency
 from terra.i18n import _
+from container_expt.service import readmode
+from container_expt.service.business.event import event
+from container_expt.service.business.quota import quota
+from container_expt.service.business.revision import revision
+from container_expt.service.constants import OPERATION_PHASE_DIC, \
+    EXPT_DETAIL_FIELDS
+from container_expt.service.business.topology import taskgraph
 from container_expt.service.business.topology import topology
 from ..device.device import Device
 from terra import exception
@@ -16,14 +25,59 @@ from terra.common.constants import EXPT_OPERATE_DIC, EXPT_STATE_DIC, \
     RESOURCE_EXPERIMENT, RESOURCE_VM, RESOURCE_CPU, RESOURCE_MEMORY, \
     RESOURCE_DISK, VM_TYPE_DIC, EXPT_OPERATE_TIMEOUT, XLAB_OWNER_TYPE, \
     RESOURCE_ROUTER, RESOURCE_SUBNET
-from terra.common.api import has_quotas, consume_quotas, recycle_quotas
-from terra.common.api import build_driver_hints, get_external_lock_path
+from terra.common.api import get_external_lock_path
 import re
 
 
+batch_opts = [
+    cfg.IntOpt('container_batch_max',
+               default=200,
+               help='Maximum number of experiments one batch create may '
+                    'ask for.'),
+    cfg.IntOpt('container_batch_concurrency',
+               default=10,
+               help='Maximum number of experiments of a batch written to '
+                    'the database at the same time.'),
+    cfg.IntOpt('container_batch_provision_concurrency',
+               default=32,
+               help='Maximum number of networks, routers, ports and vms '
+                    'created in openstack at the same time for all the '
+                    'experiments of a batch together.'),
+]
+
+delete_opts = [
+    cfg.IntOpt('container_delete_concurrency',
+               default=10,
+               help='Maximum number of vms and routers of an experiment '
+                    'deleted from openstack at the same time.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(batch_opts)
+CONF.register_opts(delete_opts)
 LOG = logging.getLogger(__name__)
 
 
+def _pop_layout(ref):
+    """Pops the layout and the json ``other`` of a subnet or device.
+
+    Rows created before container_layout existed and missed by its
+    backfill have no layout; for those the coordinates still come from
+    ``other``.
+    """
+    layout = ref.pop('layout', None)
+    other = ref.pop('other', None)
+    if layout is not None:
+        return layout
+    other = json.loads(other or '{}')
+    layout = {'vtype': other.get('vtype', 0)}
+    if 'coordinate' in other:
+        coordinate = other.get('coordinate', {})
+        layout['x'] = coordinate.get('x', 0)
+        layout['y'] = coordinate.get('y', 0)
+    return layout
+
+
 @dependency.requires('vne_experiment_api',
                      'experiment_api',
                      'vm_api',
@@ -33,13 +87,16 @@ class Experiment(object):
 
     def __init__(self, context=None, expt_id=None, driver=None):
         self.expt_id = expt_id
-        self.topo = topology.Topology(context=context)
+        self.topo = topology.Topology(context=context, driver=driver)
+        self.quota = quota.Quota(driver=driver)
+        self.events = event.Event(driver=driver)
+        self.revision = revision.Revision(driver=driver)
         self.context = context
         self.driver = driver
         self._sync_power_pool = eventlet.GreenPool()
 
-    def _recycle_expt_quota(self, expt, devices, cloud_subnets,
-                            need_rollback=False):
+    def _expt_quota_usage(self, expt, devices, cloud_subnets):
+        """Resources still held by an experiment, per owner."""
         expt_owner = expt['owner_id']
         user_res = dict()
         user_res[expt_owner] = {
@@ -92,52 +149,38 @@ class Experiment(object):
         #         continue
         #     user_res[owner_id][RESOURCE_SUBNET] += 1
 
-        expt_name = expt['name']
-        for owner_id in user_res:
-            if need_rollback:
-                LOG.info('container experiment delete.name:%s consume quotas:%s'
-                         % (expt_name, user_res))
-                consume_quotas(owner_id, user_res[owner_id])
-            else:
-                LOG.info('container experiment delete.name:%s recycle quotas:%s'
-                         % (expt_name, user_res))
-                recycle_quotas(owner_id, user_res[owner_id])
+        return user_res
 
-    def create(self, values):
+    def create(self, values, progress=None, op_id=None):
+        """Creates the experiment rows and starts provisioning them.
+
+        ``progress(phase, percent)`` is called as the create goes, for
+        callers that report on it while it runs. The provisions are
+        tied to the operation ``op_id``, if given, which the last of
+        them to finish completes.
+        """
+        report = progress or (lambda phase, percent: None)
         owner_id = values['owner_id']
         owner_name = values['owner_name']
         expt_name = values['name']
-        has_consume_quotas = False
-        expt_id = None
+        reservation_id = None
         try:
             topos_dic = values['topos']
             resources = self._get_expt_resources(topos_dic)
             if resources[RESOURCE_SUBNET] > 5:
                 raise exception.SubnetLimitExceeded()
             resources.pop(RESOURCE_SUBNET)
-            has_quotas(owner_id, resources)
-            LOG.info('***experiment create.name:%s consume quotas:%s' %
+            report(OPERATION_PHASE_DIC['reserving'], 10)
+            LOG.info('***experiment create.name:%s reserve quotas:%s' %
                      (expt_name, resources))
-            consume_quotas(owner_id, resources)
-            has_consume_quotas = True
+            reservation_id = self.quota.reserve(owner_id, resources)
 
             # sync external network
             self._sync_ext_network(owner_id, owner_name, XLAB_OWNER_TYPE)
 
-            # create record in the terra experiment database
-            expt_ref = self._create_experiment_data(values)
-
-            expt_id = expt_ref['id']
-            for topo_dic in topos_dic:
-                # create record in the terra topology database
-                self.topo.create(self.context, expt_id, expt_name,
-                                 owner_id, owner_name, topo_dic)
-
-            for topo_dic in topos_dic:
-                self._sync_power_pool.spawn_n(self.topo.os_create, self.context,
-                                              topo_dic, expt_id, expt_name)
-
-            return expt_ref
+            report(OPERATION_PHASE_DIC['materializing'], 30)
+            return self._materialize(values, reservation_id, report,
+                                     op_id=op_id)
         # except (exception.ExperimentExist, exception.CreateExperimentFailed):
         #     if resources:
         #         LOG.info('***experiment create.name:%s recycle quotas:%s' %
@@ -146,27 +189,131 @@ class Experiment(object):
         #     raise
         except Exception as ex:
             LOG.exception(ex)
-            if resources and has_consume_quotas:
-                LOG.info('***experiment create.name:%s recycle quotas:%s' %
+            if reservation_id:
+                LOG.info('***experiment create.name:%s release quotas:%s' %
                          (expt_name, resources))
-                if expt_id:
-                    self.experiment_api.update_experiment(
-                        expt_id, {'has_recycle': True})
-                    devices = self.experiment_api.devices_get(expt_id)
-                    vm_ids = [device['cloud_vm_id']
-                              for device in devices
-                              if not device['is_service']]
-                    self.vm_api.db_vm_update_recycle_state(vm_ids, True)
                 try:
-                    recycle_quotas(owner_id, resources)
+                    self.quota.release(reservation_id)
+                except Exception as ex:
+                    LOG.exception(ex)
+            raise
+
+    def _materialize(self, values, reservation_id, report, pool=None,
+                     op_id=None):
+        """Writes the experiment and its topologies and starts
+        provisioning them, in ``pool`` if given.
+        """
+        owner_id = values['owner_id']
+        owner_name = values['owner_name']
+        expt_name = values['name']
+        topos_dic = values['topos']
+
+        # create record in the terra experiment database
+        expt_ref = self._create_experiment_data(values)
+
+        expt_id = expt_ref['id']
+        try:
+            self.quota.commit(reservation_id, expt_id)
+            for i, topo_dic in enumerate(topos_dic):
+                # create record in the terra topology database
+                self.topo.create(self.context, expt_id, expt_name,
+                                 owner_id, owner_name, topo_dic, op_id)
+                report(OPERATION_PHASE_DIC['materializing'],
+                       30 + 60 * (i + 1) / len(topos_dic))
+        finally:
+            self.revision.bump(expt_id)
+
+        report(OPERATION_PHASE_DIC['provisioning'], 95)
+        for topo_dic in topos_dic:
+            self._sync_power_pool.spawn_n(self.topo.os_create, self.context,
+                                          topo_dic, expt_id, expt_name,
+                                          pool=pool)
+
+        return expt_ref
+
+    def create_batch(self, values, count, owners=None, progress=None,
+                     op_id=None):
+        """Creates ``count`` copies of one experiment, e.g. for a class.
+
+        The topology is checked and its resources counted once, the quota
+        of all copies is reserved in one step per owner and the external
+        network is synced once. The copies are then written at most
+        container_batch_concurrency at a time, and all of them are
+        provisioned from one pool of container_batch_provision_concurrency.
+        Copy ``i`` is named ``<name>_<i + 1>``.
+
+        :param owners: optional ``[{'owner_id', 'owner_name'}]``, the owner
+                       of each copy; ``count`` is then ignored.
+        :returns: dict with the created ``experiments`` and the ``errors``
+                  of the copies that failed.
+        """
+        report = progress or (lambda phase, percent: None)
+        if not owners:
+            owners = [{'owner_id': values['owner_id'],
+                       'owner_name': values['owner_name']}] * count
+        resources = self._get_expt_resources(values['topos'])
+        if resources[RESOURCE_SUBNET] > 5:
+            raise exception.SubnetLimitExceeded()
+        resources.pop(RESOURCE_SUBNET)
+
+        report(OPERATION_PHASE_DIC['reserving'], 10)
+        owner_copies = {}
+        for i, owner in enumerate(owners):
+            owner_copies.setdefault(owner['owner_id'], []).append(i)
+        reservations = {}
+        try:
+            for owner_id, indexes in owner_copies.items():
+                LOG.info('***experiment create batch.name:%s reserve quotas:'
+                         '%s x %s' % (values['name'], resources, len(indexes)))
+                reservation_ids = self.quota.reserve_many(
+                    owner_id, resources, len(indexes))
+                reservations.update(zip(indexes, reservation_ids))
+            self._sync_ext_network(owners[0]['owner_id'],
+                                   owners[0]['owner_name'], XLAB_OWNER_TYPE)
+        except Exception as ex:
+            LOG.exception(ex)
+            for reservation_id in reservations.values():
+                try:
+                    self.quota.release(reservation_id)
                 except Exception as ex:
                     LOG.exception(ex)
-                    if expt_id:
-                        self.experiment_api.update_experiment(
-                            expt_id, {'has_recycle': False})
-                        self.vm_api.db_vm_update_recycle_state(vm_ids, False)
             raise
 
+        report(OPERATION_PHASE_DIC['materializing'], 30)
+        provision_pool = eventlet.GreenPool(
+            CONF.container_batch_provision_concurrency)
+
+        def no_report(phase, percent):
+            pass
+
+        def create_copy(i):
+            copy_values = copy.deepcopy(values)
+            copy_values.update(owners[i])
+            copy_values['name'] = '%s_%s' % (values['name'], i + 1)
+            try:
+                experiment = Experiment(context=self.context,
+                                        driver=self.driver)
+                return True, experiment._materialize(
+                    copy_values, reservations[i], no_report, provision_pool,
+                    op_id)
+            except Exception as ex:
+                LOG.exception(ex)
+                try:
+                    self.quota.release(reservations[i])
+                except Exception as release_ex:
+                    LOG.exception(release_ex)
+                return False, {'index': i, 'name': copy_values['name'],
+                               'error': str(ex)}
+
+        ret = {'experiments': [], 'errors': []}
+        pool = eventlet.GreenPool(CONF.container_batch_concurrency)
+        for i, (ok, result) in enumerate(pool.imap(create_copy,
+                                                   range(len(owners)))):
+            ret['experiments' if ok else 'errors'].append(result)
+            report(OPERATION_PHASE_DIC['materializing'],
+                   30 + 65 * (i + 1) / len(owners))
+        return ret
+
     def _get_expt_resources(self, topos_data):
         _vm_count = 0
         _vm_cpu = 0
@@ -208,10 +355,7 @@ class Experiment(object):
         return self.experiment_api.create(expt_values)
 
     def _sync_ext_network(self, owner_id, owner_name, owner_type):
-        hints = build_driver_hints({'type': 'External',
-                                    'owner_type': XLAB_OWNER_TYPE,
-                                    'from_os': True})
-        external_networks = self.topology_api.db_list_networks(hints=hints)
+        external_networks = self.topo.get_external_networks()
         if len(external_networks) == 0:
             topo_values = {}
             topo_values['name'] = 'sync external network'
@@ -228,295 +372,322 @@ class Experiment(object):
             except:
                 import traceback
                 traceback.print_exc()
-
-    def detail(self):
+            finally:
+                topology.invalidate_external_networks()
+
+    def detail(self, fields=None, stream=False):
+        """Returns the experiment, or only ``fields`` of it; the topology
+        is only loaded when it is asked for. With ``stream`` it is a
+        generator that loads and shapes one topo at a time.
+        """
+        fields = set(fields or EXPT_DETAIL_FIELDS)
         ret = {}
         try:
-            expt = self.experiment_api.get(self.expt_id)
+            if readmode.use_slave():
+                expt = self.driver.expt_get(self.expt_id)
+            else:
+                expt = self.experiment_api.get(self.expt_id)
             if not expt:
                 raise exception.ExperimentNotFound(expt_id=self.expt_id)
-            copy_keys = {'id', 'name', 'description', 'type', 'state',
-                         'operate', 'owner_id', 'owner_name', 'created_at',
-                         'expired_at', 'is_public', 'notes'}
+            copy_keys = fields - {'topology'}
             for key in copy_keys:
                 ret[key] = expt[key]
         except:
             raise
-        ret['topology'] = self.topology_data()
+        if 'topology' in fields:
+            ret['topology'] = self.topology_data(stream=stream)
         return ret
 
-    def topology_data(self):
-        topology_data = []
-        allowed_types = ['router', 'vm', 'host']
+    def topology_data(self, stream=False):
         available_devices = self.get_devices()
         available_device_ids = [int(x['id']) for x in available_devices]
-        try:
-            topos = self.get_topos()
-            for topo in topos:
-                topo_ref = self.topology_api.get_topo_detail(topo['id'])
-                devices = topo_ref['devices']
-                routers = []
-                hosts = []
-                for network in topo_ref['networks']:
-                    subnets = network['subnets']
-                    for subnet in subnets:
-                        other = json.loads(subnet.pop('other', json.dumps({})))
-                        if 'coordinate' in other:
-                            coordinate = other.get('coordinate', {})
-                            subnet['x'] = coordinate.get('x', 0)
-                            subnet['y'] = coordinate.get('y', 0)
-
-                for device in devices:
-                    device_type = device['type'].lower()
-                    if device_type not in allowed_types:
-                        continue
-
-                    # get the subnets device attaches
-                    ports = device.pop('ports', [])
-                    device['attach_subnets'] = []
-                    for port in ports:
-                        port_subnets = port.get('subnets', [])
-                        for port_subnet in port_subnets:
-                            device['attach_subnets'].append(port_subnet['id'])
-                        device['ipaddrs'] = port.get('ipaddrs', '127.0.0.1')
-                        # if port.get('device_owner') == 'network:router_gateway':
-                        #     device['attach_ext'] = True
-                        # else:
-                        #     device['attach_ext'] = False
-
-                    # get the coordinates
-                    other = json.loads(device.pop('other', json.dumps({})))
-                    if 'coordinate' in other:
-                        coordinate = other.get('coordinate', {})
-                        device['x'] = coordinate.get('x', 0)
-                        device['y'] = coordinate.get('y', 0)
-                    device['vtype'] = other.get('vtype', 0)
-                    if device['type'].lower() == 'router':
-                        routers.append(device)
-                    elif device['type'].lower() == 'vm':
-                        if int(device['id']) in available_device_ids:
-                            hosts.append(device)
-                topo_ref['devices'] = hosts
-                topo_ref['routers'] = routers
-                topology_data.append(topo_ref)
-        except:
-            raise
+        if stream:
+            topo_refs = self.driver.expt_topology_iter(self.expt_id,
+                                                       layout=True)
+            return self._shape_topologies(topo_refs, available_device_ids,
+                                          stream=True)
+        topo_refs = self.driver.expt_topology_load(self.expt_id, layout=True)
+        return list(self._shape_topologies(topo_refs, available_device_ids))
+
+    def _shape_topologies(self, topo_refs, available_device_ids,
+                          stream=False):
+        allowed_types = ['router', 'vm', 'host']
+        for topo_ref in topo_refs:
+            devices = topo_ref['devices']
+            routers = []
+            hosts = []
+            for network in topo_ref['networks']:
+                subnets = network['subnets']
+                for subnet in subnets:
+                    layout = _pop_layout(subnet)
+                    if 'x' in layout:
+                        subnet['x'] = layout['x']
+                        subnet['y'] = layout['y']
 
-        return topology_data
+            for device in devices:
+                device_type = device['type'].lower()
+                if device_type not in allowed_types:
+                    continue
 
-    def topology(self):
+                # get the subnets device attaches
+                ports = device.pop('ports', [])
+                device['attach_subnets'] = []
+                for port in ports:
+                    port_subnets = port.get('subnets', [])
+                    for port_subnet in port_subnets:
+                        device['attach_subnets'].append(port_subnet['id'])
+                    device['ipaddrs'] = port.get('ipaddrs', '127.0.0.1')
+                    # if port.get('device_owner') == 'network:router_gateway':
+                    #     device['attach_ext'] = True
+                    # else:
+                    #     device['attach_ext'] = False
+
+                # get the coordinates
+                layout = _pop_layout(device)
+                if 'x' in layout:
+                    device['x'] = layout['x']
+                    device['y'] = layout['y']
+                device['vtype'] = layout.get('vtype', 0)
+                if device['type'].lower() == 'router':
+                    routers.append(device)
+                elif device['type'].lower() == 'vm':
+                    if int(device['id']) in available_device_ids:
+                        hosts.append(device)
+            if stream:
+                # encoded one by one rather than as one big string
+                hosts, routers = iter(hosts), iter(routers)
+            topo_ref['devices'] = hosts
+            topo_ref['routers'] = routers
+            yield topo_ref
+
+    def topology(self, stream=False):
+        """Returns the topologies of the experiment; with ``stream`` they
+        are a generator loading one topo at a time.
+        """
         ret = dict(topos=[])
-        try:
-            topos = self.get_topos()
-            for topo in topos:
-                topo_ref = self.topology_api.get_topo_detail(topo['id'])
-                ret['topos'].append(topo_ref)
-            ret['id'] = self.expt_id
-        except:
-            raise
-
+        if stream:
+            ret['topos'] = self.driver.expt_topology_iter(self.expt_id)
+        else:
+            ret['topos'] = self.driver.expt_topology_load(self.expt_id)
+        ret['id'] = self.expt_id
         return ret
 
     def get_topos(self):
         topos = self.experiment_api.get_topos(self.expt_id)
         return topos
 
-    def delete(self):
+    def delete(self, op_id=None):
+        """Tombstones the experiment and queues its teardown.
+
+        Under the experiment lock its quota is released and its operate
+        set to deleting, which hides it from the listing; the openstack
+        resources are left to the reaper, which calls ``reap``. Quota is
+        given back from the ledger by experiment id, so the devices are
+        only read for experiments created before the ledger. Deleting
+        an experiment already deleting only queues it again if its last
+        teardown is over; while one is queued or running, the operation
+        ``op_id`` is done at once and the teardown left to its own.
+
+        :returns: the quota given back, per owner, from the ledger rows
+                  released; empty when the experiment was already
+                  deleting.
+        """
         try:
-            # get all device in expt
-            db_devices = self.get_devices()
-            devices = []
-            vm_ids = []
-            for d in db_devices:
-                devices.append(d)
-                if d['is_service']:
-                    continue
-                vm_ids.append(d['cloud_vm_id'])
-
-            # update network and subnet state to deleting
-            topo_id = self.get_topos()[0]['id']
-            cloud_subnets = []
-            hints = build_driver_hints({'topo_id': topo_id})
-            networks = self.topology_api.db_list_networks(hints=hints)
-            for network in networks:
-                hints = build_driver_hints({'network_id': network['id']})
-                subnets = self.topology_api.db_list_subnets(hints=hints)
-                for subnet in subnets:
-                    cloud_subnets.append(subnet)
-
             @utils.synchronized(self.expt_id,
                                 external=True,
                                 lock_path=get_external_lock_path())
-            def do_recycle_expt(devices, vm_ids, cloud_subnets):
+            def do_recycle_expt():
                 expt = self.experiment_api.get(self.expt_id)
-                # recycle all resources about expt
-                if expt['operate'] != EXPT_OPERATE_DIC['deleting']:
-                    self.experiment_api.update_experiment(
-                        self.expt_id, {'has_recycle': True})
-                    self.vm_api.db_vm_update_recycle_state(vm_ids, True)
-                    result = False
-                    retry_count = 3
-                    while retry_count > 0 and not result:
-                        try:
-                            self._recycle_expt_quota(expt, devices,
-                                                     cloud_subnets)
-                            result = True
-                        except Exception as ex:
-                            LOG.exception(ex)
-                            retry_count -= 1
-                            if retry_count == 0:
-                                self.vm_api.db_vm_update_recycle_state(
-                                    vm_ids, False)
-                                self.experiment_api.update_experiment(
-                                    self.expt_id, {'has_recycle': False})
-                                raise
-                            eventlet.sleep(1)
-                    self.update_state(None, EXPT_OPERATE_DIC['deleting'])
-
-            do_recycle_expt(devices, vm_ids, cloud_subnets)
-
-            # update device state to deleting
-            # for device in devices:
-            #     if device['is_service']:
-            #         continue
-            #     try:
-            #         LOG.info('***container expt delete device. vm_id: %s' %
-            #                  device['cloud_vm_id'])
-            #         self.vm_api.db_update_vm(
-            #             None, device['cloud_vm_id'],
-            #             {'operate': vm_operates.DELETING})
-            #     except Exception as ex:
-            #         LOG.exception(ex)
-            #         pass
-
-            # update router service state to deleting
-            routers = self.topology_api.db_get_routers_in_topo(topo_id)
-            for router in routers:
-                try:
-                    self.topology_api.db_update_router(
-                        router['id'], {'state': router_states.DELETING})
-                except Exception as ex:
-                    LOG.exception(ex)
-                    pass
-
-            # update network and subnet state to deleting
-            for network in networks:
-                network_id = network['id']
-                try:
-                    self.topology_api.db_update_network(
-                        network_id, {'state': network_states.DELETING})
-                except Exception as ex:
-                    LOG.exception(ex)
-                    pass
-            for subnet in cloud_subnets:
-                try:
-                    self.topology_api.db_update_subnet(
-                        subnet['id'], {'state': subnet_states.DELETING})
-                except Exception as ex:
-                    LOG.exception(ex)
-                    pass
-
-            # update port state to deleting
-            ports = self.experiment_api.ports_get(self.expt_id)
-            for port in ports:
-                try:
-                    self.topology_api.db_update_port(
-                        port['id'], {'state': port_states.DELETING})
-                except Exception:
-                    pass
+                released = {}
 
-            # self.update_state(None, EXPT_OPERATE_DIC['deleting'])
+                def usage():
+                    return self._expt_quota_usage(expt, self.get_devices(),
+                                                  [])
 
-            # delete backent devices, ports, networks and subnets async
-            self._sync_power_pool.spawn_n(self._delete_async, self.context,
-                                          self.expt_id, devices, routers,
-                                          networks, cloud_subnets)
+                # recycle all resources about expt; quota that terra fails
+                # to take back stays claimed and is retried by reclaim
+                if expt['operate'] != EXPT_OPERATE_DIC['deleting']:
+                    released = self.quota.release_expt(self.expt_id, usage)
+                    self.update_state(None, EXPT_OPERATE_DIC['deleting'])
+                if not self.driver.reap_enqueue(self.expt_id, op_id) and \
+                        op_id:
+                    self.driver.operation_update(
+                        op_id, {'phase': OPERATION_PHASE_DIC['done'],
+                                'progress': 100})
+                return released
+
+            released = do_recycle_expt()
+            self.revision.bump(self.expt_id)
+            return released
         except Exception as ex:
             LOG.exception('delete experiment %s failed.' % self.expt_id)
             self.experiment_api.expt_operate_failed(self.expt_id, str(ex))
-            import traceback
-            traceback.print_exc()
+            self.revision.bump(self.expt_id)
+            raise
 
-    def _delete_async(self, context, expt_id, devices,
-                      routers, networks, subnets):
+    def reap(self, progress=None):
+        """Tears down the openstack resources of a deleted experiment.
+
+        Safe to run again after a failure: resources already gone are
+        skipped by the teardown.
+
+        :param progress: called with the resources done and the total.
+        :returns: the error message of the teardown, or None.
+        """
+        devices = self.get_devices()
+
+        # move routers, networks, subnets and ports of every topology
+        # to deleting, all in one transaction
+        topo_ids = [topo['id'] for topo in self.get_topos()]
+        marked = self.driver.topos_mark_deleting(
+            topo_ids, {'router': router_states.DELETING,
+                        'network': network_states.DELETING,
+                        'subnet': subnet_states.DELETING,
+                        'port': port_states.DELETING})
+        return self._teardown(self.context, self.expt_id, devices,
+                              marked['routers'], marked['networks'],
+                              marked['subnets'], progress)
+
+    def _teardown(self, context, expt_id, devices, routers, networks,
+                  subnets, progress=None):
         LOG.info("delete experiment")
         LOG.info("devices:%s \n routers:%s \n networks:%s \n subnets:%s" % (
             devices, routers, networks, subnets))
 
+        errors = {'expt': '', 'high_priority': ''}
+
+        # delete devices, and routers as soon as their subnets are
+        # free of vms
+        graph = self._teardown_graph(context, expt_id, devices, routers,
+                                     errors, progress)
+        graph.run()
+        expt_error_msg = errors['expt']
+        high_priority_error_msg = errors['high_priority']
+
+        # # delete subnet and attach ports
+        # for subnet in subnets:
+        #     try:
+        #         self.topology_api.os_delete_subnet(context, subnet['id'])
+        #     except exception.SubnetNotFound:
+        #         pass
+        #     except Exception as ex:
+        #         LOG.exception(ex)
+        #         if not expt_error_msg:
+        #             expt_error_msg = str(ex)
+        #
+        # # delete network
+        # for network in networks:
+        #     try:
+        #         self.topology_api.os_delete_network(
+        #             context, network['id'])
+        #     except exception.NetworkNotFound:
+        #         pass
+        #     except Exception as ex:
+        #         LOG.exception(ex)
+        #         if not expt_error_msg:
+        #             expt_error_msg = str(ex)
+
+        if high_priority_error_msg:
+            expt_error_msg = high_priority_error_msg
+        if not expt_error_msg:
+            self.events.emit(expt_id, 'experiment', expt_id, event.DELETED)
+        self.revision.bump(expt_id)
+        # self.experiment_api.delete(self.expt_id)
+        # self.experiment_api.update_experiment(
+        #     self.expt_id, {'has_recycle': True})
+        return expt_error_msg or None
+
+    def _teardown_graph(self, context, expt_id, devices, routers, errors,
+                        progress=None):
+        """Builds the teardown of an experiment into a task graph.
+
+        Vms are deleted concurrently. A router waits for the vms on the
+        subnets it attaches to, whose floating ips and ports go through
+        it, but not for the others; when the subnets are not known it
+        waits for all the vms. A failed vm does not stop its routers.
+
+        Failures are collected in ``errors`` like the serial teardown
+        did: the last ConnectionOSError of a vm in 'high_priority', else
+        the first other error in 'expt'. ``progress(done, total)``, if
+        given, is called as each vm or router finishes.
+        """
+        finished = []
+
+        def listener(key, ok, value):
+            kind, obj_id = key
+            finished.append(key)
+            if progress is not None:
+                progress(len(finished), len(graph))
+            if ok:
+                self.events.emit(expt_id, kind, obj_id, event.DELETED)
+                return
+            # the tasks log their own tracebacks
+            if kind == 'vm' and isinstance(value, exception.ConnectionOSError):
+                errors['high_priority'] = str(value)
+            elif not errors['expt']:
+                errors['expt'] = str(value)
+            self.events.emit(expt_id, kind, obj_id, event.FAILED, value)
+
+        graph = taskgraph.TaskGraph(size=CONF.container_delete_concurrency,
+                                    listener=listener)
+        for device in devices:
+            if device['is_service']:
+                continue
+            graph.add(('vm', device['id']), self._teardown_device,
+                      (context, device['id']))
+
+        router_subnets, vm_subnets = self._teardown_subnets(expt_id)
+        vm_keys = [('vm', device_id) for device_id in vm_subnets
+                   if ('vm', device_id) in graph]
+        all_vm_keys = [('vm', device['id']) for device in devices
+                       if ('vm', device['id']) in graph]
+        for rt in routers:
+            if rt['id'] in router_subnets:
+                subnet_ids = router_subnets[rt['id']]
+                after = [key for key in vm_keys
+                         if vm_subnets[key[1]] & subnet_ids]
+            else:
+                after = all_vm_keys
+            graph.add(('router', rt['id']), self._teardown_router,
+                      (rt['id'],), after=after)
+        return graph
+
+    def _teardown_device(self, context, device_id):
         try:
-            expt_error_msg = ''
-            high_priority_error_msg = ''
+            Device(context=context, id=device_id, driver=self.driver).delete()
+        except exception.ConnectionOSError:
+            raise
+        except Exception as ex:
+            LOG.exception(ex)
+            raise
 
-            # delete devices
-            for device in devices:
-                if device['is_service']:
-                    continue
-                # if device['uuid']:
-                #     try:
-                #         vm_id = device['cloud_vm_id']
-                #         self.vm_api.delete_os_vm(vm_id)
-                #         cloud_os_vm = self.vm_api.get_os_vm_by_vmid(vm_id)
-                #         if cloud_os_vm:
-                #             updates = {'operate': vm_operates.DELETING}
-                #             self.vm_api.update_os_vm(cloud_os_vm['id'], updates)
-                #     except Exception as ex:
-                #         LOG.exception(ex)
-                #         if not expt_error_msg:
-                #             expt_error_msg = str(ex)
-                try:
-                    device_cls = Device(context=context, id=device['id'])
-                    device_cls.delete()
-                except exception.ConnectionOSError as ex:
-                    high_priority_error_msg = str(ex)
-                except Exception as ex:
-                    LOG.exception(ex)
-                    if not expt_error_msg:
-                        expt_error_msg = str(ex)
+    def _teardown_router(self, router_id):
+        try:
+            self.topology_api.os_delete_router(None, router_id)
+        except Exception as ex:
+            LOG.exception(ex)
+            raise
 
-            # remove interface router and delete router.
-            for rt in routers:
-                try:
-                    self.topology_api.os_delete_router(None, rt['id'])
-                except Exception as ex:
-                    LOG.exception(ex)
-                    if not expt_error_msg:
-                        expt_error_msg = str(ex)
-
-            # # delete subnet and attach ports
-            # for subnet in subnets:
-            #     try:
-            #         self.topology_api.os_delete_subnet(context, subnet['id'])
-            #     except exception.SubnetNotFound:
-            #         pass
-            #     except Exception as ex:
-            #         LOG.exception(ex)
-            #         if not expt_error_msg:
-            #             expt_error_msg = str(ex)
-            #
-            # # delete network
-            # for network in networks:
-            #     try:
-            #         self.topology_api.os_delete_network(
-            #             context, network['id'])
-            #     except exception.NetworkNotFound:
-            #         pass
-            #     except Exception as ex:
-            #         LOG.exception(ex)
-            #         if not expt_error_msg:
-            #             expt_error_msg = str(ex)
-
-            if high_priority_error_msg:
-                expt_error_msg = high_priority_error_msg
-            if expt_error_msg:
-                self.experiment_api.expt_operate_failed(
-                    expt_id, expt_error_msg)
-            # self.experiment_api.delete(self.expt_id)
-            # self.experiment_api.update_experiment(
-            #     self.expt_id, {'has_recycle': True})
+    def _teardown_subnets(self, expt_id):
+        """Returns the subnet ids of each router, by router id, and of
+        each vm, by device id; both are empty if they cannot be read.
+        """
+        router_subnets = {}
+        vm_subnets = {}
+        try:
+            for topo in self.driver.expt_topology_load(expt_id):
+                for device in topo['devices']:
+                    subnet_ids = set(subnet['id']
+                                     for port in device['ports']
+                                     for subnet in port['subnets'])
+                    if device['type'].lower() == 'router':
+                        router_subnets[device['obj_id']] = subnet_ids
+                    else:
+                        vm_subnets[device['id']] = subnet_ids
         except Exception as ex:
-            self.experiment_api.expt_operate_failed(expt_id, str(ex))
-            LOG.exception('delete experiment %s failed. msg: %s' %
-                          (expt_id, str(ex)))
+            LOG.exception(ex)
+            return {}, {}
+        return router_subnets, vm_subnets
 
     def _operate_failed(self, model_obj, obj_id, err_msg):
         model_obj.id = obj_id
@@ -558,6 +729,7 @@ class Experiment(object):
                             expt_state = EXPT_STATE_DIC['running']
                     if not has_error_device:
                         self.experiment_api.update_state(expt_state, None)
+            self.revision.bump(expt_id)
         except:
             pass
 
@@ -589,6 +761,7 @@ class Experiment(object):
         #     self.vm_api.update_os_vm(device['cloud_os_vm_id'],
         #                              {'operate': vm_operates.REBOOTING})
         self.vne_experiment_api.expt_restart(self.expt_id)
+        self.revision.bump(self.expt_id)
 
     def start(self):
         # self.experiment_api.update_state(self.expt_id,
@@ -609,6 +782,7 @@ class Experiment(object):
         #     self.vm_api.update_os_vm(device['cloud_os_vm_id'],
         #                              {'operate': vm_operates.POWERING_ON})
         self.vne_experiment_api.expt_start(self.expt_id)
+        self.revision.bump(self.expt_id)
 
     def stop(self):
         # self.experiment_api.update_state(self.expt_id,
@@ -628,3 +802,4 @@ class Experiment(object):
         #     self.vm_api.update_os_vm(device['cloud_os_vm_id'],
         #                              {'operate': vm_operates.POWERING_OFF})
         self.vne_experiment_api.expt_stop(self.expt_id)
+        self.revision.bump(self.expt_id)
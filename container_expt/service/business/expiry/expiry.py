@@ -0,0 +1,112 @@
+""" Deletion of experiments past their expired_at.
+
+Each run reads a batch of expired experiments through the
+(deleted, expired_at) index and deletes them like a user would, at most
+``container_expire_concurrency`` at a time: the delete tombstones the
+experiment, releases its quota and queues it for the reaper, which
+tears down its openstack resources. The quota the ledger gave back and
+the deletes that failed are added to the totals in the
+container_expire_stat table, shared by all workers and kept across
+restarts. A delete that fails is recorded as a failed reap row, so that
+it is not picked again ahead of the other expired experiments.
+"""
+
+import collections
+
+import eventlet
+from oslo_config import cfg
+from oslo_log import log as logging
+from oslo_utils import timeutils
+from terra.common.constants import RESOURCE_EXPERIMENT, RESOURCE_VM, \
+    RESOURCE_CPU, RESOURCE_MEMORY, RESOURCE_DISK
+
+from container_expt.service.business.event import event
+from container_expt.service.business.experiment.experiment import Experiment
+
+expire_opts = [
+    cfg.IntOpt('container_expire_batch',
+               default=50,
+               help='Most expired experiments deleted by one run of the '
+                    'expiry task.'),
+    cfg.IntOpt('container_expire_concurrency',
+               default=5,
+               help='Most expired experiments deleted at the same time.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(expire_opts)
+LOG = logging.getLogger(__name__)
+
+# the capacity counted, as named in the stats
+RESOURCES = (('experiments', RESOURCE_EXPERIMENT),
+             ('vms', RESOURCE_VM),
+             ('cpus', RESOURCE_CPU),
+             ('memory', RESOURCE_MEMORY),
+             ('disk', RESOURCE_DISK))
+
+
+def _released(released):
+    """Adds up the quota given back for all owners, by stats name."""
+    return collections.Counter(
+        dict((name, sum(res.get(resource, 0) for res in released.values()))
+             for name, resource in RESOURCES))
+
+
+class Expiry(object):
+
+    def __init__(self, context=None, driver=None):
+        self.context = context
+        self.driver = driver
+        self.events = event.Event(driver=driver)
+
+    def stats(self):
+        """Returns the totals of all runs, of all workers."""
+        return self.driver.expire_stats_get()
+
+    def run(self, context=None):
+        """Deletes a batch of expired experiments.
+
+        :returns: the counts of this run: the experiments, vms, cpus,
+                  memory and disk released, and the deletes that failed.
+        """
+        context = context or self.context
+        limit = max(CONF.container_expire_batch, 1)
+        expt_ids = self.driver.expt_ids_expired(timeutils.utcnow(), limit)
+        run = collections.Counter()
+        if not expt_ids:
+            return run
+        pool = eventlet.GreenPool(max(CONF.container_expire_concurrency, 1))
+        for released in pool.imap(lambda expt_id: self._expire(context,
+                                                               expt_id),
+                                  expt_ids):
+            if released is None:
+                run['failed'] += 1
+            else:
+                run.update(released)
+        LOG.info('expired experiments: %s' % dict(run))
+        try:
+            self.driver.expire_stats_add(run)
+        except Exception as ex:
+            LOG.exception(ex)
+        return run
+
+    def _expire(self, context, expt_id):
+        """Deletes an expired experiment.
+
+        :returns: the quota released, or None if the delete failed.
+        """
+        try:
+            released = Experiment(context=context, expt_id=expt_id,
+                                  driver=self.driver).delete()
+        except Exception as ex:
+            LOG.exception('delete expired experiment %s failed.' % expt_id)
+            try:
+                self.driver.reap_record_failure(
+                    expt_id, str(ex) or ex.__class__.__name__)
+            except Exception as record_ex:
+                LOG.exception(record_ex)
+            return None
+        released = _released(released)
+        self.events.emit(expt_id, 'experiment', expt_id, event.EXPIRED,
+                         'released %s' % dict(released))
+        return released
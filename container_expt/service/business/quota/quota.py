@@ -0,0 +1,165 @@
+""" Quota reservations taken from terra on behalf of experiments. """
+
+import datetime
+import json
+import uuid
+
+from oslo_config import cfg
+from oslo_log import log as logging
+from oslo_utils import timeutils
+from terra import utils
+from terra.common.api import has_quotas, consume_quotas, recycle_quotas, \
+    get_external_lock_path
+from terra.common.constants import RESOURCE_EXPERIMENT
+
+quota_opts = [
+    cfg.IntOpt('container_quota_reservation_expire',
+               default=600,
+               help='Seconds a quota reservation may stay uncommitted '
+                    'before its quota is given back to the owner.'),
+    cfg.IntOpt('container_quota_release_retry',
+               default=60,
+               help='Seconds before a release whose quota could not be '
+                    'recycled is tried again.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(quota_opts)
+LOG = logging.getLogger(__name__)
+
+QUOTA_LOCK_NAME = 'container_quota_'
+
+
+class ReservationExpired(Exception):
+    """The reservation expired and its quota was given back."""
+
+
+class Quota(object):
+    """Reserve, commit and release quota through the reservation ledger.
+
+    Terra quota is consumed once when a reservation is made and recycled
+    once when the reservation is released. Each step past the reserve is
+    a single conditional UPDATE on the ledger, so concurrent deletes and
+    the reclaim task can never recycle the same reservation twice.
+    """
+
+    def __init__(self, driver=None):
+        self.driver = driver
+
+    def reserve(self, owner_id, resources):
+        """Takes ``resources`` from the quota of ``owner_id``.
+
+        :returns: the reservation uuid, to be committed before it expires.
+        """
+        return self.reserve_many(owner_id, resources, 1)[0]
+
+    def reserve_many(self, owner_id, resources, count):
+        """Takes ``count`` times ``resources`` in one step.
+
+        :returns: ``count`` reservation uuids, each committed on its own.
+        """
+        total = dict((key, value * count) for key, value in resources.items())
+
+        @utils.synchronized(QUOTA_LOCK_NAME + str(owner_id),
+                            external=True,
+                            lock_path=get_external_lock_path())
+        def _consume():
+            has_quotas(owner_id, total)
+            consume_quotas(owner_id, total)
+
+        _consume()
+        expires_at = timeutils.utcnow() + datetime.timedelta(
+            seconds=CONF.container_quota_reservation_expire)
+        values = [{'uuid': str(uuid.uuid4()),
+                   'owner_id': owner_id,
+                   'resources': json.dumps(resources),
+                   'state': 'reserved',
+                   'expires_at': expires_at} for i in range(count)]
+        try:
+            self.driver.quota_reservations_create(values)
+        except Exception:
+            recycle_quotas(owner_id, total)
+            raise
+        return [v['uuid'] for v in values]
+
+    def commit(self, reservation_id, expt_id):
+        if not self.driver.quota_reservation_commit(reservation_id, expt_id):
+            raise ReservationExpired(
+                'quota reservation %s expired' % reservation_id)
+
+    def release(self, reservation_id):
+        token = str(uuid.uuid4())
+        rows = self.driver.quota_reservation_claim(reservation_id, token)
+        self._recycle(rows, token)
+
+    def release_expt(self, expt_id, usage=None):
+        """Gives back all quota held for an experiment.
+
+        Experiments created before the ledger have no experiment
+        reservation; for them ``usage()``, the per owner resources still
+        held by their devices, is recorded and released instead, less
+        what devices added since hold in the ledger. It is only called
+        for those, so releasing a ledger experiment never reads its
+        devices.
+
+        :returns: the quota recycled, per owner, as summed from the
+                  ledger rows given back; a row whose recycle failed is
+                  left to reclaim and not counted.
+        """
+        token = str(uuid.uuid4())
+        known = self.driver.quota_reservations_get_expt(expt_id)
+        rows = self.driver.quota_reservation_claim_expt(expt_id, token)
+        if usage and not any(RESOURCE_EXPERIMENT in json.loads(r['resources'])
+                             for r in known):
+            usage = usage()
+            for row in known:
+                held = usage.get(row['owner_id'], {})
+                for key, value in json.loads(row['resources']).items():
+                    if key in held:
+                        held[key] -= value
+            for owner_id, resources in usage.items():
+                if not any(resources.values()):
+                    continue
+                rows.append(self.driver.quota_reservation_create({
+                    'uuid': str(uuid.uuid4()),
+                    'expt_id': expt_id,
+                    'owner_id': owner_id,
+                    'resources': json.dumps(resources),
+                    'state': 'releasing',
+                    'claim': token,
+                    'updated_at': timeutils.utcnow()}))
+        released = {}
+        for row in self._recycle(rows, token):
+            held = released.setdefault(row['owner_id'], {})
+            for key, value in json.loads(row['resources']).items():
+                held[key] = held.get(key, 0) + value
+        return released
+
+    def reclaim(self):
+        """Releases expired reservations and retries failed releases."""
+        token = str(uuid.uuid4())
+        retry_before = timeutils.utcnow() - datetime.timedelta(
+            seconds=CONF.container_quota_release_retry)
+        rows = self.driver.quota_reservation_claim_stale(token, retry_before)
+        self._recycle(rows, token)
+        return len(rows)
+
+    def _recycle(self, rows, token):
+        """Recycles the quota of claimed rows.
+
+        :returns: the rows whose quota was given back; a row that fails
+                  stays releasing and is retried by reclaim.
+        """
+        released = []
+        for row in rows:
+            resources = json.loads(row['resources'])
+            LOG.info('container quota release.reservation:%s owner:%s '
+                     'quotas:%s' % (row['uuid'], row['owner_id'], resources))
+            try:
+                recycle_quotas(row['owner_id'], resources)
+                released.append(row)
+            except Exception as ex:
+                LOG.exception(ex)
+        self.driver.quota_reservation_released(
+            [row['id'] for row in released], token)
+        return released
@@ -0,0 +1,169 @@
+""" Background teardown of deleted experiments.
+
+Deleting an experiment only tombstones it and queues it in
+container_reap. The reaper drains that queue: each run claims a few due
+experiments with one conditional UPDATE and tears them down in a green
+pool shared by all runs, so at most ``container_reap_concurrency``
+experiments are torn down at once however many are queued. A failed
+teardown is retried with an exponential backoff; the claim of a reaper
+that died is taken over once it has not moved for
+``container_reap_stale_timeout``.
+"""
+
+import datetime
+import uuid
+
+import eventlet
+from oslo_config import cfg
+from oslo_log import log as logging
+from oslo_utils import timeutils
+from terra.common import dependency
+
+from container_expt.service.business.event import event
+from container_expt.service.business.experiment.experiment import Experiment
+from container_expt.service.business.revision import revision
+from container_expt.service.constants import OPERATION_PHASE_DIC
+
+reap_opts = [
+    cfg.IntOpt('container_reap_batch',
+               default=20,
+               help='Most deleted experiments claimed by one run of the '
+                    'reaper.'),
+    cfg.IntOpt('container_reap_concurrency',
+               default=4,
+               help='Most deleted experiments torn down at the same time '
+                    'by a worker.'),
+    cfg.IntOpt('container_reap_max_attempts',
+               default=5,
+               help='Attempts at tearing down a deleted experiment before '
+                    'it is left failed.'),
+    cfg.IntOpt('container_reap_retry_interval',
+               default=30,
+               help='Seconds before the first retry of a failed teardown; '
+                    'doubled at each further attempt.'),
+    cfg.IntOpt('container_reap_stale_timeout',
+               default=900,
+               help='Seconds after which a teardown that stopped reporting '
+                    'progress is taken over by another reaper.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(reap_opts)
+LOG = logging.getLogger(__name__)
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+@dependency.requires('experiment_api')
+class Reaper(object):
+
+    def __init__(self, context=None, driver=None):
+        self.context = context
+        self.driver = driver
+        self.events = event.Event(driver=driver)
+        self.revision = revision.Revision(driver=driver)
+        self._pool = eventlet.GreenPool(max(CONF.container_reap_concurrency,
+                                            1))
+
+    def run(self, context=None):
+        """Claims due experiments and starts tearing them down.
+
+        :returns: the number of experiments claimed.
+        """
+        limit = min(CONF.container_reap_batch, self._pool.free())
+        if limit <= 0:
+            return 0
+        token = str(uuid.uuid4())
+        stale_before = timeutils.utcnow() - datetime.timedelta(
+            seconds=CONF.container_reap_stale_timeout)
+        reaps = self.driver.reap_claim(token, limit, stale_before)
+        for reap in reaps:
+            self._pool.spawn_n(self._reap_one, context or self.context,
+                               reap, token)
+        return len(reaps)
+
+    def _progress(self, reap, token):
+        reported = [reap['progress']]
+
+        def progress(done, total):
+            # only whole percent steps are written
+            percent = 100 * done // total if total else 100
+            if percent <= reported[0]:
+                return
+            reported[0] = percent
+            try:
+                self.driver.reap_update(reap['expt_id'], token,
+                                        {'progress': percent})
+                if reap['op_id']:
+                    self.driver.operation_update(
+                        reap['op_id'], {'progress': percent})
+            except Exception as ex:
+                LOG.exception(ex)
+        return progress
+
+    def _reap_one(self, context, reap, token):
+        expt_id = reap['expt_id']
+        attempts = reap['attempts'] + 1
+        try:
+            experiment = Experiment(context=context, expt_id=expt_id,
+                                    driver=self.driver)
+            error = experiment.reap(progress=self._progress(reap, token))
+        except Exception as ex:
+            LOG.exception('reap experiment %s failed.' % expt_id)
+            error = str(ex) or ex.__class__.__name__
+
+        try:
+            if not error:
+                self._done(reap, token)
+            elif attempts < CONF.container_reap_max_attempts:
+                self._retry(reap, token, attempts, error)
+            else:
+                self._failed(reap, token, attempts, error)
+        except Exception as ex:
+            # the claim goes stale and the teardown is taken over
+            LOG.exception(ex)
+        self.revision.bump(expt_id)
+
+    def _done(self, reap, token):
+        LOG.info('reaped experiment %s after %s attempts'
+                 % (reap['expt_id'], reap['attempts'] + 1))
+        self.driver.reap_update(reap['expt_id'], token,
+                                {'state': DONE,
+                                 'attempts': reap['attempts'] + 1,
+                                 'progress': 100,
+                                 'last_error': None})
+        if reap['op_id']:
+            self.driver.operation_update(
+                reap['op_id'], {'phase': OPERATION_PHASE_DIC['done'],
+                                'progress': 100})
+
+    def _retry(self, reap, token, attempts, error):
+        delay = CONF.container_reap_retry_interval * 2 ** (attempts - 1)
+        LOG.warn('reap experiment %s failed, attempt %s, retry in %ss: %s'
+                 % (reap['expt_id'], attempts, delay, error))
+        self.driver.reap_update(
+            reap['expt_id'], token,
+            {'state': PENDING,
+             'attempts': attempts,
+             'next_attempt_at': timeutils.utcnow() +
+             datetime.timedelta(seconds=delay),
+             'claim': None,
+             'last_error': error[:255]})
+
+    def _failed(self, reap, token, attempts, error):
+        expt_id = reap['expt_id']
+        LOG.error('reap experiment %s failed after %s attempts: %s'
+                  % (expt_id, attempts, error))
+        self.driver.reap_update(expt_id, token,
+                                {'state': FAILED,
+                                 'attempts': attempts,
+                                 'last_error': error[:255]})
+        self.experiment_api.expt_operate_failed(expt_id, error)
+        self.events.emit(expt_id, 'experiment', expt_id, event.FAILED, error)
+        if reap['op_id']:
+            self.driver.operation_update(
+                reap['op_id'], {'phase': OPERATION_PHASE_DIC['error'],
+                                'failure_info': error[:256]})
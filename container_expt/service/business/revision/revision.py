@@ -0,0 +1,31 @@
+""" Revision counters keying the cached payloads of experiments. """
+
+from oslo_log import log as logging
+from container_expt.service import readmode
+
+LOG = logging.getLogger(__name__)
+
+
+class Revision(object):
+
+    def __init__(self, driver=None):
+        self.driver = driver
+
+    def get(self, expt_id):
+        return self.driver.expt_revision_get(expt_id)
+
+    def bump(self, *expt_ids):
+        """Marks experiments changed, so their cached payloads are rebuilt.
+
+        Call it after the change is written. A failed bump is logged
+        rather than failing the change; the cache expiry then bounds how
+        long the old payload is served.
+        """
+        readmode.wrote()
+        expt_ids = [expt_id for expt_id in expt_ids if expt_id]
+        if not expt_ids:
+            return
+        try:
+            self.driver.expt_revisions_bump(expt_ids)
+        except Exception as ex:
+            LOG.exception(ex)
@@ -0,0 +1,118 @@
+import eventlet
+from eventlet import queue
+from oslo_log import log as logging
+
+LOG = logging.getLogger(__name__)
+
+
+class TaskSkipped(Exception):
+    """A task did not run because one of its requirements failed."""
+
+    def __init__(self, key, cause):
+        super(TaskSkipped, self).__init__(str(cause))
+        self.key = key
+        self.cause = cause
+
+
+class TaskGraph(object):
+    """Runs tasks concurrently as soon as the tasks they require are done.
+
+    Tasks are added with the keys of the tasks they require. ``run`` spawns
+    every task whose requirements have succeeded into a green pool, so
+    independent tasks overlap while the pool size caps how many run at
+    once. A task whose requirement failed is not run; it is recorded in
+    ``errors`` as a ``TaskSkipped`` carrying the original exception, and so
+    are its own dependents. Tasks listed in ``after`` only have to finish,
+    successfully or not, and the task decides itself what their failure
+    means.
+
+    ``listener(key, ok, value)``, if given, is called with the result or
+    the error of every task as it finishes or is skipped.
+    """
+
+    def __init__(self, pool=None, size=1000, listener=None):
+        self._pool = pool or eventlet.GreenPool(size)
+        self._listener = listener
+        self._tasks = {}
+        self._aborted = False
+        self.results = {}
+        self.errors = {}
+
+    def add(self, key, func, args=(), requires=(), after=()):
+        if key in self._tasks:
+            raise ValueError('duplicate task %s' % (key,))
+        self._tasks[key] = (func, args, set(requires), set(after))
+
+    def __contains__(self, key):
+        return key in self._tasks
+
+    def __len__(self):
+        return len(self._tasks)
+
+    def abort(self):
+        """Stops scheduling new tasks; running tasks are left to finish."""
+        self._aborted = True
+
+    @property
+    def aborted(self):
+        return self._aborted
+
+    def _finished(self, key, ok, value):
+        if ok:
+            self.results[key] = value
+        else:
+            self.errors[key] = value
+        if self._listener is not None:
+            try:
+                self._listener(key, ok, value)
+            except Exception as ex:
+                LOG.exception(ex)
+
+    def _run_task(self, key, func, args, done):
+        try:
+            done.put((key, True, func(*args)))
+        except Exception as ex:
+            done.put((key, False, ex))
+
+    def run(self):
+        pending = dict(self._tasks)
+        done = queue.LightQueue()
+        running = 0
+        while True:
+            while pending and not self._aborted:
+                ready = []
+                for key, (func, args, requires, after) in pending.items():
+                    failed = [req for req in requires if req in self.errors]
+                    if failed:
+                        cause = self.errors[failed[0]]
+                        if isinstance(cause, TaskSkipped):
+                            cause = cause.cause
+                        del pending[key]
+                        self._finished(key, False, TaskSkipped(key, cause))
+                        break
+                    if requires.issubset(self.results) and \
+                            all(k in self.results or k in self.errors
+                                for k in after):
+                        ready.append(key)
+                else:
+                    for key in ready:
+                        func, args, requires, after = pending.pop(key)
+                        running += 1
+                        self._pool.spawn_n(self._run_task,
+                                           key, func, args, done)
+                    break
+
+            if not running:
+                break
+
+            key, ok, value = done.get()
+            running -= 1
+            self._finished(key, ok, value)
+
+        if not self._aborted:
+            for key, (func, args, requires, after) in pending.items():
+                missing = (requires | after) - set(self._tasks)
+                LOG.warn('task %s requires unknown tasks %s' % (key, missing))
+                self._finished(key, False, TaskSkipped(
+                    key, Exception('unknown requirements %s' % (missing,))))
+        return self.results
@@ -1,12 +1,19 @@
 import json
+import netaddr
+import time
 from oslo_config import cfg
 from oslo_log import log as logging
 import eventlet
+from terra.i18n import _
 from terra.vne_experiment.business.topology.vlink import Vlink
 from terra.vne_experiment.business.topology.subnet import Subnet
+from container_expt.service.business.event import event
+from container_expt.service.business.revision import revision
+from container_expt.service.business.topology import taskgraph
+from container_expt.service import neutron
 from terra.common import dependency
 from terra.common import router_states
-from terra.common import vm_states, subnet_states
+from terra.common import vm_states, vm_operates, subnet_states
 from terra.common.api import build_driver_hints
 from terra.common.constants import XLAB_OWNER_TYPE, EXPT_OPERATE_DIC, \
     VM_TYPE_DIC, PORT_TYPE_DIC
@@ -30,25 +37,66 @@ timeout_opts = [
                     "Set to 0 to disable."),
 ]
 
+provision_opts = [
+    cfg.IntOpt('container_provision_concurrency',
+               default=8,
+               help='Maximum number of networks, routers, ports and vms '
+                    'of one topology created in openstack at the same '
+                    'time.'),
+    cfg.IntOpt('container_provision_stale_timeout',
+               default=600,
+               help='Seconds without a completed step or a heartbeat '
+                    'after which the provisioning of a topology is taken '
+                    'to be lost with its worker and is resumed by another '
+                    'one.'),
+    cfg.IntOpt('container_provision_heartbeat_interval',
+               default=60,
+               help='Seconds between the heartbeats of a worker '
+                    'provisioning a topology; keep it well below '
+                    'container_provision_stale_timeout.'),
+    cfg.IntOpt('container_provision_max_attempts',
+               default=3,
+               help='Times the provisioning of a topology is resumed '
+                    'after its worker was lost before it is failed.'),
+]
+
+cache_opts = [
+    cfg.IntOpt('container_ext_network_cache_ttl',
+               default=60,
+               help='Seconds the external networks looked up when creating '
+                    'experiments are cached in the process. Set to 0 to '
+                    'disable.'),
+]
+
 CONF = cfg.CONF
 CONF.register_opts(interval_opts)
 CONF.register_opts(timeout_opts)
+CONF.register_opts(provision_opts)
+CONF.register_opts(cache_opts)
 LOG = logging.getLogger(__name__)
 
+_EXT_NETWORKS = {'networks': None, 'expires_at': 0}
+
+
+def invalidate_external_networks():
+    """Drops the cached external networks, e.g. after syncing them."""
+    _EXT_NETWORKS['networks'] = None
+
 
 @dependency.requires('experiment_api', 'topology_api')
 @dependency.requires('vne_experiment_api', 'vm_api')
 class Topology(object):
 
-    def __init__(self, context=None, topo_id=None):
+    def __init__(self, context=None, topo_id=None, driver=None):
         self.context = context
         self.topo_id = topo_id
+        self.driver = driver
         self.vlink = Vlink(context=context)
         self.subnet = Subnet(context=context)
         self._sync_power_pool = eventlet.GreenPool()
 
     def create(self, context, expt_id, expt_name,
-               owner_id, owner_name, topo_data):
+               owner_id, owner_name, topo_data, op_id=None):
         # create topo data
         topo_values = dict()
         topo_values['name'] = topo_data['name']
@@ -56,60 +104,69 @@ class Topology(object):
         topo_values['owner_id'] = owner_id
         topo_values['owner_name'] = owner_name
         topo_values['owner_type'] = XLAB_OWNER_TYPE
-        topo_id = self._save_topo_data(expt_id, topo_values)
-        topo_data['id'] = topo_id
-
-        # create network and subnet data
-        network_dict, subnet_dict = self.create_subnets_data(
-            expt_name, topo_id, owner_id, owner_name, topo_data['networks'])
-        topo_data['os_networks'] = network_dict
-
-        # add extra routers service to connect ext net
-        # each subnets provided with one router
-        ext_routers = []
-        for net in topo_data['networks']:
-            for sub in net.get('subnets', []):
-                ext_router = {
-                    'name': 'route_connect_ext',
-                    'attach_ext': True,
-                    'attach_subnets': [sub['id']]
-                }
-                routers = self.create_routers_data(
-                    expt_name, topo_id, owner_id, owner_name,
-                    [ext_router], subnet_dict)
-                routers[0]['attach_ext'] = True
-                ext_routers.append(routers[0])
-
-        # add router service data which connect subnets
-        routers = self.create_routers_data(
-            expt_name, topo_id, owner_id, owner_name,
-            topo_data['routers'], subnet_dict)
-        topo_data['os_routers'] = routers
-        for rt in ext_routers:
-            topo_data['os_routers'].insert(0, rt)
-
-        # create devices
-        devices = self.create_devices_data(
-            expt_name, topo_id, owner_id, owner_name,
-            topo_data['devices'], subnet_dict)
-        topo_data['os_devices'] = devices
-
-    def _save_topo_data(self, expt_id, topo_values):
-        topo_ref = self.topology_api.db_create_topo(topo_values)
-        topo_id = topo_ref['id']
-
-        mapping_values = dict()
-        mapping_values['expt_id'] = expt_id
-        mapping_values['topo_id'] = topo_id
-        self.experiment_api.topo_mapping(mapping_values)
 
-        self.topo_id = topo_id
-        return topo_id
+        def build_rows(topo_id):
+            # network and subnet rows
+            networks = self.create_subnets_data(
+                expt_name, topo_id, owner_id, owner_name,
+                topo_data['networks'])
+            subnet_routers = dict((sub['key'], [])
+                                  for net in networks
+                                  for sub in net['subnets'])
+
+            # add extra routers service to connect ext net
+            # each subnets provided with one router
+            ext_routers = []
+            for net in topo_data['networks']:
+                for sub in net.get('subnets', []):
+                    ext_router = {
+                        'name': 'route_connect_ext',
+                        'attach_ext': True,
+                        'attach_subnets': [sub['id']]
+                    }
+                    ext_routers.extend(self.create_routers_data(
+                        expt_name, topo_id, owner_id, owner_name,
+                        [ext_router], subnet_routers))
+            for router in ext_routers:
+                router['ext'] = True
+
+            # router service rows which connect subnets
+            routers = self.create_routers_data(
+                expt_name, topo_id, owner_id, owner_name,
+                topo_data['routers'], subnet_routers)
+
+            # device rows
+            devices = self.create_devices_data(
+                expt_name, topo_id, owner_id, owner_name,
+                topo_data['devices'], subnet_routers)
+            return networks, ext_routers + routers, devices
+
+        rows = self.driver.topo_bulk_create(expt_id, topo_values, build_rows)
+        self.topo_id = rows['topo_id']
+        topo_data['id'] = rows['topo_id']
+        topo_data['os_networks'] = self._os_networks_plan(rows['networks'])
+        topo_data['os_routers'] = self._os_routers_plan(rows['routers'])
+        topo_data['os_devices'] = self._os_devices_plan(rows['devices'])
+
+        # keep the plan so that os_create can resume after a restart
+        try:
+            self.driver.provision_create({
+                'topo_id': topo_data['id'],
+                'expt_id': expt_id,
+                'expt_name': expt_name,
+                'plan': json.dumps({
+                    'id': topo_data['id'],
+                    'os_networks': topo_data['os_networks'].values(),
+                    'os_routers': topo_data['os_routers'],
+                    'os_devices': topo_data['os_devices']}),
+                'state': 'running',
+                'op_id': op_id})
+        except Exception as ex:
+            LOG.exception(ex)
 
     def create_subnets_data(self, expt_name, topo_id, owner_id,
                             owner_name, networks):
-        subnet_dict = {}
-        network_dict = {}
+        network_rows = []
         for net in networks:
             values = dict()
             net_id = net['id']
@@ -122,12 +179,10 @@ class Topology(object):
             values['owner_id'] = owner_id
             values['owner_name'] = owner_name
             values['owner_type'] = XLAB_OWNER_TYPE
-            network_ref = self.topology_api.db_create_network(values)
-            net_subs = []
-            network_dict[net_id] = {
-                'network_id': network_ref['id'],
-                'subnets': net_subs
-            }
+            subnet_rows = []
+            network_rows.append({'key': net_id,
+                                 'values': values,
+                                 'subnets': subnet_rows})
 
             subnets = net['subnets']
             for sub in subnets:
@@ -138,7 +193,6 @@ class Topology(object):
                 if len(sub_name.decode('utf-8')) > 60:
                     sub_name = sub['name']
                 values['name'] = sub_name
-                values['network_id'] = network_ref['id']
                 values['fixed_ips'] = sub['fixed_ips']
                 values['gateway_ip'] = sub['gateway']
                 values['enable_dhcp'] = sub['enable_dhcp']
@@ -152,23 +206,15 @@ class Topology(object):
                 if 'y' in sub:
                     other['coordinate']['y'] = sub['y']
                 values['other'] = json.dumps(other)
-                subnet_ref = self.topology_api.db_create_subnet(values)
-                net_subs.append(subnet_ref['id'])
-                subnet_dict[sub['id']] = {
-                    'subnet_id': subnet_ref['id'],
-                    'network_id': network_ref['id'],
-                    'routers': []
-                }
+                subnet_rows.append({'key': sub['id'],
+                                    'values': values,
+                                    'layout': {'x': sub.get('x'),
+                                               'y': sub.get('y')}})
 
-                values = dict()
-                values['topo_id'] = topo_id
-                values['cloud_subnet_id'] = subnet_ref['id']
-                self.vne_experiment_api.subnet_data_create(values)
-
-        return network_dict, subnet_dict
+        return network_rows
 
     def create_routers_data(self, expt_name, topo_id, owner_id,
-                            owner_name, routers_data, subnet_dict):
+                            owner_name, routers_data, subnet_routers):
         routers = []
         for router in routers_data:
             device_value = dict()
@@ -191,45 +237,53 @@ class Topology(object):
             if 'y' in router:
                 other['coordinate']['y'] = router['y']
             device_value['other'] = json.dumps(other)
-            router_ref = self.topology_api.db_create_router(device_value)
-            device_id = router_ref['device_id']
+            router_values = device_value.copy()
+            router_values.pop('type')
 
             # TODO(zhangyuliang): create router ports
             ports = []
             for idx, subnet_no in enumerate(router['attach_subnets']):
-                if subnet_no in subnet_dict:
+                if subnet_no in subnet_routers:
                     port_value = dict()
                     port_name = "%s_%s_%s_port_%d" % (
                         expt_name, str(topo_id), str(router['name']), idx)
                     port_value['name'] = \
                         port_name.decode('utf8')[0:63].encode('utf8')
-                    port_value['device_id'] = device_id
-                    port_value['subnet_id'] = subnet_dict.get(
-                        subnet_no).get('subnet_id')
                     port_value['device_owner'] = 'network:router_interface'
-                    port_ref = self.topology_api.db_create_port(port_value)
 
-                    subnet_routers = subnet_dict[subnet_no]['routers']
-                    port_dict = {
-                        'port_id': port_ref['id'],
-                        'subnet_id': subnet_dict[subnet_no]['subnet_id'],
-                    }
-                    if subnet_routers and not router['attach_ext']:
-                        port_dict['need_create_port_first'] = True
+                    port = {'subnet_key': subnet_no, 'values': port_value}
+                    if subnet_routers[subnet_no] and \
+                            not router['attach_ext']:
+                        port['need_create_port_first'] = True
                     else:
-                        subnet_routers.append(device_id)
-                        port_dict['need_create_port_first'] = False
-                    ports.append(port_dict)
-
-            routers.append({'router_id': router_ref['id'],
-                            'device_id': device_id,
-                            'ports': ports})
+                        subnet_routers[subnet_no].append(router_name)
+                        port['need_create_port_first'] = False
+                    ports.append(port)
+
+            routers.append({'device': device_value,
+                            'values': router_values,
+                            'ports': ports,
+                            'layout': {'x': router.get('x'),
+                                       'y': router.get('y')}})
         return routers
 
     def create_devices_data(self, expt_name, topo_id, owner_id,
-                            owner_name, devices_data, subnet_dict=None):
+                            owner_name, devices_data, subnet_routers=None):
+        """Builds the device, vm and port rows of ``devices_data``.
+
+        The vm rows hold the values that were passed to
+        vm_api.create_db_vm, plus the state, operate and flavor_id that
+        Device.create sets for it; the port rows the values passed to
+        topology_api.db_create_port. The ip_address asked for, which
+        db_create_port took as allocate_ip, is recorded as is as the
+        ipaddrs of each port: nothing is allocated or checked here, and
+        the address is only checked by neutron, as the fixed ip of the
+        port, when the port is created.
+        """
+        subnet_routers = subnet_routers or {}
         devices = []
         for device_data in devices_data:
+            device_data = dict(device_data)
             device_data['alias'] = device_data['name']
             device_data['owner_id'] = owner_id
             device_data['owner_name'] = owner_name
@@ -243,6 +297,10 @@ class Topology(object):
                 'description', '%s_description' % device_data['name'])
             device_data['name'] = 'container-%s-%s-%s' % (
                 expt_name, str(topo_id), device_data['name'])
+            device_data['state'] = vm_states.BUILDING
+            device_data['operate'] = vm_operates.SCHEDULING
+            if 'flavor' in device_data:
+                device_data['flavor_id'] = device_data['flavor']
             other = {
                 'vtype': device_data.get('vtype', 0),
                 'coordinate': {}
@@ -254,186 +312,148 @@ class Topology(object):
             if 'y' in device_data:
                 other['coordinate']['y'] = device_data['y']
             device_data['other'] = json.dumps(other)
-            device_ref = self.vm_api.create_db_vm(device_data)
-            device_id = device_ref['device_id']
-            device_data['no'] = device_ref['id']
+            device_value = {'topo_id': topo_id,
+                            'type': device_data['device_type'],
+                            'name': device_data['name'],
+                            'owner_id': owner_id,
+                            'owner_name': owner_name,
+                            'owner_type': XLAB_OWNER_TYPE}
 
             ports = []
             for idx, subnet_no in enumerate(device_data['attach_subnets']):
-                if subnet_no in subnet_dict:
+                if subnet_no in subnet_routers:
                     port_value = dict()
                     port_value['name'] = "%s_port_%d" % (
                         device_data['name'], idx)
                     port_value['name'] = port_value['name'][:64]
-                    port_value['device_id'] = device_id
-                    port_value['subnet_id'] = subnet_dict.get(
-                        subnet_no).get('subnet_id')
                     port_value['device_owner'] = 'compute:nova'
                     if device_data.get('type') == VM_TYPE_DIC['vcontroller']:
-                        other = {'type': PORT_TYPE_DIC['manager']}
+                        port_other = {'type': PORT_TYPE_DIC['manager']}
                     else:
-                        other = {'type': PORT_TYPE_DIC['data']}
-                    port_value['other'] = json.dumps(other)
-                    allocate_ip = device_data['ip_address']
-                    port_ref = self.topology_api.db_create_port(port_value, allocate_ip=allocate_ip)
-                    ports.append({
-                        'port_id': port_ref['id'],
-                        'subnet_id': subnet_dict[subnet_no]['subnet_id'],
-                        'network_id': subnet_dict[subnet_no]['network_id'],
-                    })
-
-            devices.append({'device_id': device_id, 'ports': ports})
+                        port_other = {'type': PORT_TYPE_DIC['data']}
+                    port_value['other'] = json.dumps(port_other)
+                    ports.append({'subnet_key': subnet_no,
+                                  'values': port_value,
+                                  'ipaddrs': device_data['ip_address']})
+
+            devices.append({'device': device_value,
+                            'values': device_data,
+                            'ports': ports,
+                            'layout': {'x': device_data.get('x'),
+                                       'y': device_data.get('y'),
+                                       'vtype': other['vtype'],
+                                       'device_type': device_data['type']}})
         return devices
 
-    def os_create(self, context, topo_dic, expt_id, expt_name):
+    def _os_networks_plan(self, networks):
+        return dict((net['key'], {
+            'network_id': net['id'],
+            'subnets': [sub['id'] for sub in net['subnets']],
+            'fixed_ips': [sub['values']['fixed_ips']
+                          for sub in net['subnets']]
+        }) for net in networks)
+
+    def _os_routers_plan(self, routers):
+        plan = []
+        for router in routers:
+            router_dict = {
+                'router_id': router['id'],
+                'device_id': router['device_id'],
+                'ports': [{
+                    'port_id': port['id'],
+                    'subnet_id': port['subnet_id'],
+                    'need_create_port_first': port['need_create_port_first']
+                } for port in router['ports']]
+            }
+            if router.get('ext'):
+                router_dict['attach_ext'] = True
+            plan.append(router_dict)
+        return plan
+
+    def _os_devices_plan(self, devices):
+        return [{
+            'device_id': device['device_id'],
+            'ports': [{
+                'port_id': port['id'],
+                'subnet_id': port['subnet_id'],
+                'network_id': port['network_id'],
+            } for port in device['ports']]
+        } for device in devices]
+
+    def os_resume(self, context, provision):
+        """Continues the os_create of a topology from its checkpoints.
+
+        A provision taken over more than container_provision_max_attempts
+        times, e.g. because os_create keeps failing before it finishes,
+        is failed instead.
+        """
+        plan = json.loads(provision['plan'])
+        if provision['attempts'] > CONF.container_provision_max_attempts:
+            LOG.error('container expt os create of topo %s failed after %s '
+                      'attempts' % (plan['id'], provision['attempts']))
+            self.driver.provision_finish(plan['id'], 'failed')
+            done = self.driver.provision_steps_get(plan['id'])
+            for device in plan['os_devices']:
+                if ('vm', device['device_id']) not in done:
+                    self._set_device_error(device['device_id'],
+                                           'provisioning failed')
+            revision.Revision(driver=self.driver).bump(provision['expt_id'])
+            return
+        topo_dic = {
+            'id': plan['id'],
+            'os_networks': dict((net['network_id'], net)
+                                for net in plan['os_networks']),
+            'os_routers': plan['os_routers'],
+            'os_devices': plan['os_devices'],
+        }
+        if self.is_expt_deleting(provision['expt_id']):
+            self.driver.provision_finish(plan['id'], 'aborted')
+            return
+        done = self.driver.provision_steps_get(plan['id'])
+        LOG.info('container expt resume os create. topo_id: %s, done: %s'
+                 % (plan['id'], len(done)))
+        self.os_create(context, topo_dic, provision['expt_id'],
+                       provision['expt_name'], done=done)
+
+    def os_create(self, context, topo_dic, expt_id, expt_name, done=None,
+                  pool=None):
+        """Creates a topology in openstack from its os_* plan.
+
+        Every completed step is checkpointed. ``done`` are the steps
+        checkpointed by an earlier run being resumed: they are skipped,
+        and the other steps first look for what that run may have
+        created after its last checkpoint. ``pool`` is a green pool
+        shared with other topologies, to bound them all together.
+
+        Every vm boots only once the host routes of the subnets were
+        updated, so that its first DHCP lease already carries the routes
+        between subnets. The vms wait for that step to finish, not to
+        succeed: a failed update is logged and the vms boot regardless,
+        as they did when the steps ran one after the other.
+        """
         try:
-            # create os networks
-            network_mapper = {}
-            subnet_mapper = {}
-            err_dic = {}
-            network_dict = topo_dic['os_networks']
-            for net_no, network in network_dict.items():
-                db_net_id = network['network_id']
-                try:
-                    os_net = self.topology_api.os_create_network(
-                        context, db_net_id, create_subnet=True)
-                    network_mapper[db_net_id] = os_net['os_network_uuid']
-                    db_subnets = network['subnets']
-                    for sub_id in db_subnets:
-                        sub_ref = self.topology_api.db_get_subnet(sub_id)
-                        subnet_mapper[sub_id] = \
-                            sub_ref['os_subnet']['os_subnet_uuid']
-                except Exception as ex:
-                    LOG.exception(ex)
-                    if self.is_expt_deleting(expt_id):
-                        return
-                    err_dic[db_net_id] = str(ex)
-                    db_subnets = network['subnets']
-                    for sub_id in db_subnets:
-                        self.topology_api.db_update_subnet(
-                            sub_id, {'state': subnet_states.ERROR})
-            # net_ids = [net['network_id'] for net in network_dict.values()]
-            # try:
-            #     db_os_networks, db_os_subnets = \
-            #         self.topology_api.os_mult_create_network(
-            #             None, net_ids, create_subnet=True)
-            #     for os_net in db_os_networks:
-            #         network_mapper[os_net['network_id']] = \
-            #             os_net['os_network_uuid']
-            #     for os_sub in db_os_subnets:
-            #         subnet_mapper[os_sub['subnet_id']] = \
-            #             os_sub['os_subnet_uuid']
-            # except Exception as ex:
-            #     LOG.exception(ex)
-
-            # create os routes
+            graph = self._os_create_graph(context, topo_dic, expt_id, done,
+                                          pool)
+            # a step may take longer than the stale timeout, e.g. a slow
+            # vm boot, so liveness does not rest on the checkpoints only
+            heartbeat = eventlet.spawn(self._os_heartbeat, topo_dic['id'])
             try:
-                external_networks = []
-                routers = topo_dic['os_routers']
-                for router_dict in routers:
-                    self.topology_api.os_create_router(
-                        context, router_dict['router_id']
-                    )
-                    ports = router_dict['ports']
-                    for port_dict in ports:
-                        if port_dict.get('need_create_port_first', False):
-                            os_port = self.topology_api.os_create_port(
-                                context, port_dict['port_id']
-                            )
-                            router_interface = dict(
-                                os_port_uuid=os_port['os_port_uuid'],
-                                os_subnet_uuid=subnet_mapper[
-                                    port_dict['subnet_id']]
-                            )
-                            self.topology_api.os_add_router_interface(
-                                context, router_dict['router_id'],
-                                router_interface
-                            )
-
-                            self.topology_api.db_update_os_port(
-                                os_port['port_id'], {'attach_device': True})
-                        else:
-                            router_interface = dict(
-                                os_subnet_uuid=subnet_mapper[
-                                    port_dict['subnet_id']]
-                            )
-                            os_port_id = self.topology_api. \
-                                os_add_router_interface(
-                                context, router_dict['router_id'],
-                                router_interface)
-
-                            self.topology_api.db_create_os_port({
-                                'port_id': port_dict['port_id'],
-                                'os_port_uuid': os_port_id,
-                                'attach_device': True
-                            })
-
-                        if router_dict.get('attach_ext', False):
-                            if not external_networks:
-                                hints = build_driver_hints(
-                                    {'type': 'External',
-                                     'owner_type': XLAB_OWNER_TYPE,
-                                     'from_os': True})
-                                external_networks = self.topology_api. \
-                                    db_list_networks(hints=hints)
-                            for external_netowrk in external_networks:
-                                self.topology_api.add_router_gateway(
-                                    context, router_dict['router_id'],
-                                    {'ext_net_id': external_netowrk['id']})
-                # update route hosts
-                subnets = self.vne_experiment_api. \
-                    topo_get_subnets(topo_dic['id'])
-                for subnet_id, subnet in subnets.items():
-                    update_subnet = self.vne_experiment_api. \
-                        subnet_update_host_routes(subnet_id)
-                    if update_subnet:
-                        try:
-                            host_routes = update_subnet.host_routes
-                            LOG.info("subnet host route: %s, type:%s" %
-                                     (host_routes, type(host_routes)))
-                            self.topology_api.os_update_subnet(
-                                context, update_subnet.id,
-                                {'host_routes': host_routes})
-                        except Exception as ex:
-                            LOG.exception(ex)
+                graph.run()
+            finally:
+                heartbeat.kill()
+            try:
+                self.driver.provision_finish(
+                    topo_dic['id'], 'aborted' if graph.aborted else 'done')
             except Exception as ex:
                 LOG.exception(ex)
+            if graph.aborted:
+                return
 
-            # create os devices
-            devices_list = topo_dic['os_devices']
-            for device in devices_list:
-                err_msg = ''
-                nics = []
-                ports = device['ports']
-                for port in ports:
-                    network_id = port['network_id']
-                    if network_id in err_dic:
-                        err_msg = err_dic[network_id]
-                        continue
-                    os_port = self.topology_api.os_create_port(
-                        context, port['port_id']
-                    )
-                    nics.append({
-                        'network_uuid': network_mapper.get(network_id),
-                        'port_uuid': os_port['os_port_uuid']
-                    })
-
-                if err_msg:
-                    if self.is_expt_deleting(expt_id):
-                        return
-                    self._set_device_error(device['device_id'], err_msg)
-                    continue
-                try:
-                    LOG.info('container expt create os vm. device_id: %s, nics: %s'
-                             % (device['device_id'], nics))
-                    self.vm_api.create_os_vm(
-                        context, device['device_id'],
-                        nics, get_os_image=True
-                    )
-                except Exception as ex:
-                    if self.is_expt_deleting(expt_id):
-                        return
-                    self._set_device_error(device['device_id'], str(ex))
+            # devices whose networks or ports failed never booted
+            for key, ex in graph.errors.items():
+                if key[0] == 'vm' and isinstance(ex, taskgraph.TaskSkipped):
+                    self._set_device_error(key[1], str(ex))
+            revision.Revision(driver=self.driver).bump(expt_id)
 
             # add router service to provide this network
             # with access external network capability
@@ -450,6 +470,476 @@ class Topology(object):
             LOG.exception(str(ex))
             raise
 
+    def _os_heartbeat(self, topo_id):
+        interval = max(CONF.container_provision_heartbeat_interval, 1)
+        while True:
+            eventlet.sleep(interval)
+            try:
+                self.driver.provision_touch(topo_id)
+            except Exception as ex:
+                LOG.exception(ex)
+
+    def _os_create_graph(self, context, topo_dic, expt_id, done=None,
+                         pool=None):
+        """Builds the os_* plan of a topology into a task graph.
+
+        Networks come first, each router waits for the networks it
+        attaches to, and the host routes wait for the routers. Each
+        device boots as soon as its own ports exist, which in turn only
+        wait for their own network, and the host routes are updated.
+        """
+        resume = done is not None
+        done = done or set()
+        graph = taskgraph.TaskGraph(
+            pool=pool,
+            size=CONF.container_provision_concurrency,
+            listener=self._os_create_listener(expt_id, topo_dic['id'], done))
+        network_mapper = {}
+        subnet_mapper = {}
+
+        # create os networks and subnets in one batch, then give every
+        # network its own task so that a failed network only holds back
+        # the routers and devices attached to it
+        subnet_networks = {}
+        networks = topo_dic['os_networks'].values()
+        networks_key = ('networks', topo_dic['id'])
+        graph.add(networks_key, self._os_create_networks,
+                  (context, graph, expt_id, networks,
+                   network_mapper, subnet_mapper, resume))
+        for network in networks:
+            db_net_id = network['network_id']
+            for sub_id in network['subnets']:
+                subnet_networks[sub_id] = db_net_id
+            graph.add(('network', db_net_id), self._os_network_created,
+                      (graph, networks_key, db_net_id),
+                      after=[networks_key])
+
+        # create os routes
+        router_keys = []
+        ext_key = ('external_networks', topo_dic['id'])
+        for router_dict in topo_dic['os_routers']:
+            requires = set(('network', subnet_networks[port['subnet_id']])
+                           for port in router_dict['ports'])
+            if router_dict.get('attach_ext', False):
+                if ext_key not in graph:
+                    graph.add(ext_key, self.get_external_networks)
+                requires.add(ext_key)
+            key = ('router', router_dict['router_id'])
+            if key in done:
+                graph.add(key, self._os_step_done, requires=requires)
+            else:
+                graph.add(key, self._os_create_router,
+                          (context, graph, router_dict, subnet_mapper,
+                           ext_key),
+                          requires=requires)
+            router_keys.append(key)
+
+        # update route hosts
+        host_routes_key = ('host_routes', topo_dic['id'])
+        if host_routes_key in done:
+            graph.add(host_routes_key, self._os_step_done,
+                      requires=router_keys)
+        else:
+            graph.add(host_routes_key, self._os_update_host_routes,
+                      (context, topo_dic['id']), requires=router_keys)
+
+        # create os devices
+        os_ports = {}
+        port_errors = {}
+        devices = topo_dic['os_devices']
+        if CONF.container_neutron.bulk_create_ports:
+            ports_key = ('ports', topo_dic['id'])
+            network_keys = set(('network', port['network_id'])
+                               for device in devices
+                               for port in device['ports'])
+            graph.add(ports_key, self._os_create_ports_bulk,
+                      (context, graph, devices, os_ports, port_errors,
+                       resume),
+                      after=network_keys)
+        for device in devices:
+            if CONF.container_neutron.bulk_create_ports:
+                port_keys = [ports_key]
+            else:
+                port_keys = []
+                for port in device['ports']:
+                    key = ('port', port['port_id'])
+                    graph.add(key, self._os_create_port,
+                              (context, port['port_id'], os_ports, resume),
+                              requires=[('network', port['network_id'])])
+                    port_keys.append(key)
+            key = ('vm', device['device_id'])
+            if key in done:
+                graph.add(key, self._os_step_done, requires=port_keys)
+            else:
+                # boot with the routes in the first DHCP lease
+                graph.add(key, self._os_create_vm,
+                          (context, graph, expt_id, device,
+                           network_mapper, os_ports, port_errors, resume),
+                          requires=port_keys, after=[host_routes_key])
+        return graph
+
+    def _os_step_done(self):
+        """Stands in for a step checkpointed by an earlier run."""
+        return None
+
+    def _os_create_listener(self, expt_id, topo_id, done):
+        """Checkpoints finished graph tasks and turns them into
+        experiment progress events.
+        """
+        events = event.Event(driver=self.driver)
+        revisions = revision.Revision(driver=self.driver)
+
+        def listener(key, ok, value):
+            kind, obj_id = key
+            if ok and key not in done:
+                if kind == 'ports':
+                    steps = [('port', port_id) for port_id in value]
+                elif kind in ('network', 'router', 'host_routes',
+                              'port', 'vm'):
+                    steps = [key]
+                else:
+                    steps = []
+                if steps:
+                    try:
+                        self.driver.provision_steps_create(topo_id, steps)
+                    except Exception as ex:
+                        LOG.exception(ex)
+            if kind not in ('network', 'router', 'port', 'ports', 'vm') or \
+                    key in done:
+                return
+            revisions.bump(expt_id)
+            if not ok:
+                state = event.SKIPPED \
+                    if isinstance(value, taskgraph.TaskSkipped) \
+                    else event.FAILED
+                events.emit(expt_id, kind, obj_id, state, value)
+            elif kind == 'ports':
+                events.emit_many(expt_id, [('port', port_id, event.CREATED,
+                                            None)
+                                           for port_id in value])
+            elif kind == 'vm':
+                events.emit(expt_id, kind, obj_id, event.SCHEDULED)
+            else:
+                events.emit(expt_id, kind, obj_id, event.CREATED)
+        return listener
+
+    def os_create_networks(self, context, networks, reuse=False):
+        """Creates the networks and subnets of a topology in one batch.
+
+        Networks with a subnet whose cidr does not parse are left out of
+        the batch. If the batch call fails, the networks it did not get
+        to are retried one by one so only the bad ones are reported.
+
+        :param networks: the values of a topology's os_networks plan.
+        :param reuse: skip the batch and go one by one straight away,
+                      reusing networks that already exist in openstack.
+        :returns: dict with the ``networks`` and ``subnets`` db id to os
+                  uuid mappings and the ``errors`` of failed networks.
+        """
+        network_mapper = {}
+        subnet_mapper = {}
+        err_dic = {}
+        net_ids = []
+        for network in networks:
+            db_net_id = network['network_id']
+            for cidr in network.get('fixed_ips', []):
+                try:
+                    netaddr.IPNetwork(cidr)
+                except (netaddr.AddrFormatError, ValueError, TypeError):
+                    err_dic[db_net_id] = ValueError(
+                        _('invalid subnet cidr %s') % cidr)
+                    break
+            else:
+                net_ids.append(db_net_id)
+
+        if not net_ids:
+            return {'networks': network_mapper,
+                    'subnets': subnet_mapper,
+                    'errors': err_dic}
+        if not reuse:
+            try:
+                db_os_networks, db_os_subnets = \
+                    self.topology_api.os_mult_create_network(
+                        context, net_ids, create_subnet=True)
+                for os_net in db_os_networks:
+                    network_mapper[os_net['network_id']] = \
+                        os_net['os_network_uuid']
+                for os_sub in db_os_subnets:
+                    subnet_mapper[os_sub['subnet_id']] = \
+                        os_sub['os_subnet_uuid']
+                net_ids = []
+            except Exception as ex:
+                LOG.exception(ex)
+
+        for network in networks:
+            db_net_id = network['network_id']
+            if db_net_id not in net_ids:
+                continue
+            try:
+                net_ref = self.topology_api.get_network_detail(db_net_id)
+                if net_ref.get('os_network'):
+                    os_net = net_ref['os_network']
+                else:
+                    os_net = self.topology_api.os_create_network(
+                        context, db_net_id, create_subnet=True)
+                network_mapper[db_net_id] = os_net['os_network_uuid']
+                for sub_id in network['subnets']:
+                    sub_ref = self.topology_api.db_get_subnet(sub_id)
+                    subnet_mapper[sub_id] = \
+                        sub_ref['os_subnet']['os_subnet_uuid']
+            except Exception as ex:
+                LOG.exception(ex)
+                err_dic[db_net_id] = ex
+
+        return {'networks': network_mapper,
+                'subnets': subnet_mapper,
+                'errors': err_dic}
+
+    def _os_create_networks(self, context, graph, expt_id, networks,
+                            network_mapper, subnet_mapper, resume=False):
+        ret = self.os_create_networks(context, networks, reuse=resume)
+        network_mapper.update(ret['networks'])
+        subnet_mapper.update(ret['subnets'])
+        if ret['errors'] and self.is_expt_deleting(expt_id):
+            graph.abort()
+            return ret
+        for network in networks:
+            if network['network_id'] not in ret['errors']:
+                continue
+            for sub_id in network['subnets']:
+                self.topology_api.db_update_subnet(
+                    sub_id, {'state': subnet_states.ERROR})
+        return ret
+
+    def _os_network_created(self, graph, networks_key, db_net_id):
+        if networks_key in graph.errors:
+            raise graph.errors[networks_key]
+        err = graph.results[networks_key]['errors'].get(db_net_id)
+        if err is not None:
+            raise err
+
+    def get_external_networks(self):
+        """Returns the external networks, cached for a short while.
+
+        The list is shared by every caller in the process and must not be
+        modified. An empty result is not cached, so the next create syncs
+        the external network again.
+        """
+        ttl = CONF.container_ext_network_cache_ttl
+        now = time.time()
+        if ttl > 0 and _EXT_NETWORKS['networks'] and \
+                _EXT_NETWORKS['expires_at'] > now:
+            return _EXT_NETWORKS['networks']
+
+        hints = build_driver_hints({'type': 'External',
+                                    'owner_type': XLAB_OWNER_TYPE,
+                                    'from_os': True})
+        networks = self.topology_api.db_list_networks(hints=hints)
+        if ttl > 0 and networks:
+            _EXT_NETWORKS['networks'] = networks
+            _EXT_NETWORKS['expires_at'] = now + ttl
+        return networks
+
+    def _os_create_router(self, context, graph, router_dict, subnet_mapper,
+                          ext_key):
+        try:
+            self.topology_api.os_create_router(
+                context, router_dict['router_id']
+            )
+            ports = router_dict['ports']
+            for port_dict in ports:
+                if port_dict.get('need_create_port_first', False):
+                    os_port = self.topology_api.os_create_port(
+                        context, port_dict['port_id']
+                    )
+                    router_interface = dict(
+                        os_port_uuid=os_port['os_port_uuid'],
+                        os_subnet_uuid=subnet_mapper[
+                            port_dict['subnet_id']]
+                    )
+                    self.topology_api.os_add_router_interface(
+                        context, router_dict['router_id'],
+                        router_interface
+                    )
+
+                    self.topology_api.db_update_os_port(
+                        os_port['port_id'], {'attach_device': True})
+                else:
+                    router_interface = dict(
+                        os_subnet_uuid=subnet_mapper[
+                            port_dict['subnet_id']]
+                    )
+                    os_port_id = self.topology_api. \
+                        os_add_router_interface(
+                        context, router_dict['router_id'],
+                        router_interface)
+
+                    self.topology_api.db_create_os_port({
+                        'port_id': port_dict['port_id'],
+                        'os_port_uuid': os_port_id,
+                        'attach_device': True
+                    })
+
+            if router_dict.get('attach_ext', False):
+                external_networks = graph.results[ext_key]
+                for external_netowrk in external_networks:
+                    self.topology_api.add_router_gateway(
+                        context, router_dict['router_id'],
+                        {'ext_net_id': external_netowrk['id']})
+        except Exception as ex:
+            LOG.exception(ex)
+            raise
+
+    def _os_update_host_routes(self, context, topo_id):
+        subnets = self.vne_experiment_api. \
+            topo_get_subnets(topo_id)
+        for subnet_id, subnet in subnets.items():
+            update_subnet = self.vne_experiment_api. \
+                subnet_update_host_routes(subnet_id)
+            if update_subnet:
+                try:
+                    host_routes = update_subnet.host_routes
+                    LOG.info("subnet host route: %s, type:%s" %
+                             (host_routes, type(host_routes)))
+                    self.topology_api.os_update_subnet(
+                        context, update_subnet.id,
+                        {'host_routes': host_routes})
+                except Exception as ex:
+                    LOG.exception(ex)
+
+    def _os_create_port(self, context, port_id, os_ports, resume=False):
+        if resume:
+            os_port = self.driver.os_ports_get([port_id]).get(port_id)
+            if os_port:
+                os_ports[port_id] = os_port
+                return
+        os_ports[port_id] = self.topology_api.os_create_port(context, port_id)
+
+    def _os_create_ports_bulk(self, context, graph, devices, os_ports,
+                              port_errors, resume=False):
+        port_ids = [port['port_id']
+                    for device in devices
+                    for port in device['ports']
+                    if ('network', port['network_id']) not in graph.errors]
+        if resume:
+            os_ports.update(self.driver.os_ports_get(port_ids))
+            port_ids = [port_id for port_id in port_ids
+                        if port_id not in os_ports]
+        created = self.os_create_ports(context, port_ids, port_errors)
+        os_ports.update(created)
+        return created
+
+    def os_create_ports(self, context, port_ids, errors=None):
+        """Creates ports in neutron with bulk requests.
+
+        If a bulk request fails, the ports are created one at a time
+        with topology_api.os_create_port instead, so one bad port fails
+        only its own vm. The error of a port that still fails goes in
+        ``errors`` and the port is left out of the result; without
+        ``errors`` it is raised.
+
+        :returns: dict of port id to ``{'port_id', 'os_port_uuid'}``, as
+                  topology_api.os_create_port returns for one port; ports
+                  created in bulk also have ``ipaddrs`` and
+                  ``mac_address``.
+        """
+        if not port_ids:
+            return {}
+        try:
+            return self._neutron_create_ports(port_ids)
+        except Exception as ex:
+            LOG.warn('bulk create of %s ports failed, creating them one '
+                     'at a time: %s' % (len(port_ids), ex))
+        created = {}
+        for port_id in port_ids:
+            try:
+                created[port_id] = self.topology_api.os_create_port(
+                    context, port_id)
+            except Exception as ex:
+                if errors is None:
+                    raise
+                LOG.exception(ex)
+                errors[port_id] = ex
+        return created
+
+    def _neutron_create_ports(self, port_ids):
+        """Creates ports with bulk neutron requests.
+
+        The bodies carry what os_create_port sets on a port: its device
+        owner, the tenant of its network and the configured security
+        groups. The new os port uuids, with the fixed ip and mac neutron
+        gave each port, are recorded in one transaction, and the neutron
+        ports are deleted again if that fails.
+        """
+        specs = self.driver.ports_get_os_specs(port_ids)
+        tenants = neutron.network_tenants(
+            set(spec['os_network_uuid'] for spec in specs.values()))
+        security_groups = CONF.container_neutron.security_groups
+        bodies = []
+        for port_id in port_ids:
+            spec = specs[port_id]
+            fixed_ip = {'subnet_id': spec['os_subnet_uuid']}
+            if spec['ipaddrs']:
+                fixed_ip['ip_address'] = spec['ipaddrs']
+            body = {'name': spec['name'],
+                    'network_id': spec['os_network_uuid'],
+                    'tenant_id': tenants[spec['os_network_uuid']],
+                    'device_owner': spec['device_owner'] or '',
+                    'admin_state_up': True,
+                    'fixed_ips': [fixed_ip]}
+            if security_groups:
+                body['security_groups'] = security_groups
+            bodies.append(body)
+        os_port_refs = neutron.create_ports(bodies)
+
+        values = []
+        for port_id, os_port in zip(port_ids, os_port_refs):
+            fixed_ips = os_port.get('fixed_ips') or [{}]
+            values.append({'port_id': port_id,
+                           'os_port_uuid': os_port['id'],
+                           'ipaddrs': fixed_ips[0].get('ip_address'),
+                           'mac_address': os_port.get('mac_address')})
+        try:
+            self.driver.os_ports_bulk_create(values)
+        except Exception:
+            neutron.delete_ports([v['os_port_uuid'] for v in values])
+            raise
+        return dict((v['port_id'], v) for v in values)
+
+    def _os_create_vm(self, context, graph, expt_id, device,
+                      network_mapper, os_ports, port_errors, resume=False):
+        nics = []
+        for port in device['ports']:
+            os_port = os_ports.get(port['port_id'])
+            if port['port_id'] in port_errors:
+                raise port_errors[port['port_id']]
+            if os_port is None:
+                raise taskgraph.TaskSkipped(
+                    ('vm', device['device_id']),
+                    graph.errors.get(('network', port['network_id'])))
+            nics.append({
+                'network_uuid': network_mapper.get(port['network_id']),
+                'port_uuid': os_port['os_port_uuid']
+            })
+        if resume:
+            device_ref = self.topology_api.get_device_detail(
+                device['device_id'])
+            if self.vm_api.get_os_vm_by_vmid(device_ref['obj_id']):
+                return
+        try:
+            LOG.info('container expt create os vm. device_id: %s, nics: %s'
+                     % (device['device_id'], nics))
+            self.vm_api.create_os_vm(
+                context, device['device_id'],
+                nics, get_os_image=True
+            )
+        except Exception as ex:
+            if self.is_expt_deleting(expt_id):
+                graph.abort()
+                raise
+            self._set_device_error(device['device_id'], str(ex))
+            raise
+
     def is_expt_deleting(self, expt_id):
         expt = self.experiment_api.get(expt_id)
         if expt and expt['operate'] == EXPT_OPERATE_DIC['deleting']:
@@ -1,3 +1,26 @@
 
 __author__ = ''
 __data__ = ''
+
+OPERATION_ACTION_DIC = {
+    'create': 'create',
+    'create_batch': 'create_batch',
+    'delete': 'delete',
+}
+
+OPERATION_PHASE_DIC = {
+    'pending': 'pending',
+    'reserving': 'reserving',
+    'materializing': 'materializing',
+    'provisioning': 'provisioning',
+    'deleting': 'deleting',
+    'done': 'done',
+    'error': 'error',
+}
+
+# fields of an experiment detail that ?fields= can select
+EXPT_DETAIL_FIELDS = frozenset([
+    'id', 'name', 'description', 'type', 'state', 'operate', 'owner_id',
+    'owner_name', 'created_at', 'expired_at', 'is_public', 'notes',
+    'topology',
+])
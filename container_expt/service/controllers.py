@@ -1,12 +1,20 @@
 import json
 from oslo_utils import timeutils
+from terra.common import authorization
 from terra.common import dependency
 from terra.common.constants import VM_TYPE_DIC
 from terra import wsgi
 from terra import exception
 from terra.i18n import _
+from oslo_config import cfg
 from webob import exc
 from terra.common.constants import VM_TYPE_DIC
+import webob
+from container_expt.service.constants import OPERATION_ACTION_DIC, \
+    EXPT_DETAIL_FIELDS
+from container_expt.service import jsonstream
+
+CONF = cfg.CONF
 
 
 @dependency.requires("container_expt_api",
@@ -20,6 +28,94 @@ class Experiment(wsgi.V1Controller):
         super(Experiment, self).__init__()
         self.get_member_from_driver = self.container_expt_api.get
 
+    @staticmethod
+    def _query_flag(context, name):
+        value = context.get('query_string', {}).get(name, '')
+        return str(value).lower() in ('1', 'true', 'yes')
+
+    @staticmethod
+    def _is_async(context):
+        # ?async=true returns an operation to poll instead of waiting
+        return Experiment._query_flag(context, 'async')
+
+    @staticmethod
+    def _is_stream(context):
+        # ?stream=true writes the body as it is built, chunked
+        return Experiment._query_flag(context, 'stream')
+
+    @staticmethod
+    def _caller(context):
+        """Returns the user id of the request and whether it is admin."""
+        auth_context = context.get('environment', {}).get(
+            authorization.AUTH_CONTEXT_ENV, {})
+        is_admin = context.get('is_admin', False) or \
+            'admin' in auth_context.get('roles', [])
+        return auth_context.get('user_id'), is_admin
+
+    @staticmethod
+    def _owner_scope(context):
+        """Returns the owner whose experiments the caller may read, or
+        None for admins, who may read them all.
+
+        :raises webob.exc.HTTPForbidden: for a caller that is neither.
+        """
+        user_id, is_admin = Experiment._caller(context)
+        if is_admin:
+            return None
+        if not user_id:
+            raise exc.HTTPForbidden()
+        return user_id
+
+    @staticmethod
+    def _fields(context):
+        """Parses ?fields=state,operate into a sorted list, or None."""
+        value = context.get('query_string', {}).get('fields', '')
+        fields = sorted(set(field.strip() for field in value.split(',')
+                            if field.strip()))
+        unknown = set(fields) - EXPT_DETAIL_FIELDS
+        if unknown:
+            raise exc.HTTPBadRequest(
+                explanation='unknown fields: %s.' % ', '.join(sorted(unknown)))
+        return fields or None
+
+    def _etag(self, context, kind, expt_id, fields=None):
+        # read before the body: a change in between gives an older tag
+        # with a newer body, which only costs the client one more fetch;
+        # an experiment that does not exist raises ExperimentNotFound
+        revision = self.container_expt_api.expt_revision(context, expt_id)
+        return self._tag(kind, expt_id, revision, fields)
+
+    @staticmethod
+    def _tag(kind, expt_id, revision, fields=None):
+        if fields:
+            kind = '%s-%s' % (kind, ','.join(fields))
+        return '"%s-%s-%s"' % (kind, expt_id, revision)
+
+    @staticmethod
+    def _not_modified(context, etag):
+        value = context.get('headers', {}).get('If-None-Match', '')
+        tags = [tag.strip() for tag in value.split(',')]
+        tags = [tag[2:] if tag.startswith('W/') else tag for tag in tags]
+        return etag in tags or '*' in tags
+
+    @staticmethod
+    def _render_with_etag(context, etag, ref, stream=False):
+        if ref is None:
+            return wsgi.render_response(status=(304, 'Not Modified'),
+                                        headers=[('ETag', etag)])
+        if stream:
+            # no content length: the wsgi server sends it chunked
+            response = webob.Response(
+                app_iter=jsonstream.iterencode(
+                    Experiment.wrap_member(context, ref)),
+                content_type='application/json',
+                charset='utf-8')
+            response.headers['ETag'] = etag
+            return response
+        return wsgi.render_response(
+            body=Experiment.wrap_member(context, ref),
+            headers=[('ETag', etag)])
+
     def create(self, context, experiment):
         """
 
@@ -82,17 +178,214 @@ class Experiment(wsgi.V1Controller):
                    }
                """
         ref = self._normalize_dict(experiment)
+        if self._is_async(context):
+            operation = self.container_expt_api.operation_create(
+                OPERATION_ACTION_DIC['create'],
+                owner_id=self._caller(context)[0])
+            self.container_expt_rpcapi.expt_create_async(operation['id'], ref)
+            return {'operation': operation}
         ref = self.container_expt_rpcapi.expt_create(ref)
         return Experiment.wrap_member(context, ref)
 
+    def create_batch(self, context, experiment, count=None, owners=None):
+        """Creates identical copies of one experiment, e.g. for a class.
+
+                experiment: the same dict as for create
+                count: number of copies, all owned by the experiment owner
+                owners: or one {"owner_id": "", "owner_name": ""} per copy
+
+        Copy i is named "<name>_<i>". Copies that fail are reported in
+        "errors" while the others are created.
+        """
+        if owners:
+            count = len(owners)
+        try:
+            count = int(count)
+        except (TypeError, ValueError):
+            return exc.HTTPBadRequest(
+                explanation='count or owners MUST exist in body.')
+        if count < 1 or count > CONF.container_batch_max:
+            return exc.HTTPBadRequest(
+                explanation='count must be between 1 and %s.'
+                            % CONF.container_batch_max)
+        ref = self._normalize_dict(experiment)
+        if self._is_async(context):
+            operation = self.container_expt_api.operation_create(
+                OPERATION_ACTION_DIC['create_batch'],
+                owner_id=self._caller(context)[0])
+            self.container_expt_rpcapi.expt_create_batch_async(
+                operation['id'], ref, count, owners)
+            return {'operation': operation}
+        return self.container_expt_rpcapi.expt_create_batch(ref, count,
+                                                            owners)
+
     def delete(self, context, expt_id):
+        if self._is_async(context):
+            operation = self.container_expt_api.operation_create(
+                OPERATION_ACTION_DIC['delete'], expt_id=expt_id,
+                owner_id=self._caller(context)[0])
+            self.container_expt_rpcapi.expt_delete_async(operation['id'],
+                                                         expt_id)
+            return {'operation': operation}
         self.container_expt_rpcapi.expt_delete(expt_id)
 
+    def list_experiments(self, context):
+        """Lists experiments newest first.
+
+        ``?owner_id=&type=&state=`` filter the list and ``?limit=`` sizes
+        the page; users other than admins only ever list their own
+        experiments, whatever ``owner_id`` they pass. Experiments being deleted are only listed with
+        ``?deleting=true``. The response has a ``next`` cursor while there
+        are more experiments; pass it back as ``?cursor=`` for the next
+        page.
+
+        ``?ids=1,2,3`` instead returns those experiments, with the states
+        of their devices, in one round trip; see detail_batch.
+        """
+        query = context.get('query_string', {})
+        if query.get('ids'):
+            return self.detail_batch(context)
+        filters = dict((key, query[key])
+                       for key in ('owner_id', 'type', 'state')
+                       if query.get(key))
+        try:
+            owner_id = self._owner_scope(context)
+        except exc.HTTPForbidden as err:
+            return err
+        if owner_id is not None:
+            filters['owner_id'] = owner_id
+        filters['deleting'] = self._query_flag(context, 'deleting')
+        try:
+            limit = int(query['limit']) if query.get('limit') else None
+        except ValueError:
+            return exc.HTTPBadRequest(explanation='limit must be an integer.')
+        if limit is not None and limit < 1:
+            return exc.HTTPBadRequest(explanation='limit must be positive.')
+        try:
+            return self.container_expt_api.expt_list(
+                context, filters, limit, query.get('cursor'))
+        except ValueError:
+            return exc.HTTPBadRequest(explanation='invalid cursor.')
+
+    def states(self, context, expt_id):
+        """Returns the state and operate of an experiment and of each of
+        its devices, with its revision, and an ETag like detail.
+
+        The body is read first, in one query, and tagged with the
+        revision it was read with; it is small enough that a 304 only
+        saves sending it.
+        """
+        ref = self.container_expt_api.expt_states(context, expt_id)
+        if ref is None:
+            raise exception.ExperimentNotFound(expt_id=expt_id)
+        etag = self._tag('states', expt_id, ref['revision'])
+        if self._not_modified(context, etag):
+            return self._render_with_etag(context, etag, None)
+        return wsgi.render_response(body=ref, headers=[('ETag', etag)])
+
+    def detail_batch(self, context):
+        """Returns many experiments at once, e.g. for a dashboard.
+
+        ``?ids=1,2,3`` selects the experiments and ``?fields=`` their
+        fields, as for detail except that the topology is not available.
+        Each experiment comes with its revision and the id, name, state
+        and operate of its devices; ids that do not exist are listed in
+        ``missing``, as are, for users other than admins, the ids of
+        experiments of other owners.
+        """
+        query = context.get('query_string', {})
+        try:
+            expt_ids = [int(expt_id) for expt_id in
+                        query.get('ids', '').split(',') if expt_id.strip()]
+        except ValueError:
+            return exc.HTTPBadRequest(explanation='ids must be integers.')
+        limit = CONF.container_expt_batch_detail_max
+        if not expt_ids or len(expt_ids) > limit:
+            return exc.HTTPBadRequest(
+                explanation='ids must list 1 to %s experiments.' % limit)
+        try:
+            fields = self._fields(context)
+        except exc.HTTPBadRequest as err:
+            return err
+        if fields and 'topology' in fields:
+            return exc.HTTPBadRequest(
+                explanation='topology is not available in a batch.')
+        try:
+            owner_id = self._owner_scope(context)
+        except exc.HTTPForbidden as err:
+            return err
+        # keep the order of the request, without duplicates
+        expt_ids = sorted(set(expt_ids), key=expt_ids.index)
+        return self.container_expt_rpcapi.expt_detail_batch(expt_ids, fields,
+                                                            owner_id)
+
+    def events(self, context, expt_id):
+        """Returns the progress events after the ``since`` cursor.
+
+        With ``wait`` the request is held up to that many seconds until
+        there is something new, so clients can long-poll it.
+        """
+        query = context.get('query_string', {})
+        try:
+            since = int(query.get('since', 0))
+            wait = int(query.get('wait', 0))
+        except ValueError:
+            return exc.HTTPBadRequest(
+                explanation='since and wait must be integers.')
+        return self.container_expt_api.expt_events(context, expt_id,
+                                                   since, wait)
+
+    def operation(self, context, op_id):
+        """Reports the phase, progress and result of an async operation.
+
+        Only the user who started it and admins can read it; to anyone
+        else it does not exist.
+        """
+        operation = self.container_expt_api.operation_get(op_id)
+        user_id, is_admin = self._caller(context)
+        if not operation or \
+                not is_admin and operation['owner_id'] != user_id:
+            raise exception.NotFound(target='operation %s' % op_id)
+        return {'operation': operation}
+
+    def expiry_stats(self, context):
+        """Reports the totals of the expiry task: the experiments, vms,
+        cpus, memory and disk it gave back and the deletes that failed.
+
+        Only admins can read it.
+        """
+        if not self._caller(context)[1]:
+            return exc.HTTPForbidden()
+        return {'expiry': self.container_expt_api.expt_expire_stats(context)}
+
     def detail(self, context, expt_id):
-        ref = self.container_expt_rpcapi.expt_detail(expt_id)
+        """Returns an experiment with its topology.
+
+        The response carries an ETag that changes with the experiment
+        revision; a request whose If-None-Match still matches it gets a
+        304 without the body being built.
+
+        ``?fields=state,operate`` returns only those fields, and the
+        topology is only loaded when ``topology`` is among them.
+
+        ``?stream=true`` loads and writes the topology one topo at a
+        time instead of building the whole response first.
+        """
+        try:
+            fields = self._fields(context)
+        except exc.HTTPBadRequest as err:
+            return err
+        etag = self._etag(context, 'detail', expt_id, fields)
+        if self._not_modified(context, etag):
+            return self._render_with_etag(context, etag, None)
+        if self._is_stream(context):
+            ref = self.container_expt_api.expt_detail_stream(
+                context, expt_id, fields)
+            return self._render_with_etag(context, etag, ref, stream=True)
+        ref = self.container_expt_rpcapi.expt_detail(expt_id, fields)
         if not ref:
             raise exception.ExperimentNotFound(expt_id=expt_id)
-        return Experiment.wrap_member(context, ref)
+        return self._render_with_etag(context, etag, ref)
 
     def restart(self, context, expt_id, experiment):
         try:
@@ -113,8 +406,18 @@ class Experiment(wsgi.V1Controller):
             return exc.HTTPBadRequest(explanation=err.format_message())
 
     def topology(self, context, expt_id):
+        """Returns the topologies of an experiment, with an ETag and
+        ``?stream=true`` like detail.
+        """
+        etag = self._etag(context, 'topology', expt_id)
+        if self._not_modified(context, etag):
+            return self._render_with_etag(context, etag, None)
+        if self._is_stream(context):
+            ref = self.container_expt_api.expt_topology_stream(context,
+                                                               expt_id)
+            return self._render_with_etag(context, etag, ref, stream=True)
         ref = self.container_expt_rpcapi.expt_topology(expt_id)
-        return Experiment.wrap_member(context, ref)
+        return self._render_with_etag(context, etag, ref)
 
     # -------------------device--------------#
     def create_device(self, context, device):
@@ -1,8 +1,14 @@
 import abc
+import base64
+import collections
 import eventlet
+import datetime
 import json
+import uuid
 from oslo_config import cfg
 from oslo_log import log
+from oslo_serialization import jsonutils
+from oslo_utils import timeutils
 import six
 from terra import exception
 from terra.common.cloudapi import CloudAPI
@@ -13,15 +19,64 @@ from terra.common import utils
 from terra.common import vm_states
 from .business.experiment.experiment import Experiment
 from .business.device.device import Device
+from .business.event.event import Event
+from .business.expiry.expiry import Expiry
+from .business.quota.quota import Quota
+from .business.reaper.reaper import Reaper
+from .business.revision.revision import Revision
+from .business.topology.topology import Topology
 from . import clean
+from . import readmode
+from .constants import OPERATION_PHASE_DIC
+
+list_opts = [
+    cfg.IntOpt('container_expt_list_limit',
+               default=50,
+               help='Default page size of the experiment listing.'),
+    cfg.IntOpt('container_expt_list_max_limit',
+               default=1000,
+               help='Largest page size a client may ask the experiment '
+                    'listing for.'),
+    cfg.IntOpt('container_expt_batch_detail_max',
+               default=200,
+               help='Most experiments one batch detail request may ask '
+                    'for.'),
+]
 
 CONF = cfg.CONF
+CONF.register_opts(list_opts)
 
 LOG = log.getLogger(__name__)
 
 MEMOIZE = cache.get_memoization_decorator(group='experiment')
 
 
+_CURSOR_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+# names the stored mark of the revision sweep
+REVISION_SWEEP_MARK = 'expt_revisions'
+
+
+def _encode_cursor(expt_ref):
+    value = '%s|%s' % (expt_ref['created_at'].strftime(_CURSOR_TIME_FORMAT),
+                       expt_ref['id'])
+    return base64.urlsafe_b64encode(value)
+
+
+def _decode_cursor(cursor):
+    """Returns the (created_at, id) a cursor points after.
+
+    :raises ValueError: if the cursor was not made by _encode_cursor.
+    """
+    try:
+        created_at, expt_id = base64.urlsafe_b64decode(
+            str(cursor)).split('|')
+        return (datetime.datetime.strptime(created_at, _CURSOR_TIME_FORMAT),
+                int(expt_id))
+    except (TypeError, ValueError):
+        raise ValueError('invalid cursor %s' % cursor)
+
+
 def filter_experiment(experiment_ref):
     if experiment_ref:
         experiment_ref = experiment_ref.copy()
@@ -40,6 +95,8 @@ class ExperimentManager(manager.Manager):
         super(ExperimentManager, self).__init__(CONF.container_expt.driver)
         self.cloud_api = CloudAPI()
         self._sync_power_pool = eventlet.GreenPool()
+        self._reaper = Reaper(driver=self.driver)
+        self._expiry = Expiry(driver=self.driver)
 
     # what is this 'context'
     def expt_create(self, context, topo_dict):
@@ -47,20 +104,210 @@ class ExperimentManager(manager.Manager):
         ref = experiment.create(topo_dict)
         return ref
 
-    def expt_delete(self, context, expt_id):
-        experiment = Experiment(context=context, expt_id=expt_id,
-                                driver=self.driver)
-        experiment.delete()
+    def expt_create_batch(self, context, topo_dict, count, owners=None):
+        experiment = Experiment(context=context, driver=self.driver)
+        return experiment.create_batch(topo_dict, count, owners)
 
-    def expt_detail(self, context, expt_id):
+    def expt_delete(self, context, expt_id, op_id=None):
         experiment = Experiment(context=context, expt_id=expt_id,
                                 driver=self.driver)
+        experiment.delete(op_id)
+
+    def expt_detail(self, context, expt_id, fields=None):
+        info = self.driver.expt_revision_info(expt_id)
+        # a canonical, hashable form keys the cache
+        fields = tuple(sorted(set(fields))) if fields else None
         try:
-            ret = experiment.detail()
+            with readmode.replica(info['changed_at']):
+                ret = self._expt_detail(expt_id, info['revision'], fields)
         except exception.ExperimentNotFound:
             ret = dict()
         return ret
 
+    @MEMOIZE
+    def _expt_detail(self, expt_id, revision, fields):
+        # keyed by revision: a change bumps it, so no entry is ever stale
+        experiment = Experiment(expt_id=expt_id, driver=self.driver)
+        return self._read_revision(expt_id, revision,
+                                   lambda: experiment.detail(fields))
+
+    def _read_revision(self, expt_id, revision, read):
+        """Runs ``read`` for a payload cached under ``revision``.
+
+        The revision is bumped after the change it stands for, so a
+        replica that has the revision has the change too; a replica
+        further behind than container_replica_max_lag does not, and
+        the payload is then read from the primary instead.
+        """
+        if readmode.use_slave() and \
+                self.driver.expt_revision_get(expt_id) < revision:
+            LOG.debug('replica behind revision %s of experiment %s'
+                      % (revision, expt_id))
+            with readmode.primary():
+                return read()
+        return read()
+
+    def operation_create(self, action, expt_id=None, owner_id=None):
+        values = {'id': str(uuid.uuid4()),
+                  'action': action,
+                  'expt_id': expt_id,
+                  'owner_id': owner_id,
+                  'phase': OPERATION_PHASE_DIC['pending'],
+                  'progress': 0}
+        return self.driver.operation_create(values)
+
+    def operation_get(self, op_id):
+        operation = self.driver.operation_get(op_id)
+        if operation and operation['result']:
+            operation['result'] = jsonutils.loads(operation['result'])
+        return operation
+
+    def _operation_progress(self, op_id):
+        def progress(phase, percent):
+            try:
+                self.driver.operation_update(
+                    op_id, {'phase': phase, 'progress': percent})
+            except Exception as ex:
+                LOG.exception(ex)
+        return progress
+
+    def _operation_failed(self, op_id, ex):
+        LOG.exception(ex)
+        self.driver.operation_update(
+            op_id, {'phase': OPERATION_PHASE_DIC['error'],
+                    'failure_info': str(ex)[:256]})
+
+    def expt_create_async(self, context, op_id, topo_dict):
+        experiment = Experiment(context=context, driver=self.driver)
+        try:
+            ref = experiment.create(topo_dict,
+                                    progress=self._operation_progress(op_id),
+                                    op_id=op_id)
+        except Exception as ex:
+            self._operation_failed(op_id, ex)
+            return
+        self.driver.operation_update(
+            op_id, {'phase': OPERATION_PHASE_DIC['provisioning'],
+                    'progress': 95,
+                    'expt_id': ref['id'],
+                    'result': jsonutils.dumps(ref)})
+        # os_create completes it; this covers provisions that all
+        # finished already, or that could not be recorded
+        self.driver.operation_finish_provisioned(op_id)
+
+    def expt_create_batch_async(self, context, op_id, topo_dict, count,
+                                owners=None):
+        experiment = Experiment(context=context, driver=self.driver)
+        try:
+            ret = experiment.create_batch(
+                topo_dict, count, owners,
+                progress=self._operation_progress(op_id), op_id=op_id)
+        except Exception as ex:
+            self._operation_failed(op_id, ex)
+            return
+        self.driver.operation_update(
+            op_id, {'phase': OPERATION_PHASE_DIC['provisioning'],
+                    'progress': 95,
+                    'result': jsonutils.dumps(ret)})
+        self.driver.operation_finish_provisioned(op_id)
+
+    def expt_delete_async(self, context, op_id, expt_id):
+        self.driver.operation_update(
+            op_id, {'phase': OPERATION_PHASE_DIC['deleting'],
+                    'progress': 10})
+        try:
+            self.expt_delete(context, expt_id, op_id)
+        except Exception as ex:
+            self._operation_failed(op_id, ex)
+        # the reaper moves the operation on as it tears the experiment down
+
+    def expt_list(self, context, filters, limit=None, cursor=None):
+        """Lists experiments newest first, a page at a time.
+
+        ``cursor`` is the opaque ``next`` of the previous page; the last
+        page has no ``next``.
+
+        :raises ValueError: if the cursor is not valid.
+        """
+        limit = min(limit or CONF.container_expt_list_limit,
+                    CONF.container_expt_list_max_limit)
+        after = _decode_cursor(cursor) if cursor else None
+        # one row more tells whether there is a next page; a listing
+        # tolerates the replica lag
+        with readmode.replica():
+            expts = self.driver.expt_list_page(filters, limit + 1, after)
+        ret = {'experiments': expts[:limit]}
+        if len(expts) > limit:
+            ret['next'] = _encode_cursor(expts[limit - 1])
+        return ret
+
+    def expt_detail_batch(self, context, expt_ids, fields=None,
+                          owner_id=None):
+        """Returns many experiments with the states of their vms.
+
+        The experiments, their vms and their revisions are each read with
+        one query, whatever the number of experiments. The topology is
+        not part of it. With ``owner_id``, experiments of other owners
+        are reported missing, as if they did not exist.
+
+        :returns: {'experiments': [...], 'missing': [ids not found]}
+        """
+        infos = self.driver.expt_revisions_info(expt_ids)
+        changed = [info['changed_at'] for info in infos.values()
+                   if info['changed_at']]
+        with readmode.replica(max(changed) if changed else None):
+            expts = dict((expt['id'], expt)
+                         for expt in self.driver.expt_get_many(expt_ids)
+                         if owner_id is None or expt['owner_id'] == owner_id)
+            states = self.driver.expt_device_states(expts.keys())
+        devices = collections.defaultdict(list)
+        for expt_id, device_id, name, state, operate in states:
+            devices[expt_id].append({'id': device_id, 'name': name,
+                                     'state': state, 'operate': operate})
+        ret = {'experiments': [], 'missing': []}
+        for expt_id in expt_ids:
+            expt = expts.get(expt_id)
+            if expt is None:
+                ret['missing'].append(expt_id)
+                continue
+            if fields:
+                expt = dict((key, expt[key])
+                            for key in set(fields) | {'id'})
+            expt['revision'] = infos[expt_id]['revision']
+            expt['devices'] = devices[expt_id]
+            ret['experiments'].append(expt)
+        return ret
+
+    def expt_states(self, context, expt_id):
+        """Returns the state of an experiment and of its vms, for
+        pollers; the experiment, its revision and its vms are one
+        query, with nothing else assembled. The revision is checked for
+        terra-side changes as in expt_revision, so it keys the ETag.
+
+        :returns: {'id', 'state', 'operate', 'revision',
+                   'devices': {device_id: [state, operate]}}, or None if
+                  the experiment does not exist.
+        """
+        ref = self.driver.expt_states_get(expt_id)
+        if ref is not None and self._changed_behind(expt_id,
+                                                    ref['changed_at']):
+            Revision(driver=self.driver).bump(expt_id)
+            ref = self.driver.expt_states_get(expt_id)
+        if ref is None:
+            return None
+        return {'id': ref['id'],
+                'state': ref['state'],
+                'operate': ref['operate'],
+                'revision': ref['revision'],
+                'devices': dict((device_id, [state, operate])
+                                for device_id, _, state, operate
+                                in ref['devices'])}
+
+    def expt_events(self, context, expt_id, since=0, wait=0):
+        events = Event(driver=self.driver).since(expt_id, since, wait)
+        return {'events': events,
+                'cursor': events[-1]['seq'] if events else since}
+
     def expt_restart(self, context, expt_id):
         experiment = Experiment(context=context, expt_id=expt_id,
                                 driver=self.driver)
@@ -76,10 +323,89 @@ class ExperimentManager(manager.Manager):
                                 driver=self.driver)
         experiment.stop()
 
-    def expt_topology(self, context, expt_id):
+    def expt_detail_stream(self, context, expt_id, fields=None):
+        """Like expt_detail, but uncached and with the topology as a
+        generator for jsonstream; it has to run where the response is
+        written, as a generator cannot go through rpc.
+
+        :raises terra.exception.ExperimentNotFound:
+        """
+        info = self.driver.expt_revision_info(expt_id)
         experiment = Experiment(context=context, expt_id=expt_id,
                                 driver=self.driver)
-        return experiment.topology()
+        with readmode.replica(info['changed_at']):
+            return experiment.detail(fields, stream=True)
+
+    def expt_topology_stream(self, context, expt_id):
+        info = self.driver.expt_revision_info(expt_id)
+        experiment = Experiment(context=context, expt_id=expt_id,
+                                driver=self.driver)
+        with readmode.replica(info['changed_at']):
+            return experiment.topology(stream=True)
+
+    def expt_revision(self, context, expt_id):
+        """Returns the revision of an experiment, the key of its ETags.
+
+        Rows terra wrote since the last bump, e.g. a vm state nova
+        reported, bump it first, so a tag never outlives what it covers
+        until the next sweep. A change in the same second as the bump is
+        left to the sweep, whose window overlaps by a second.
+
+        :raises terra.exception.ExperimentNotFound: if the experiment
+            does not exist, so that no tag of it is ever honoured.
+        """
+        info = self.driver.expt_revision_info(expt_id)
+        # every experiment changed through this service has a revision
+        # row; only the others need the existence check
+        if info['changed_at'] is None and \
+                self.driver.expt_get(expt_id) is None:
+            raise exception.ExperimentNotFound(expt_id=expt_id)
+        if not self._changed_behind(expt_id, info['changed_at']):
+            return info['revision']
+        Revision(driver=self.driver).bump(expt_id)
+        return self.driver.expt_revision_get(expt_id)
+
+    def _changed_behind(self, expt_id, changed_at):
+        """Whether terra wrote a row of the experiment since its
+        revision was bumped at ``changed_at``; one without a revision
+        row is bumped once to start counting from there.
+        """
+        if changed_at is None:
+            return True
+        return bool(self.driver.expt_ids_changed_since(changed_at,
+                                                       [expt_id]))
+
+    def expt_topology(self, context, expt_id):
+        info = self.driver.expt_revision_info(expt_id)
+        with readmode.replica(info['changed_at']):
+            return self._expt_topology(expt_id, info['revision'])
+
+    @MEMOIZE
+    def _expt_topology(self, expt_id, revision):
+        experiment = Experiment(expt_id=expt_id, driver=self.driver)
+        return self._read_revision(expt_id, revision, experiment.topology)
+
+    def expt_sync_revisions(self, context, interval):
+        """Bumps the revision of experiments changed behind our back.
+
+        Every table the detail reads is also written by terra, e.g. when
+        nova reports a vm state change, without going through the
+        revision counter; their created_at and updated_at stamps catch
+        those changes. The sweep resumes from the mark the last sweep
+        stored, or looks ``interval`` seconds back when there is none.
+        """
+        now = timeutils.utcnow()
+        since = self.driver.sweep_mark_get(REVISION_SWEEP_MARK)
+        if since is None:
+            since = now - datetime.timedelta(seconds=interval)
+        # one second of overlap for stamps written in the same second
+        # as the previous sweep
+        expt_ids = self.driver.expt_ids_changed_since(
+            since - datetime.timedelta(seconds=1))
+        if expt_ids:
+            Revision(driver=self.driver).bump(*expt_ids)
+        self.driver.sweep_mark_set(REVISION_SWEEP_MARK, now)
+        return len(expt_ids)
 
     def _get_device_type(self, device_id):
         vm_ref = self.vm_api.get_vm_by_device(device_id)
@@ -90,13 +416,45 @@ class ExperimentManager(manager.Manager):
         return device_type
 
     def device_create(self, context, device_values):
-        device = Device(context=context)
+        device = Device(context=context, driver=self.driver)
         return device.create(device_values)
 
     def device_delete(self, context, device_id):
-        device = Device(context=context, id=device_id)
+        device = Device(context=context, id=device_id, driver=self.driver)
         device.delete()
 
+    def provision_resume(self, context):
+        """Resumes the os_create of topologies whose worker went away."""
+        token = str(uuid.uuid4())
+        stale_before = timeutils.utcnow() - datetime.timedelta(
+            seconds=CONF.container_provision_stale_timeout)
+        provisions = self.driver.provision_claim_stale(token, stale_before)
+        for provision in provisions:
+            topo = Topology(context=context, driver=self.driver)
+            self._sync_power_pool.spawn_n(topo.os_resume, context, provision)
+        return len(provisions)
+
+    def expt_reap(self, context):
+        """Starts tearing down due deleted experiments.
+
+        :returns: the number of experiments claimed.
+        """
+        return self._reaper.run(context)
+
+    def expt_expire(self, context):
+        """Deletes a batch of experiments past their expired_at.
+
+        :returns: the counts of the run, see Expiry.run.
+        """
+        return self._expiry.run(context)
+
+    def expt_expire_stats(self, context):
+        """Returns the totals of the expiry task, see Expiry.stats."""
+        return self._expiry.stats()
+
+    def quota_reclaim(self, context):
+        return Quota(driver=self.driver).reclaim()
+
     def device_start(self, context, device_id):
         self.vne_experiemnt_api.device_start(device_id)
 
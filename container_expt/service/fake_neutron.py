@@ -0,0 +1,122 @@
+""" In-memory neutron endpoint for running the bulk port path offline.
+
+Only the port resource, and the tenant of networks, are served, which
+is all that container_expt.service.neutron talks to::
+
+    python -m container_expt.service.fake_neutron 9696
+
+then set ``[container_neutron] url = http://127.0.0.1:9696`` and
+``auth_strategy = noauth``.
+"""
+
+import json
+import sys
+import uuid
+
+import eventlet
+from eventlet import wsgi
+import webob
+import webob.dec
+import webob.exc
+
+
+class FakeNeutron(object):
+
+    def __init__(self, tenant_id='fake'):
+        self.ports = {}
+        self.tenant_id = tenant_id
+        self._last_host = 1
+
+    def _allocate(self, body, taken):
+        """Gives each fixed ip without an address the next free one; an
+        address already taken is refused, as neutron does.
+        """
+        fixed_ips = []
+        for fixed_ip in body.get('fixed_ips') or [{}]:
+            fixed_ip = dict(fixed_ip)
+            address = fixed_ip.get('ip_address')
+            if address in taken:
+                raise webob.exc.HTTPConflict(
+                    explanation='IP address %s already allocated' % address)
+            while address is None or address in taken:
+                self._last_host += 1
+                address = '10.0.%d.%d' % divmod(self._last_host, 256)
+            fixed_ip['ip_address'] = address
+            taken.add(address)
+            fixed_ips.append(fixed_ip)
+        return fixed_ips
+
+    def _create_port(self, body, taken):
+        if not body.get('network_id'):
+            raise webob.exc.HTTPBadRequest(explanation='network_id missing')
+        port = {
+            'id': str(uuid.uuid4()),
+            'name': body.get('name', ''),
+            'network_id': body['network_id'],
+            'admin_state_up': body.get('admin_state_up', True),
+            'status': 'DOWN',
+            'mac_address': 'fa:16:3e:%02x:%02x:%02x' % tuple(
+                ord(c) for c in uuid.uuid4().bytes[:3]),
+            'fixed_ips': self._allocate(body, taken),
+            'device_id': body.get('device_id', ''),
+            'device_owner': body.get('device_owner', ''),
+            'tenant_id': body.get('tenant_id', self.tenant_id),
+            'security_groups': body.get('security_groups', []),
+        }
+        return port
+
+    @webob.dec.wsgify
+    def __call__(self, req):
+        parts = [p for p in req.path.split('/') if p]
+        if parts[:1] == ['v2.0']:
+            parts = parts[1:]
+        if parts in (['networks'], ['networks.json']) and \
+                req.method == 'GET':
+            # any network exists, owned by the one fake tenant
+            networks = [{'id': net_id, 'tenant_id': self.tenant_id}
+                        for net_id in req.GET.getall('id')]
+            return webob.Response(body=json.dumps({'networks': networks}),
+                                  content_type='application/json')
+        if not parts or parts[0] not in ('ports', 'ports.json'):
+            raise webob.exc.HTTPNotFound()
+        port_id = parts[1].replace('.json', '') if len(parts) > 1 else None
+
+        if req.method == 'POST' and port_id is None:
+            body = json.loads(req.body)
+            taken = set(fixed_ip['ip_address']
+                        for port in self.ports.values()
+                        for fixed_ip in port['fixed_ips'])
+            if 'ports' in body:
+                # bulk requests are all or nothing, like neutron
+                ports = [self._create_port(p, taken) for p in body['ports']]
+                ret = {'ports': ports}
+            else:
+                ports = [self._create_port(body['port'], taken)]
+                ret = {'port': ports[0]}
+            for port in ports:
+                self.ports[port['id']] = port
+            return webob.Response(status=201, body=json.dumps(ret),
+                                  content_type='application/json')
+        if req.method == 'GET' and port_id is None:
+            return webob.Response(
+                body=json.dumps({'ports': self.ports.values()}),
+                content_type='application/json')
+        if port_id not in self.ports:
+            raise webob.exc.HTTPNotFound()
+        if req.method == 'GET':
+            return webob.Response(
+                body=json.dumps({'port': self.ports[port_id]}),
+                content_type='application/json')
+        if req.method == 'DELETE':
+            del self.ports[port_id]
+            return webob.Response(status=204)
+        raise webob.exc.HTTPMethodNotAllowed()
+
+
+def main():
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 9696
+    wsgi.server(eventlet.listen(('127.0.0.1', port)), FakeNeutron())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+""" Incremental json encoding for responses too big to build whole. """
+
+import collections
+
+from oslo_serialization import jsonutils
+
+CHUNK_SIZE = 64 * 1024
+
+
+def _is_lazy(obj):
+    if isinstance(obj, collections.Iterator):
+        return True
+    if isinstance(obj, dict):
+        return any(_is_lazy(value) for value in obj.values())
+    return False
+
+
+def _iterencode(obj):
+    if isinstance(obj, collections.Iterator):
+        yield '['
+        for i, item in enumerate(obj):
+            if i:
+                yield ', '
+            for chunk in _iterencode(item):
+                yield chunk
+        yield ']'
+    elif isinstance(obj, dict) and _is_lazy(obj):
+        yield '{'
+        for i, (key, value) in enumerate(obj.items()):
+            yield '%s%s: ' % (', ' if i else '', jsonutils.dumps(key))
+            for chunk in _iterencode(value):
+                yield chunk
+        yield '}'
+    else:
+        yield jsonutils.dumps(obj)
+
+
+def iterencode(obj, chunk_size=CHUNK_SIZE):
+    """Encodes ``obj`` to json as a series of strings.
+
+    Iterators, e.g. generators, anywhere in nested dicts are encoded as
+    arrays one item at a time, so each item can be built, encoded and
+    dropped before the next one is built. Everything else is encoded
+    whole. The output is joined into chunks of about ``chunk_size``.
+    """
+    buf = []
+    size = 0
+    for chunk in _iterencode(obj):
+        buf.append(chunk)
+        size += len(chunk)
+        if size >= chunk_size:
+            yield ''.join(buf)
+            buf = []
+            size = 0
+    if buf:
+        yield ''.join(buf)
@@ -0,0 +1,101 @@
+""" Neutron calls that terra's topology api has no bulk form for. """
+
+from neutronclient.v2_0 import client as neutron_client
+from oslo_config import cfg
+from oslo_log import log as logging
+
+neutron_opts = [
+    cfg.BoolOpt('bulk_create_ports',
+                default=False,
+                help='Create the ports of a topology or device batch with '
+                     'bulk neutron requests instead of one request per '
+                     'port.'),
+    cfg.IntOpt('bulk_port_batch_size',
+               default=100,
+               help='Maximum number of ports sent in one bulk request.'),
+    cfg.ListOpt('security_groups',
+                default=[],
+                help='Security groups of ports created in bulk. By default '
+                     'neutron gives them the default group of the tenant '
+                     'of their network.'),
+    cfg.StrOpt('url',
+               help='Neutron endpoint. Point it at '
+                    'container_expt.service.fake_neutron to work offline.'),
+    cfg.StrOpt('auth_strategy',
+               default='keystone',
+               choices=['keystone', 'noauth'],
+               help='Use noauth with the fake neutron endpoint.'),
+    cfg.StrOpt('auth_url',
+               help='Keystone endpoint used to authenticate to neutron.'),
+    cfg.StrOpt('username',
+               help='User name used to authenticate to neutron.'),
+    cfg.StrOpt('password',
+               secret=True,
+               help='Password used to authenticate to neutron.'),
+    cfg.StrOpt('tenant_name',
+               help='Tenant used to authenticate to neutron.'),
+    cfg.IntOpt('timeout',
+               default=60,
+               help='Timeout in seconds for neutron requests.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(neutron_opts, group='container_neutron')
+LOG = logging.getLogger(__name__)
+
+_CLIENT = None
+
+
+def get_client():
+    global _CLIENT
+    if _CLIENT is None:
+        conf = CONF.container_neutron
+        _CLIENT = neutron_client.Client(endpoint_url=conf.url,
+                                        auth_strategy=conf.auth_strategy,
+                                        auth_url=conf.auth_url,
+                                        username=conf.username,
+                                        password=conf.password,
+                                        tenant_name=conf.tenant_name,
+                                        timeout=conf.timeout)
+    return _CLIENT
+
+
+def create_ports(port_bodies):
+    """Creates ports with bulk requests.
+
+    Neutron creates a bulk request all or nothing, so a failed batch
+    leaves no ports behind; batches already created are deleted again
+    before the error is raised.
+
+    :returns: the created ports, in the order of ``port_bodies``.
+    """
+    client = get_client()
+    size = max(CONF.container_neutron.bulk_port_batch_size, 1)
+    os_ports = []
+    try:
+        for start in range(0, len(port_bodies), size):
+            batch = port_bodies[start:start + size]
+            os_ports.extend(
+                client.create_port({'ports': batch})['ports'])
+    except Exception:
+        delete_ports([port['id'] for port in os_ports])
+        raise
+    return os_ports
+
+
+def network_tenants(os_network_uuids):
+    """Returns the tenant of each network, keyed by network uuid."""
+    if not os_network_uuids:
+        return {}
+    networks = get_client().list_networks(
+        id=list(os_network_uuids), fields=['id', 'tenant_id'])['networks']
+    return dict((net['id'], net['tenant_id']) for net in networks)
+
+
+def delete_ports(os_port_uuids):
+    client = get_client()
+    for os_port_uuid in os_port_uuids:
+        try:
+            client.delete_port(os_port_uuid)
+        except Exception as ex:
+            LOG.exception(ex)
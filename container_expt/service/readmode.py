@@ -0,0 +1,93 @@
+""" Routing of read-only experiment queries to the database replica.
+
+Reads run inside ``replica()`` go to ``[database] slave_connection``
+unless the policy says the replica may not have caught up yet: when the
+experiment read changed less than ``container_replica_max_lag`` seconds
+ago, or when the current green thread wrote something less than that
+long ago. Every write path of this service bumps an experiment
+revision, which calls ``wrote()``.
+
+The state is green-thread local. A green thread may serve many requests,
+e.g. on a keep-alive connection, so a write only pins its reads to the
+primary for as long as the replica may lag behind it.
+"""
+
+import contextlib
+import datetime
+import threading
+
+from oslo_config import cfg
+from oslo_utils import timeutils
+
+replica_opts = [
+    cfg.BoolOpt('container_replica_reads',
+                default=False,
+                help='Serve experiment detail, topology and listing reads '
+                     'from [database] slave_connection.'),
+    cfg.IntOpt('container_replica_max_lag',
+               default=5,
+               help='Seconds after a change to an experiment during which '
+                    'it is still read from the primary, to cover the '
+                    'replication lag.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(replica_opts)
+
+_LOCAL = threading.local()
+
+
+def wrote():
+    """Sends the reads of this green thread to the primary until the
+    replica may have caught up with what it wrote.
+    """
+    _LOCAL.wrote_at = timeutils.utcnow()
+
+
+def _lagging(since):
+    lag = datetime.timedelta(seconds=CONF.container_replica_max_lag)
+    return timeutils.utcnow() - since < lag
+
+
+def _wrote_recently():
+    wrote_at = getattr(_LOCAL, 'wrote_at', None)
+    if wrote_at is not None and not _lagging(wrote_at):
+        # from an earlier request served by this green thread
+        _LOCAL.wrote_at = wrote_at = None
+    return wrote_at is not None
+
+
+def _allowed(changed_at):
+    if not CONF.container_replica_reads or _wrote_recently():
+        return False
+    return changed_at is None or not _lagging(changed_at)
+
+
+@contextlib.contextmanager
+def replica(changed_at=None):
+    """Runs the reads of the block on the replica if the policy allows.
+
+    :param changed_at: when the experiment read last changed, if known.
+    """
+    previous = getattr(_LOCAL, 'use_slave', False)
+    _LOCAL.use_slave = _allowed(changed_at)
+    try:
+        yield
+    finally:
+        _LOCAL.use_slave = previous
+
+
+@contextlib.contextmanager
+def primary():
+    """Runs the reads of the block on the primary."""
+    previous = getattr(_LOCAL, 'use_slave', False)
+    _LOCAL.use_slave = False
+    try:
+        yield
+    finally:
+        _LOCAL.use_slave = previous
+
+
+def use_slave():
+    """Whether a read issued now may go to the replica."""
+    return getattr(_LOCAL, 'use_slave', False) and not _wrote_recently()
@@ -13,6 +13,18 @@ class Routers(APIRouter):
                        action='create',
                        conditions={"method": ['POST']})
 
+        # list experiments a page at a time
+        mapper.connect("/container/experiments",
+                       controller=experiment_controller,
+                       action='list_experiments',
+                       conditions={"method": ['GET']})
+
+        # create copies of one experiment, e.g. for a class
+        mapper.connect("/container/experiments/batch",
+                       controller=experiment_controller,
+                       action='create_batch',
+                       conditions={"method": ['POST']})
+
         # delete experiment
         mapper.connect("/container/experiments/{expt_id}",
                        controller=experiment_controller,
@@ -43,12 +55,36 @@ class Routers(APIRouter):
                        action='stop',
                        conditions={"method": ['PUT']})
 
+        # get the state of an experiment and of its devices
+        mapper.connect("/container/experiments/{expt_id}/states",
+                       controller=experiment_controller,
+                       action='states',
+                       conditions={"method": ['GET']})
+
+        # long-poll the progress events of an experiment
+        mapper.connect("/container/experiments/{expt_id}/events",
+                       controller=experiment_controller,
+                       action='events',
+                       conditions={"method": ['GET']})
+
         # get experiment topology
         mapper.connect("/container/topology/{expt_id}",
                        controller=experiment_controller,
                        action='topology',
                        conditions={"method": ['GET']})
 
+        # get the state of an async experiment create or delete
+        mapper.connect("/container/operations/{op_id}",
+                       controller=experiment_controller,
+                       action='operation',
+                       conditions={"method": ['GET']})
+
+        # get the totals of the expiry task
+        mapper.connect("/container/expiry/stats",
+                       controller=experiment_controller,
+                       action='expiry_stats',
+                       conditions={"method": ['GET']})
+
 # -------------------- device -------------------- #
 
         # create device
@@ -24,15 +24,42 @@ class ExperimentAPI(object):
         return cctxt.call(get_current(), 'container_expt_create',
                           topo_dict=topo_dict)
 
+    def expt_create_batch(self, topo_dict, count, owners=None):
+        cctxt = self.client.prepare(timeout=600)
+        return cctxt.call(get_current(), 'container_expt_create_batch',
+                          topo_dict=topo_dict, count=count, owners=owners)
+
+    def expt_create_batch_async(self, op_id, topo_dict, count, owners=None):
+        cctxt = self.client.prepare()
+        cctxt.cast(get_current(), 'container_expt_create_batch_async',
+                   op_id=op_id, topo_dict=topo_dict, count=count,
+                   owners=owners)
+
     def expt_delete(self, expt_id):
         cctxt = self.client.prepare(timeout=300)
         return cctxt.call(get_current(), 'container_expt_delete',
                           expt_id=expt_id)
 
-    def expt_detail(self, expt_id):
+    def expt_create_async(self, op_id, topo_dict):
+        cctxt = self.client.prepare()
+        cctxt.cast(get_current(), 'container_expt_create_async',
+                   op_id=op_id, topo_dict=topo_dict)
+
+    def expt_delete_async(self, op_id, expt_id):
+        cctxt = self.client.prepare()
+        cctxt.cast(get_current(), 'container_expt_delete_async',
+                   op_id=op_id, expt_id=expt_id)
+
+    def expt_detail(self, expt_id, fields=None):
         cctxt = self.client.prepare()
         return cctxt.call(get_current(), 'container_expt_detail',
-                          expt_id=expt_id)
+                          expt_id=expt_id, fields=fields)
+
+    def expt_detail_batch(self, expt_ids, fields=None, owner_id=None):
+        cctxt = self.client.prepare()
+        return cctxt.call(get_current(), 'container_expt_detail_batch',
+                          expt_ids=expt_ids, fields=fields,
+                          owner_id=owner_id)
 
     def expt_restart(self, expt_id):
         cctxt = self.client.prepare()
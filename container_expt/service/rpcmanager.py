@@ -18,7 +18,31 @@ interval_opts = [
     cfg.IntOpt('container_expt_state_sync_interval',
                default=2,
                help='Interval in seconds for sync experiment state between '
-                    'openstack and openlab tables. ')
+                    'openstack and openlab tables. '),
+    cfg.IntOpt('container_quota_reclaim_interval',
+               default=60,
+               help='Interval in seconds for giving back the quota of '
+                    'expired reservations and retrying failed releases. '
+                    'Set to 0 to disable.'),
+    cfg.IntOpt('container_provision_resume_interval',
+               default=60,
+               help='Interval in seconds for resuming the provisioning of '
+                    'topologies left unfinished by a stopped worker. Set '
+                    'to 0 to disable.'),
+    cfg.IntOpt('container_expt_revision_sync_interval',
+               default=30,
+               help='Interval in seconds for invalidating the cached '
+                    'detail and topology of experiments changed outside '
+                    'this service. Set to 0 to disable.'),
+    cfg.IntOpt('container_reap_interval',
+               default=10,
+               help='Interval in seconds for claiming deleted experiments '
+                    'whose openstack resources are to be torn down. Set '
+                    'to 0 to disable.'),
+    cfg.IntOpt('container_expire_interval',
+               default=60,
+               help='Interval in seconds for deleting experiments past '
+                    'their expired_at. Set to 0 to disable.'),
 ]
 
 CONF = cfg.CONF
@@ -38,11 +62,32 @@ class ExperimentRPCManager(rpc.Manager):
     def container_expt_create(self, context, topo_dict):
         return self.container_expt_api.expt_create(context, topo_dict)
 
+    def container_expt_create_batch(self, context, topo_dict, count,
+                                    owners=None):
+        return self.container_expt_api.expt_create_batch(
+            context, topo_dict, count, owners)
+
+    def container_expt_create_batch_async(self, context, op_id, topo_dict,
+                                          count, owners=None):
+        self.container_expt_api.expt_create_batch_async(
+            context, op_id, topo_dict, count, owners)
+
     def container_expt_delete(self, context, expt_id):
         return self.container_expt_api.expt_delete(context, expt_id)
 
-    def container_expt_detail(self, context, expt_id):
-        return self.container_expt_api.expt_detail(context, expt_id)
+    def container_expt_create_async(self, context, op_id, topo_dict):
+        self.container_expt_api.expt_create_async(context, op_id, topo_dict)
+
+    def container_expt_delete_async(self, context, op_id, expt_id):
+        self.container_expt_api.expt_delete_async(context, op_id, expt_id)
+
+    def container_expt_detail(self, context, expt_id, fields=None):
+        return self.container_expt_api.expt_detail(context, expt_id, fields)
+
+    def container_expt_detail_batch(self, context, expt_ids, fields=None,
+                                    owner_id=None):
+        return self.container_expt_api.expt_detail_batch(context, expt_ids,
+                                                         fields, owner_id)
 
     def container_expt_restart(self, context, expt_id):
         self.container_expt_api.expt_restart(context, expt_id)
@@ -80,3 +125,71 @@ class ExperimentRPCManager(rpc.Manager):
         if CONF.container_expt_state_sync_interval <= 0:
             return
 
+    @staticmethod
+    @periodic_task.periodic_task(spacing=CONF.container_quota_reclaim_interval)
+    def container_reclaim_quota(obj, context):
+        """
+        give back quota of expired reservations and failed releases.
+        """
+        if CONF.container_quota_reclaim_interval <= 0:
+            return
+        count = obj.container_expt_api.quota_reclaim(context)
+        if count:
+            LOG.info('container quota reclaim. released %s reservations'
+                     % count)
+
+    @staticmethod
+    @periodic_task.periodic_task(
+        spacing=CONF.container_provision_resume_interval,
+        run_immediately=True)
+    def container_resume_provision(obj, context):
+        """
+        resume os_create of topologies from their last checkpoint.
+        """
+        if CONF.container_provision_resume_interval <= 0:
+            return
+        count = obj.container_expt_api.provision_resume(obj.context)
+        if count:
+            LOG.info('container provision resume. resumed %s topologies'
+                     % count)
+
+    @staticmethod
+    @periodic_task.periodic_task(
+        spacing=CONF.container_expt_revision_sync_interval,
+        run_immediately=True)
+    def container_sync_expt_revision(obj, context):
+        """
+        bump the revision of experiments changed outside this service.
+        """
+        if CONF.container_expt_revision_sync_interval <= 0:
+            return
+        count = obj.container_expt_api.expt_sync_revisions(
+            obj.context, CONF.container_expt_revision_sync_interval)
+        if count:
+            LOG.debug('container expt revision sync. bumped %s experiments'
+                      % count)
+
+    @staticmethod
+    @periodic_task.periodic_task(
+        spacing=CONF.container_reap_interval,
+        run_immediately=True)
+    def container_reap_experiments(obj, context):
+        """
+        tear down the openstack resources of deleted experiments.
+        """
+        if CONF.container_reap_interval <= 0:
+            return
+        count = obj.container_expt_api.expt_reap(obj.context)
+        if count:
+            LOG.info('container expt reap. claimed %s experiments' % count)
+
+    @staticmethod
+    @periodic_task.periodic_task(spacing=CONF.container_expire_interval)
+    def container_expire_experiments(obj, context):
+        """
+        delete experiments past their expired_at.
+        """
+        if CONF.container_expire_interval <= 0:
+            return
+        # Expiry logs what each run released and adds it to the totals
+        obj.container_expt_api.expt_expire(obj.context)
@@ -0,0 +1,87 @@
+""" In-memory stand-ins for the backends of this service. """
+
+import datetime
+
+from oslo_utils import timeutils
+
+
+class FakeRevisionDriver(object):
+    """The revision and change tracking part of the sql driver.
+
+    ``touch`` plays terra writing a row of an experiment, e.g. nova
+    reporting a vm state, without going through this service.
+    """
+
+    def __init__(self, expt_ids=()):
+        self.expts = dict((expt_id, {'id': expt_id, 'state': 'running',
+                                     'operate': 'none'})
+                          for expt_id in expt_ids)
+        self.revisions = {}
+        self.changes = {}
+        self.marks = {}
+        self.now = timeutils.utcnow()
+
+    def tick(self, seconds=1):
+        self.now += datetime.timedelta(seconds=seconds)
+
+    def touch(self, expt_id):
+        self.tick()
+        self.changes[expt_id] = self.now
+
+    def expt_get(self, expt_id):
+        return self.expts.get(expt_id)
+
+    def expt_revision_get(self, expt_id):
+        return self.revisions.get(expt_id, (0, None))[0]
+
+    def expt_revision_info(self, expt_id):
+        revision, changed_at = self.revisions.get(expt_id, (0, None))
+        return {'revision': revision, 'changed_at': changed_at}
+
+    def expt_revisions_bump(self, expt_ids):
+        self.tick()
+        for expt_id in expt_ids:
+            revision = self.expt_revision_get(expt_id)
+            self.revisions[expt_id] = (revision + 1, self.now)
+
+    def expt_states_get(self, expt_id):
+        expt = self.expts.get(expt_id)
+        if expt is None:
+            return None
+        ref = dict(expt, devices=[(10, 'pc1', 'active', 'none')])
+        ref.update(self.expt_revision_info(expt_id))
+        return ref
+
+    def expt_ids_changed_since(self, since, expt_ids=None):
+        return set(expt_id for expt_id, at in self.changes.items()
+                   if at > since and (expt_ids is None or
+                                      expt_id in expt_ids))
+
+    def sweep_mark_get(self, name):
+        return self.marks.get(name)
+
+    def sweep_mark_set(self, name, swept_at):
+        if self.marks.get(name) is None or self.marks[name] < swept_at:
+            self.marks[name] = swept_at
+
+
+class FakePortDriver(object):
+    """The port part of the sql driver, for the bulk port path.
+
+    :param specs: what ports_get_os_specs returns, keyed by port id.
+    """
+
+    def __init__(self, specs):
+        self.specs = specs
+        self.os_ports = {}
+
+    def ports_get_os_specs(self, port_ids):
+        return dict((port_id, self.specs[port_id]) for port_id in port_ids)
+
+    def os_ports_bulk_create(self, values):
+        for value in values:
+            self.os_ports[value['port_id']] = value
+
+    def os_ports_get(self, port_ids):
+        return dict((port_id, self.os_ports[port_id])
+                    for port_id in port_ids if port_id in self.os_ports)
@@ -0,0 +1,121 @@
+import threading
+from wsgiref import simple_server
+
+import fixtures
+import mock
+from oslo_config import fixture as config_fixture
+import testtools
+
+from container_expt.service.business.topology import topology
+from container_expt.service import fake_neutron
+from container_expt.service import neutron
+from container_expt.tests import fakes
+
+
+class _QuietHandler(simple_server.WSGIRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeNeutronFixture(fixtures.Fixture):
+    """Serves a FakeNeutron on a free local port and points
+    container_expt.service.neutron at it.
+    """
+
+    def setUp(self):
+        super(FakeNeutronFixture, self).setUp()
+        self.neutron = fake_neutron.FakeNeutron()
+        server = simple_server.make_server('127.0.0.1', 0, self.neutron,
+                                           handler_class=_QuietHandler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        conf = self.useFixture(config_fixture.Config())
+        conf.config(group='container_neutron',
+                    url='http://127.0.0.1:%s' % server.server_port,
+                    auth_strategy='noauth')
+        patcher = mock.patch.object(neutron, '_CLIENT', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+def _spec(port_id, ipaddrs=None):
+    return {'port_id': port_id,
+            'name': 'port%s' % port_id,
+            'ipaddrs': ipaddrs,
+            'os_subnet_uuid': 'subnet-1',
+            'os_network_uuid': 'network-1',
+            'device_owner': 'compute:container'}
+
+
+class BulkPortsTestCase(testtools.TestCase):
+
+    def setUp(self):
+        super(BulkPortsTestCase, self).setUp()
+        self.neutron = self.useFixture(FakeNeutronFixture()).neutron
+        self.driver = fakes.FakePortDriver(
+            dict((port_id, _spec(port_id)) for port_id in (1, 2, 3)))
+        # skip the dependency injection of __init__
+        self.topology = topology.Topology.__new__(topology.Topology)
+        self.topology.driver = self.driver
+        self.topology.topology_api = mock.Mock()
+
+    def test_bulk_create(self):
+        created = self.topology.os_create_ports({}, [1, 2, 3])
+
+        self.assertEqual(set([1, 2, 3]), set(created))
+        self.assertEqual(3, len(self.neutron.ports))
+        self.assertEqual(set(port['id'] for port in created.values()),
+                         set(self.neutron.ports))
+        self.assertFalse(self.topology.topology_api.os_create_port.called)
+
+    def test_fixed_ip_and_mac_written_back(self):
+        self.driver.specs[2] = _spec(2, ipaddrs='10.0.9.9')
+        self.topology.os_create_ports({}, [1, 2])
+
+        for port_id in (1, 2):
+            value = self.driver.os_ports[port_id]
+            os_port = self.neutron.ports[value['os_port_uuid']]
+            self.assertEqual(os_port['fixed_ips'][0]['ip_address'],
+                             value['ipaddrs'])
+            self.assertEqual(os_port['mac_address'], value['mac_address'])
+            self.assertIsNotNone(value['ipaddrs'])
+        self.assertEqual('10.0.9.9', self.driver.os_ports[2]['ipaddrs'])
+
+    def test_partial_failure_falls_back_to_one_at_a_time(self):
+        # port 2 asks for an address neutron already gave out
+        taken = self.topology.os_create_ports({}, [1])[1]
+        address = self.driver.os_ports[1]['ipaddrs']
+        self.driver.specs[2] = _spec(2, ipaddrs=address)
+        error = Exception('IP address %s already allocated' % address)
+
+        def os_create_port(context, port_id):
+            if port_id == 2:
+                raise error
+            return {'port_id': port_id, 'os_port_uuid': 'single-%s' % port_id}
+        self.topology.topology_api.os_create_port.side_effect = \
+            os_create_port
+
+        errors = {}
+        created = self.topology.os_create_ports({}, [2, 3], errors)
+
+        # the bulk request created nothing, all or nothing
+        self.assertEqual([taken['os_port_uuid']], list(self.neutron.ports))
+        self.assertEqual({3: {'port_id': 3, 'os_port_uuid': 'single-3'}},
+                         created)
+        self.assertEqual({2: error}, errors)
+        self.assertEqual(
+            [mock.call({}, 2), mock.call({}, 3)],
+            self.topology.topology_api.os_create_port.call_args_list)
+
+    def test_partial_failure_raises_without_errors(self):
+        self.topology.topology_api.os_create_port.side_effect = \
+            Exception('down')
+        self.driver.specs[1] = _spec(1, ipaddrs='10.0.9.9')
+        self.driver.specs[2] = _spec(2, ipaddrs='10.0.9.9')
+        self.assertRaises(Exception, self.topology.os_create_ports,
+                          {}, [1, 2])
@@ -0,0 +1,68 @@
+import mock
+import testtools
+from terra import exception
+
+from container_expt.service import controllers
+from container_expt.service import core
+from container_expt.tests import fakes
+
+
+class ExptRevisionTestCase(testtools.TestCase):
+
+    def setUp(self):
+        super(ExptRevisionTestCase, self).setUp()
+        self.driver = fakes.FakeRevisionDriver(expt_ids=[1])
+        # skip the driver loading and dependency injection of __init__
+        self.manager = core.ExperimentManager.__new__(core.ExperimentManager)
+        self.manager.driver = self.driver
+        self.controller = controllers.Experiment.__new__(
+            controllers.Experiment)
+        self.controller.container_expt_api = self.manager
+
+    def _etag(self):
+        return self.controller._etag({}, 'detail', 1)
+
+    def test_unchanged_keeps_etag(self):
+        etag = self._etag()
+        self.assertEqual(etag, self._etag())
+
+    def test_terra_vm_change_gives_new_etag(self):
+        etag = self._etag()
+        self.driver.touch(1)
+        new_etag = self._etag()
+        self.assertNotEqual(etag, new_etag)
+        self.assertEqual(new_etag, self._etag())
+
+    def test_states_revision_follows_terra_changes(self):
+        states = self.manager.expt_states({}, 1)
+        self.assertEqual({10: ['active', 'none']}, states['devices'])
+        self.assertEqual(states, self.manager.expt_states({}, 1))
+        self.driver.touch(1)
+        self.assertEqual(states['revision'] + 1,
+                         self.manager.expt_states({}, 1)['revision'])
+
+    def test_missing_experiment_states(self):
+        self.assertIsNone(self.manager.expt_states({}, 2))
+
+    def test_missing_experiment_raises(self):
+        self.assertRaises(exception.ExperimentNotFound,
+                          self.manager.expt_revision, {}, 2)
+
+    def test_sync_starts_one_interval_back(self):
+        self.driver.revisions[1] = (1, self.driver.now)
+        self.driver.touch(1)
+        now = self.driver.now
+        with mock.patch.object(core.timeutils, 'utcnow', return_value=now):
+            self.assertEqual(1, self.manager.expt_sync_revisions({}, 60))
+        self.assertEqual(2, self.driver.expt_revision_get(1))
+        self.assertEqual(now,
+                         self.driver.sweep_mark_get(core.REVISION_SWEEP_MARK))
+
+    def test_sync_resumes_from_mark(self):
+        self.driver.touch(1)
+        self.driver.tick(120)
+        self.driver.sweep_mark_set(core.REVISION_SWEEP_MARK,
+                                   self.driver.now)
+        with mock.patch.object(core.timeutils, 'utcnow',
+                               return_value=self.driver.now):
+            self.assertEqual(0, self.manager.expt_sync_revisions({}, 60))